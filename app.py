@@ -1,13 +1,42 @@
 from flask import Flask, send_file, request
+import click
+import cProfile
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.cidfonts import UnicodeCIDFont
+from reportlab.pdfbase.ttfonts import TTFont
 import io
 import os
 import datetime
+import functools
+import gc
+import itertools
 import math
+import operator
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import fonts
+import assets
+import chart_wheel
+import rl_compat
+from assets import AssetRegistry
+from batch import iter_reports_zip
+from ephem_table import EphemerisTable, IngressIndex
+from gazetteer import DEFAULT_PATH as GAZETTEER_PATH, Gazetteer
+from jobs import JobQueue, JobStore
+from jp_wrap import LineCache, wrap_lines
+from page_fragments import PageFragmentCache
+from preview import ThumbnailRenderer
+from profiling import DEFAULT_DIR as PROFILE_DEFAULT_DIR, HEADER as PROFILE_HEADER, RequestProfiler
+from report_cache import ReportCache, make_cache_key
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsRegistry, read_rss_bytes
+from timing import NULL_TIMER, StageTimer, get_timing_logger, log_json
+from tzconv import local_to_utc
+from tally import check_required, is_tally_payload, load_field_labels, tally_to_args
 from astrology_texts import (
     SUN_PAIR_TEXTS,
     MOON_PAIR_TEXTS,
@@ -49,6 +78,60 @@ HAS_SWISSEPH = True
 # ------------------------------------------------------------------
 app = Flask(__name__, static_url_path="", static_folder="public")
 
+# ------------------------------------------------------------------
+# Prometheus 指标（/metrics）：gunicorn 各 worker 写各自的 mmap 文件，抓取时合算
+# METRICS=0 关闭；METRICS_DIR 默认在临时目录（同一台机器上多套部署时请分开指定）
+# ------------------------------------------------------------------
+METRICS = MetricsRegistry(
+    (os.environ.get("METRICS_DIR") or os.path.join(tempfile.gettempdir(), "astro_report_metrics"))
+    if os.environ.get("METRICS", "1") != "0" else None
+)
+
+HTTP_LATENCY = METRICS.histogram(
+    "astro_http_request_duration_seconds",
+    "Time spent in the request handler (body streaming excluded)",
+    ("route", "method", "status"),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RENDER_STAGE_LATENCY = METRICS.histogram(
+    "astro_report_render_stage_seconds",
+    "Time per report render stage (charts, each page, PDF serialization)",
+    ("stage",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+RENDER_LATENCY = METRICS.histogram(
+    "astro_report_render_seconds",
+    "Total time to render one report PDF",
+    buckets=(0.025, 0.05, 0.075, 0.1, 0.15, 0.25, 0.5, 1, 2.5),
+)
+PDF_SIZE = METRICS.histogram(
+    "astro_report_pdf_bytes",
+    "Size of rendered report PDFs",
+    buckets=(256e3, 512e3, 1e6, 1.25e6, 1.5e6, 2e6, 3e6, 5e6),
+)
+REPORT_REQUESTS = METRICS.counter(
+    "astro_report_requests",
+    "generate_report requests by outcome (hit / rendered / not_modified)",
+    ("outcome",),
+)
+SWE_CALLS = METRICS.counter(
+    "astro_swisseph_calls",
+    "Swiss Ephemeris calls",
+    ("function",),
+)
+SIMPLE_SIGNS_FALLBACKS = METRICS.counter(
+    "astro_simple_signs_fallbacks",
+    "Charts computed with the compute_simple_signs fallback",
+    ("reason",),
+)
+PROCESS_RSS = METRICS.gauge(
+    "astro_process_resident_memory_bytes",
+    "Resident memory per process",
+    mode="all",
+)
+CACHE_HITS = METRICS.gauge("astro_cache_hits", "Cache hits summed over live workers", ("cache",))
+CACHE_MISSES = METRICS.gauge("astro_cache_misses", "Cache misses summed over live workers", ("cache",))
+
 # ------------------------------------------------------------------
 # 占星符号数组 + lon → 星座函数
 # ------------------------------------------------------------------
@@ -98,46 +181,210 @@ def compute_simple_signs(birth_date, birth_time):
 
 
 # ------------------------------------------------------------------
-# 真实星盘：统一入口（瑞士星历）
+# 星历计算的记忆化层：同一时刻 × 同一地点只算一次
 # ------------------------------------------------------------------
-def compute_core_from_birth(dob_str, time_str, place_name):
+CORE_BODIES = (
+    ("sun", swe.SUN),
+    ("moon", swe.MOON),
+    ("venus", swe.VENUS),
+    ("mars", swe.MARS),
+)
+
+CHART_CACHE_SIZE = int(os.environ.get("CHART_CACHE_SIZE", 4096))
+
+# 预先计算好的黄经表（python -m ephem_table build 生成；没有时直接用 swisseph）
+EPHEMERIS_TABLE = EphemerisTable.load()
+
+# 各天体的换座时刻索引（同上由 build 生成）；只需要星座时用二分查找即可
+INGRESS_INDEX = IngressIndex.load()
+
+# 出生时刻离换座不到这个小时数，就视为「星座交界」
+CUSP_WINDOW_HOURS = float(os.environ.get("CUSP_WINDOW_HOURS", 1.0))
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+def _calc_chart_lons(jd_minute: int, lat: float, lon: float, bodies: tuple):
     """
-    使用 Swiss Ephemeris 计算
-    太阳 / 月亮 / 金星 / 火星 / ASC 的度数和星座名（日文）
+    jd_minute = 儒略日 × 1440（分単位の整数）
+    返回 (各行星黄经..., ASC) 的 tuple；出错时抛异常（异常不会被缓存）
     """
+    jd = jd_minute / 1440.0
+    if EPHEMERIS_TABLE is not None and bodies == CORE_BODIES and EPHEMERIS_TABLE.covers(jd):
+        lons = list(EPHEMERIS_TABLE.lons(jd))
+    else:
+        lons = [swe.calc_ut(jd, body_id)[0][0] for _, body_id in bodies]
+        SWE_CALLS.inc(len(bodies), function="calc_ut")
+    houses, ascmc = swe.houses(jd, lat, lon)
+    SWE_CALLS.inc(function="houses")
+    lons.append(ascmc[0])
+    return tuple(lons)
 
+
+def chart_cache_stats() -> dict:
+    info = _calc_chart_lons.cache_info()
+    total = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "maxsize": info.maxsize,
+        "currsize": info.currsize,
+        "hit_rate": (info.hits / total) if total else 0.0,
+    }
+
+
+# ------------------------------------------------------------------
+# 出生地 → 经纬度・时区（离线地名辞典；查不到就用东京）
+# ------------------------------------------------------------------
+GAZETTEER = Gazetteer.load(
+    GAZETTEER_PATH,
+    cache_size=int(os.environ.get("PLACE_CACHE_SIZE", 4096)),
+)
+DEFAULT_PLACE = GAZETTEER.lookup("東京都")
+
+
+def resolve_place(place_name):
+    """返回 (Place, 是否查到)"""
+    place = GAZETTEER.resolve((place_name or "").strip())
+    if place is None:
+        return DEFAULT_PLACE, False
+    return place, True
+
+
+def birth_julday(year, month, day, hh, mm, tz_name):
+    """
+    出生地的当地时间 → (儒略日 UT, tzconv.Conversion)
+    2/30 这类日期和 swisseph 一样顺延到下个月；实在换算不了就按 JST 固定 +9 小时（Conversion 为 None）
+    """
+    try:
+        try:
+            local_date = datetime.datetime(year, month, day)
+        except ValueError:
+            y, mo, d, _ = swe.revjul(swe.julday(year, month, day, 0.0))
+            local_date = datetime.datetime(y, mo, d)
+        local = local_date + datetime.timedelta(hours=hh, minutes=mm)
+        conv = local_to_utc(tz_name, local)
+    except (ValueError, OverflowError, KeyError):
+        return swe.julday(year, month, day, hh + mm / 60.0 - 9.0), None
+
+    utc = conv.utc
+    ut_hour = utc.hour + utc.minute / 60.0 + utc.second / 3600.0
+    return swe.julday(utc.year, utc.month, utc.day, ut_hour), conv
+
+
+@functools.lru_cache(maxsize=CHART_CACHE_SIZE)
+def _calc_asc(jd_minute: int, lat: float, lon: float) -> float:
+    """只要 ASC 时用（不算行星黄经）；_calc_chart_lons 的最后一项是同一个值"""
+    houses, ascmc = swe.houses(jd_minute / 1440.0, lat, lon)
+    SWE_CALLS.inc(function="houses")
+    return ascmc[0]
+
+
+def _birth_moment(dob_str, time_str, place_name):
+    """出生日・时间・地名 → (jd_minute, Place, 是否查到, tzconv.Conversion)；解析不了的用默认值"""
     # 1. 日期
     try:
         year, month, day = [int(x) for x in dob_str.split("-")]
     except Exception:
         year, month, day = 1990, 1, 1
 
-    # 2. 时间（日本本地时间 → UT）
+    # 2. 时间
     try:
         hh, mm = [int(x) for x in time_str.split(":")]
     except Exception:
         hh, mm = 12, 0
 
-    local_hour = hh + mm / 60.0      # JST
-    ut_hour = local_hour - 9.0       # UTC
+    # 3. 经纬度・时区（按出生地查地名辞典）
+    place, place_found = resolve_place(place_name)
+
+    # 4. 当地时间 → UT（按出生地时区的历史规则：含日本 1948〜51 年夏令时）→ 儒略日
+    jd, birth_conv = birth_julday(year, month, day, hh, mm, place.tz)
+    return round(jd * 1440), place, place_found, birth_conv
+
 
-    # 3. 经纬度（统一用东京）
-    lat = 35.6895
-    lon = 139.6917
+def _ingress_signs(jd: float):
+    """
+    ingress 索引（二分查找）→ {天体: (星座番号, 离最近换座的天数)}
+    索引没有或不覆盖这个时刻的天体不放进去
+    """
+    out = {}
+    if INGRESS_INDEX is None:
+        return out
+    for key, _ in CORE_BODIES:
+        if INGRESS_INDEX.covers(key, jd):
+            out[key] = (INGRESS_INDEX.sign_at(key, jd), INGRESS_INDEX.nearest_ingress_days(key, jd))
+    return out
+
+
+def _snap_to_sign(lon: float, sign: int) -> float:
+    """
+    查表插值在交界附近可能落到相邻星座（误差 ≤ ephem_table.TOLERANCE_DEG）
+    这时把黄经贴到 ingress 索引给出的星座的边上，让度数和星座一致
+    """
+    if int(lon // 30) % 12 == sign:
+        return lon
+    start = sign * 30.0
+    if (lon - start) % 360.0 < 180.0:
+        # 超过了这个星座的终点 → 终点前一点
+        return (start + 30.0 - 1e-6) % 360.0
+    return start
 
-    # 4. 儒略日（UT）
-    jd = swe.julday(year, month, day, ut_hour)
 
+def _cusp_bodies(ingress: dict) -> list:
+    return [key for key, (_, days) in ingress.items() if days * 24.0 < CUSP_WINDOW_HOURS]
+
+
+def compute_signs_from_birth(dob_str, time_str, place_name):
+    """
+    只要星座（不要度数）时用：Page4〜8 的文章选择・特征键・星座交界判定
+    4 颗行星用 ingress 索引二分查找，ASC 只算 swe.houses（不查黄经表、不调用 calc_ut）
+    返回的 core 只有 xxx_sign_jp / cusp_bodies（没有 lon / xxx_deg），星座和 compute_core_from_birth 一致
+    索引不覆盖这个时刻就直接用 compute_core_from_birth
+    """
+    jd_minute, place, _, _ = _birth_moment(dob_str, time_str, place_name)
+    ingress = _ingress_signs(jd_minute / 1440.0)
+    if len(ingress) < len(CORE_BODIES):
+        return compute_core_from_birth(dob_str, time_str, place_name)
     try:
-        # 5. 行星黄经
-        sun_lon = swe.calc_ut(jd, swe.SUN)[0]
-        moon_lon = swe.calc_ut(jd, swe.MOON)[0]
-        venus_lon = swe.calc_ut(jd, swe.VENUS)[0]
-        mars_lon = swe.calc_ut(jd, swe.MARS)[0]
+        asc_lon = _calc_asc(jd_minute, place.lat, place.lon)
+    except Exception:
+        return compute_core_from_birth(dob_str, time_str, place_name)
+
+    core = {
+        key: {"sign_jp": ZODIAC_SIGNS[sign], "ingress_days": days}
+        for key, (sign, days) in ingress.items()
+    }
+    core["asc"] = {"sign_jp": lon_to_sign(asc_lon)}
+    core["cusp_bodies"] = _cusp_bodies(ingress)
+    for key in ("sun", "moon", "venus", "mars", "asc"):
+        core[f"{key}_sign_jp"] = core[key]["sign_jp"]
+    return core
 
-        # 6. ASC（House 计算）
-        houses, ascmc = swe.houses(jd, lat, lon)
-        asc_lon = ascmc[0]
+
+# ------------------------------------------------------------------
+# 真实星盘：统一入口（瑞士星历）
+# ------------------------------------------------------------------
+def compute_core_from_birth(dob_str, time_str, place_name):
+    """
+    使用 Swiss Ephemeris 计算
+    太阳 / 月亮 / 金星 / 火星 / ASC 的度数和星座名（日文）
+    只要星座的地方用 compute_signs_from_birth
+    """
+    jd_minute, place, place_found, birth_conv = _birth_moment(dob_str, time_str, place_name)
+    lat = place.lat
+    lon = place.lon
+
+    try:
+        # 5. 行星黄经 + 6. ASC（记忆化：已经算过的星盘不再调用 swisseph）
+        sun_lon, moon_lon, venus_lon, mars_lon, asc_lon = _calc_chart_lons(
+            jd_minute, lat, lon, CORE_BODIES
+        )
+        lons = {"sun": sun_lon, "moon": moon_lon, "venus": venus_lon, "mars": mars_lon}
+
+        # 7. 星座以 ingress 索引为准（度数也贴过去，保持一致），并记下离最近换座的天数
+        ingress = _ingress_signs(jd_minute / 1440.0)
+        for key, (sign, _) in ingress.items():
+            lons[key] = _snap_to_sign(lons[key], sign)
+        sun_lon, moon_lon, venus_lon, mars_lon = (lons[k] for k, _ in CORE_BODIES)
 
         core = {
             "sun": {"lon": sun_lon, "sign_jp": lon_to_sign(sun_lon)},
@@ -146,6 +393,23 @@ def compute_core_from_birth(dob_str, time_str, place_name):
             "mars": {"lon": mars_lon, "sign_jp": lon_to_sign(mars_lon)},
             "asc": {"lon": asc_lon, "sign_jp": lon_to_sign(asc_lon)},
         }
+        for key, (_, days) in ingress.items():
+            core[key]["ingress_days"] = days
+        core["cusp_bodies"] = _cusp_bodies(ingress)
+
+        core["place"] = {
+            "name": place.name,
+            "lat": lat,
+            "lon": lon,
+            "tz": place.tz,
+            "resolved": place_found,
+        }
+        if birth_conv is not None:
+            core["birth_utc"] = {
+                "utc": birth_conv.utc.isoformat(),
+                "offset_hours": birth_conv.offset_seconds / 3600.0,
+                "status": birth_conv.status,   # ok / ambiguous / nonexistent
+            }
 
         # 扁平别名字段（兼容其他地方）
         core["sun_deg"] = sun_lon
@@ -160,8 +424,9 @@ def compute_core_from_birth(dob_str, time_str, place_name):
         core["mars_sign_jp"] = core["mars"]["sign_jp"]
         core["asc_sign_jp"] = core["asc"]["sign_jp"]
 
-    except Exception:
+    except Exception as e:
         # swisseph 出问题就用假算法兜底（只有星座，没有度数）
+        SIMPLE_SIGNS_FALLBACKS.inc(reason=type(e).__name__)
         fake = compute_simple_signs(dob_str, time_str)
         core = {
             "sun": {"lon": 0.0, "sign_jp": fake["sun"]},
@@ -171,6 +436,7 @@ def compute_core_from_birth(dob_str, time_str, place_name):
             "asc": {"lon": 0.0, "sign_jp": fake["asc"]},
         }
         core["sun_deg"] = core["moon_deg"] = core["venus_deg"] = core["mars_deg"] = core["asc_deg"] = 0.0
+        core["cusp_bodies"] = []
         core["sun_sign_jp"] = core["sun"]["sign_jp"]
         core["moon_sign_jp"] = core["moon"]["sign_jp"]
         core["venus_sign_jp"] = core["venus"]["sign_jp"]
@@ -197,23 +463,117 @@ PAGE_WIDTH, PAGE_HEIGHT = A4
 # ------------------------------------------------------------------
 # 字体设置
 # ------------------------------------------------------------------
-JP_SANS = "HeiseiKakuGo-W5"
+# 无衬线：嵌入 public/assets 的 Noto Sans JP（Regular / Bold，只嵌入用到的字）
+# 没有 fontTools 或 EMBED_FONTS=0 时退回不嵌入的 CID 字体（粗体也用同一个）
+# 衬线（正文）没有随附字体文件，仍用 CID 字体
 JP_SERIF = "HeiseiMin-W3"
-
-pdfmetrics.registerFont(UnicodeCIDFont(JP_SANS))
 pdfmetrics.registerFont(UnicodeCIDFont(JP_SERIF))
 
-# ★ 新增这一行，让 JP_SANS_BOLD 指向同一个字体（看起来就当作粗体用）
-JP_SANS_BOLD = JP_SANS
+EMBED_FONTS = os.environ.get("EMBED_FONTS", "1") != "0" and fonts.embedding_available()
+FONT_CACHE_DIR = os.environ.get("FONT_CACHE_DIR") or fonts.DEFAULT_CACHE_DIR
+
+# Noto 里没有的字（髙・﨑 等）用这个 CID 字体写
+JP_SANS_FALLBACK = "HeiseiKakuGo-W5"
+pdfmetrics.registerFont(UnicodeCIDFont(JP_SANS_FALLBACK))
+
+if EMBED_FONTS:
+    JP_SANS = "NotoSansJP-Regular"
+    JP_SANS_BOLD = "NotoSansJP-Bold"
+else:
+    JP_SANS = JP_SANS_FALLBACK
+    JP_SANS_BOLD = JP_SANS
+
+# 无衬线体写的固定文字（页码・作成日・第 8 页表头）：每个文档都分配同样的编码，
+# 这部分子集只生成一次；名字等其余的字按文档增量生成
+SANS_CORPUS = {
+    "regular": "0123456789 作成日：年月さん＆",
+    "bold": "ふたりのシーンうまくいくコツ",
+}
+
+_report_fonts = {}
+_report_fonts_lock = threading.Lock()
+
+
+def ensure_report_fonts():
+    """第一次用到时才转换 / 读入字体文件（preload 时在 master 的 warmup 里完成）"""
+    if _report_fonts or not EMBED_FONTS:
+        return
+    with _report_fonts_lock:
+        if _report_fonts:
+            return
+        loaded = {}
+        for face, font_name in (("regular", JP_SANS), ("bold", JP_SANS_BOLD)):
+            font = fonts.load_face(face, font_name, SANS_CORPUS[face], cache_dir=FONT_CACHE_DIR)
+            pdfmetrics.registerFont(font)
+            loaded[face] = font
+        _report_fonts.update(loaded)
+
+
+def sans_font_for(text: str, font_name: str = None) -> str:
+    """含有嵌入字体里没有的字（用户名字）时，整行改用 CID 字体"""
+    font_name = font_name or JP_SANS
+    font = pdfmetrics.getFont(font_name)
+    if not isinstance(font, TTFont):
+        return font_name
+    char_to_glyph = font.face.charToGlyph
+    if all(ord(ch) in char_to_glyph for ch in text):
+        return font_name
+    return JP_SANS_FALLBACK
+
+
+def report_font_stats() -> dict:
+    return {
+        "embedded": EMBED_FONTS,
+        "faces": {
+            face: font.stats() if isinstance(font, fonts.CorpusTTFont) else {"font": font.fontName}
+            for face, font in _report_fonts.items()
+        },
+        "reportlab": rl_compat.status(),
+    }
+
+
+# ------------------------------------------------------------------
+# 图片资源：启动时一次性读入（每个 worker 只解码一次）
+# 有 python -m assets build 的 manifest 就用按打印 DPI 重新编码好的流（ASSET_COMPILED=0 关闭）
+# ------------------------------------------------------------------
+ASSET_MANIFEST = os.environ.get("ASSET_MANIFEST") or os.path.join(
+    ASSETS_DIR, assets.DEFAULT_COMPILED_DIR, assets.MANIFEST_NAME
+)
+ASSETS = AssetRegistry(
+    ASSETS_DIR,
+    manifest_path=ASSET_MANIFEST if os.environ.get("ASSET_COMPILED", "1") != "0" else None,
+).preload()
+
+# 星盘：用 PDF 路径画的矢量星盘（chart_wheel.py，Form 在进程内只组装一次）
+# VECTOR_CHART=0 或没有 fontTools 时退回 chart_base.png + PNG 图标
+VECTOR_CHART = os.environ.get("VECTOR_CHART", "1") != "0" and chart_wheel.available(ASSETS_DIR)
+CHART_FORMS = chart_wheel.ChartForms(ASSETS_DIR) if VECTOR_CHART else None
+
+# 各页的静态背景层：启动时预先序列化，请求时只需盖章
+PAGE_BG_FILES = (
+    "cover.jpg",
+    "index.jpg",
+    "page_basic.jpg",
+    "page_communication.jpg",
+    "page_points.jpg",
+    "page_trend.jpg",
+    "page_advice.jpg",
+    "page_summary.jpg",
+)
+PAGE_TEMPLATES = {
+    name: ASSETS.page_template(name, PAGE_WIDTH, PAGE_HEIGHT)
+    for name in PAGE_BG_FILES
+}
 
 
 # ------------------------------------------------------------------
 # 小工具：铺满整页背景
 # ------------------------------------------------------------------
 def draw_full_bg(c, filename):
-    path = os.path.join(ASSETS_DIR, filename)
-    img = ImageReader(path)
-    c.drawImage(img, 0, 0, width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    tpl = PAGE_TEMPLATES.get(filename)
+    if tpl is None:
+        tpl = ASSETS.page_template(filename, PAGE_WIDTH, PAGE_HEIGHT)
+    tpl.stamp(c)
 
 
 # ------------------------------------------------------------------
@@ -241,7 +601,7 @@ def polar_to_xy(cx, cy, radius, angle_deg):
 
 
 # ------------------------------------------------------------------
-# 小工具：在星盘上画「彩色点 + PNG 图标」
+# 小工具：在星盘上画「彩色点 + 行星符号」（矢量 Form；关闭时用 PNG 图标）
 # ------------------------------------------------------------------
 def draw_planet_icon(
     c,
@@ -250,56 +610,70 @@ def draw_planet_icon(
     chart_size,
     angle_deg,
     color_rgb,
-    icon_filename,
+    planet,
 ):
-    r_dot = chart_size * 0.34
-    r_icon = chart_size * 0.28
-
-    px, py = polar_to_xy(cx, cy, r_dot, angle_deg)
+    (px, py), (ix, iy) = planet_icon_points(cx, cy, chart_size, angle_deg)
     r, g, b = color_rgb
     c.setFillColorRGB(r, g, b)
-    c.circle(px, py, 2.3, fill=1, stroke=0)
+    c.circle(px, py, PLANET_DOT_RADIUS, fill=1, stroke=0)
+
+    icon_size = PLANET_ICON_SIZE
 
-    ix, iy = polar_to_xy(cx, cy, r_icon, angle_deg)
-    icon_path = os.path.join(ASSETS_DIR, icon_filename)
-    icon_img = ImageReader(icon_path)
-    icon_size = 11
+    if CHART_FORMS is not None:
+        CHART_FORMS.draw_planet(c, planet, ix, iy, icon_size)
+        return
 
-    c.drawImage(
-        icon_img,
+    ASSETS.draw_image(
+        c,
+        PLANET_ICON_FILES[planet],
         ix - icon_size / 2,
         iy - icon_size / 2,
-        width=icon_size,
-        height=icon_size,
+        icon_size,
+        icon_size,
         mask="auto",
     )
 
 
+def draw_chart_base(c, x, y, chart_size):
+    """星盘底图（左下角 (x, y)）"""
+    if CHART_FORMS is not None:
+        CHART_FORMS.draw_wheel(c, x, y, chart_size)
+        return
+    ASSETS.draw_image(c, "chart_base.png", x, y, chart_size, chart_size, mask="auto")
+
+
+PLANET_DOT_RADIUS = 2.3
+PLANET_ICON_SIZE = 11
+PLANET_ICON_FILES = {
+    "sun": "icon_sun.png",
+    "moon": "icon_moon.png",
+    "venus": "icon_venus.png",
+    "mars": "icon_mars.png",
+    "asc": "icon_asc.png",
+}
+
+
+def planet_icon_points(cx, cy, chart_size, angle_deg):
+    """星盤上の（彩色点の中心, アイコンの中心）。プレビューも同じ位置に描く"""
+    return (
+        polar_to_xy(cx, cy, chart_size * 0.34, angle_deg),
+        polar_to_xy(cx, cy, chart_size * 0.28, angle_deg),
+    )
+
+
 # ------------------------------------------------------------------
 # 小工具：文本自动换行
 # ------------------------------------------------------------------
+# 折り返し結果のキャッシュ（起動時に warm_line_cache() でコーパス分を計算）
+LINE_CACHE = LineCache()
+
+
 def draw_wrapped_block(c, text, x, y_start, wrap_width,
-                       font_name, font_size, line_height):
+                       font_name, font_size, line_height, kinsoku=False):
     c.setFont(font_name, font_size)
-    line = ""
     y = y_start
 
-    for ch in text:
-        if ch == "\n":
-            c.drawString(x, y, line)
-            line = ""
-            y -= line_height
-            continue
-
-        new_line = line + ch
-        if pdfmetrics.stringWidth(new_line, font_name, font_size) <= wrap_width:
-            line = new_line
-        else:
-            c.drawString(x, y, line)
-            line = ch
-            y -= line_height
-
-    if line:
+    for line in wrap_lines(text, wrap_width, font_name, font_size, kinsoku=kinsoku):
         c.drawString(x, y, line)
         y -= line_height
 
@@ -384,34 +758,20 @@ def draw_wrapped_block_limited(
     font_size,
     line_height,
     max_lines,
+    cache=True,
+    kinsoku=False,
 ):
+    """
+    cache=False：ユーザー名を含みうるブロック用（キャッシュは引くが、新しくは登録しない）
+    kinsoku=True：禁則処理をする（既定は従来どおりの改行位置）
+    """
     c.setFont(font_name, font_size)
-    line = ""
     y = y_start
-    lines = 0
 
-    for ch in text:
-        if ch == "\n":
-            c.drawString(x, y, line)
-            line = ""
-            y -= line_height
-            lines += 1
-            if lines >= max_lines:
-                return y
-            continue
-
-        new_line = line + ch
-        if pdfmetrics.stringWidth(new_line, font_name, font_size) <= wrap_width:
-            line = new_line
-        else:
-            c.drawString(x, y, line)
-            line = ch
-            y -= line_height
-            lines += 1
-            if lines >= max_lines:
-                return y
-
-    if line and lines < max_lines:
+    lines = LINE_CACHE.lines(
+        text, wrap_width, font_name, font_size, max_lines, store=cache, kinsoku=kinsoku
+    )
+    for line in lines:
         c.drawString(x, y, line)
         y -= line_height
 
@@ -674,10 +1034,6 @@ def draw_page3_basic_and_synastry(
     # 背景
     draw_full_bg(c, "page_basic.jpg")
 
-    # 星盤ベース画像
-    chart_path = os.path.join(ASSETS_DIR, "chart_base.png")
-    chart_img = ImageReader(chart_path)
-
     chart_size = 180
     left_x = 90
     left_y = 520
@@ -689,36 +1045,14 @@ def draw_page3_basic_and_synastry(
     right_cx = right_x + chart_size / 2
     right_cy = right_y + chart_size / 2
 
-    # 左右の星盤
-    c.drawImage(
-        chart_img,
-        left_x,
-        left_y,
-        width=chart_size,
-        height=chart_size,
-        mask="auto",
-    )
-    c.drawImage(
-        chart_img,
-        right_x,
-        right_y,
-        width=chart_size,
-        height=chart_size,
-        mask="auto",
-    )
+    # 左右の星盤（ベース）
+    draw_chart_base(c, left_x, left_y, chart_size)
+    draw_chart_base(c, right_x, right_y, chart_size)
 
     # 惑星度数・ラベル
     your_planets = build_planet_block(your_core)
     partner_planets = build_planet_block(partner_core)
 
-    icon_files = {
-        "sun": "icon_sun.png",
-        "moon": "icon_moon.png",
-        "venus": "icon_venus.png",
-        "mars": "icon_mars.png",
-        "asc": "icon_asc.png",
-    }
-
     your_color = (0.15, 0.45, 0.9)
     partner_color = (0.9, 0.35, 0.65)
 
@@ -731,7 +1065,7 @@ def draw_page3_basic_and_synastry(
             chart_size,
             info["deg"],
             your_color,
-            icon_files[key],
+            key,
         )
 
     for key, info in partner_planets.items():
@@ -742,7 +1076,7 @@ def draw_page3_basic_and_synastry(
             chart_size,
             info["deg"],
             partner_color,
-            icon_files[key],
+            key,
         )
 
     # 名前
@@ -1530,7 +1864,7 @@ def draw_page5_points(
     # ① 良い点ブロック
     y1 = 625
     y1 = draw_wrapped_block_limited(
-        c, good_text_box, x, y1, w, font, size, lh, max_lines=6
+        c, good_text_box, x, y1, w, font, size, lh, max_lines=6, cache=False
     )
     y1 -= lh
     draw_wrapped_block_limited(
@@ -1623,6 +1957,31 @@ def draw_page6_support(
 
 
 
+def page6_layout_texts(page6_texts):
+    """build_page6_texts の戻り値 → draw_page6_support の引数（新レイアウト用のマッピング）"""
+    (
+        theme_text, theme_summary,
+        emotion_text, emotion_summary,
+        style_text, style_summary,
+        future_text, future_summary,
+    ) = page6_texts
+
+    # ① 行動タイプ / エネルギーの方向性 → 旧：テーマ部分
+    type_text = theme_text
+    type_summary = theme_summary
+
+    # ② 支え方・安心感 → 旧：感情＋スタイル部分をまとめて本文にする
+    care_text = emotion_text + " " + style_text
+    care_summary = emotion_summary  # サマリーはまず感情側だけ使う
+
+    # ③ これからの伸ばし方・成長ポイント → 旧：future をそのまま使う
+    return (
+        type_text, type_summary,
+        care_text, care_summary,
+        future_text, future_summary,
+    )
+
+
 # ------------------------------------------------------------------
 # Page7：日常アドバイス
 # ------------------------------------------------------------------
@@ -1688,6 +2047,7 @@ def draw_page7_advice(c, advice_rows, footer_text):
         )
 
         # 右：うまくいくコツ（7行まで・既存仕様のまま）
+        #   最後の行には名前が入るので、キャッシュは引くだけにする
         ty = draw_wrapped_block_limited(
             c,
             tip_text,
@@ -1698,6 +2058,7 @@ def draw_page7_advice(c, advice_rows, footer_text):
             body_size,
             lh,
             max_lines=7,
+            cache=False,
         )
 
         bottom = min(sy, ty)
@@ -1719,6 +2080,7 @@ def draw_page7_advice(c, advice_rows, footer_text):
         body_size,
         lh,
         max_lines=9,
+        cache=False,
     )
 
     draw_page_number(c, 7)
@@ -1752,12 +2114,342 @@ def draw_page8_summary(c, summary_text):
         font_size,
         line_height,
         max_lines=22,   # 上半分に収まる程度
+        cache=False,    # 名前入り
     )
 
     draw_page_number(c, 8)
     c.showPage()
 
 
+# ==============================================================
+#          折り返しキャッシュの事前計算（起動時に1回）
+# ==============================================================
+
+# 各元素の代表星座（ページ用テキストは元素 / ASC グループしか見ない）
+_ELEMENT_SAMPLE_SIGNS = ("牡羊座", "牡牛座", "双子座", "蟹座")
+
+# 名前の代わりに入れる目印。これを含む文字列は名前入りなのでキャッシュしない
+_NAME_MARK = "\x00"
+
+
+def _sample_core(**signs) -> dict:
+    core = {}
+    for key in ("sun", "moon", "venus", "mars", "asc"):
+        sign = signs.get(key, "牡羊座")
+        core[key] = {"lon": 0.0, "sign_jp": sign}
+        core[f"{key}_sign_jp"] = sign
+    return core
+
+
+def _iter_sample_pairs(keys):
+    """keys に挙げた天体だけ 4 元素を総当たりした (your_core, partner_core)"""
+    for mine in itertools.product(_ELEMENT_SAMPLE_SIGNS, repeat=len(keys)):
+        your_core = _sample_core(**dict(zip(keys, mine)))
+        for theirs in itertools.product(_ELEMENT_SAMPLE_SIGNS, repeat=len(keys)):
+            yield your_core, _sample_core(**dict(zip(keys, theirs)))
+
+
+def warm_line_cache():
+    """
+    Page3〜7 の名前を含まない本文を、描画と同じボックス設定で折り返しておく
+    ※ボックス設定は draw_page3〜7 と同じ値。ずれてもキャッシュが外れるだけで表示は変わらない
+    """
+    names = (_NAME_MARK + "A", _NAME_MARK + "B")
+
+    def collect(builder, keys):
+        found = set()
+        for your_core, partner_core in _iter_sample_pairs(keys):
+            out = builder(*names, your_core, partner_core)
+            found.update(out)
+        return {t for t in found if isinstance(t, str) and _NAME_MARK not in t}
+
+    def trimmed(texts, max_lines, chars_per_line):
+        return {trim_text_for_box(t, max_lines=max_lines, chars_per_line=chars_per_line)
+                for t in texts}
+
+    # Page3：相性 / 太陽 / 月 / ASC（400pt・12pt・3行）
+    p3 = collect(build_page3_texts, ("sun", "moon", "asc"))
+    LINE_CACHE.warm(p3, 400, JP_SERIF, 12, 3)
+
+    # Page4：本文 8行（24字で裁断）/ サマリ 2行
+    p4 = collect(build_page4_texts, ("sun", "moon", "venus"))
+    LINE_CACHE.warm(trimmed(p4, 8, 24), 400, JP_SERIF, 12, 8)
+    LINE_CACHE.warm(p4, 400, JP_SERIF, 12, 2)
+
+    # Page5 / Page6：本文 6行（22字で裁断）/ サマリ 2行（360pt）
+    p5 = collect(build_page5_texts, ("mars",))
+    p6 = collect(build_page6_texts, ("sun", "venus"))
+    # Page6 の②は感情＋スタイルをつなげて描く（generate 側のマッピングと同じ）
+    p6_care = set()
+    for your_core, partner_core in _iter_sample_pairs(("sun", "venus")):
+        _, _, emotion_text, _, style_text, _, _, _ = build_page6_texts(
+            *names, your_core, partner_core
+        )
+        p6_care.add(emotion_text + " " + style_text)
+    p56 = p5 | p6 | p6_care
+    LINE_CACHE.warm(trimmed(p56, 6, 22), 360, JP_SERIF, 12, 6)
+    LINE_CACHE.warm(p56, 360, JP_SERIF, 12, 2)
+
+    # Page7：左欄（140pt・2行）/ 右欄（200pt・7行、22字で裁断）
+    #   右欄はテーマ / 課題 / キーワードの各辞書の文章がそのまま入る
+    scenes = set()
+    for your_core, partner_core in _iter_sample_pairs(("sun",)):
+        rows, _ = build_page7_texts(*names, your_core, partner_core)
+        scenes.update(scene for scene, _ in rows)
+    tips = (
+        set(RELATION_THEME_TEXTS.values())
+        | set(RELATION_CHALLENGE_TEXTS.values())
+        | set(RELATION_KEYWORD_TEXTS.values())
+    )
+    LINE_CACHE.warm(scenes, 140, JP_SERIF, 11, 2)
+    LINE_CACHE.warm(trimmed(tips, 6, 22), 200, JP_SERIF, 11, 7)
+
+
+warm_line_cache()
+
+
+# ==============================================================
+#      テキスト選択インデックス（起動時に選択パターンを全列挙）
+# ==============================================================
+# Page3〜8 の文章は、各人の「太陽・月・金星・火星の元素 + ASC グループ」と名前だけで決まる。
+# ページごとに参照する特徴だけをキーにして、名前は目印のまま表に入れておき、
+# リクエスト時は表を引いて名前を差し込むだけにする。
+
+_ELEMENTS = ("fire", "earth", "air", "water")
+_ASC_GROUPS = ("extro", "stable", "soft")
+_ELEMENT_SIGN = dict(zip(_ELEMENTS, _ELEMENT_SAMPLE_SIGNS))
+_ASC_GROUP_SIGN = {"extro": "牡羊座", "stable": "牡牛座", "soft": "蟹座"}
+_ASC_GROUP_OF_ELEMENT = {"fire": "extro", "air": "extro", "earth": "stable", "water": "soft"}
+_MARS_SPEED = {"fire": "fast", "air": "fast", "earth": "slow", "water": "slow"}
+
+# 特徴 tuple の並び（0〜3 は元素、4 は ASC グループ）
+_FEATURE_DOMAINS = (_ELEMENTS, _ELEMENTS, _ELEMENTS, _ELEMENTS, _ASC_GROUPS)
+_DEFAULT_FEATURES = ("fire", "fire", "fire", "fire", "extro")
+
+_TEXT_NAME_A = _NAME_MARK + "A"
+_TEXT_NAME_B = _NAME_MARK + "B"
+
+
+def person_features(core: dict):
+    """core → (太陽, 月, 金星, 火星 の元素, ASC グループ)。正規の星座名でない場合は None"""
+    out = []
+    for key in ("sun", "moon", "venus", "mars", "asc"):
+        el = SIGN_ELEMENT.get(core.get(f"{key}_sign_jp"))
+        if el is None:
+            return None
+        out.append(el)
+    out[4] = _ASC_GROUP_OF_ELEMENT[out[4]]
+    return tuple(out)
+
+
+def _features_core(features) -> dict:
+    sun, moon, venus, mars, asc_group = features
+    return _sample_core(
+        sun=_ELEMENT_SIGN[sun],
+        moon=_ELEMENT_SIGN[moon],
+        venus=_ELEMENT_SIGN[venus],
+        mars=_ELEMENT_SIGN[mars],
+        asc=_ASC_GROUP_SIGN[asc_group],
+    )
+
+
+def _projection(*idx):
+    """ページが参照する特徴だけを取り出すキー関数 + その全組み合わせ"""
+
+    get = operator.itemgetter(*idx)
+
+    def key(yf, pf):
+        return get(yf), get(pf)
+
+    def samples():
+        domains = [_FEATURE_DOMAINS[i] for i in idx]
+        for mine in itertools.product(*domains):
+            for theirs in itertools.product(*domains):
+                yf = list(_DEFAULT_FEATURES)
+                pf = list(_DEFAULT_FEATURES)
+                for i, a, b in zip(idx, mine, theirs):
+                    yf[i] = a
+                    pf[i] = b
+                yield tuple(yf), tuple(pf)
+
+    return key, samples
+
+
+def _page7_key(yf, pf):
+    """Page7 は全天体を見るが、使うのは太陽の元素・火星の速さ・月/金星/ASC の一致だけ"""
+    return (
+        yf[0], pf[0],
+        _MARS_SPEED[yf[3]], _MARS_SPEED[pf[3]],
+        yf[1] != pf[1], yf[2] != pf[2], yf[4] != pf[4],
+    )
+
+
+def _page7_samples():
+    speed_el = {"fast": "fire", "slow": "earth"}
+    for ys, ps in itertools.product(_ELEMENTS, repeat=2):
+        for ym, pm in itertools.product(("fast", "slow"), repeat=2):
+            for moon_d, venus_d, asc_d in itertools.product((False, True), repeat=3):
+                yf = (ys, "fire", "fire", speed_el[ym], "extro")
+                pf = (
+                    ps,
+                    "earth" if moon_d else "fire",
+                    "earth" if venus_d else "fire",
+                    speed_el[pm],
+                    "stable" if asc_d else "extro",
+                )
+                yield yf, pf
+
+
+# ページ番号 → (builder, キー関数, 全組み合わせの列挙)
+TEXT_INDEX_PAGES = {
+    3: (build_page3_texts, *_projection(0, 1, 4)),
+    4: (build_page4_texts, *_projection(0, 1, 2)),
+    5: (build_page5_texts, *_projection(3)),
+    6: (build_page6_texts, *_projection(0, 2)),
+    7: (build_page7_texts, _page7_key, _page7_samples),
+    8: (build_page8_texts, *_projection(0)),
+}
+
+
+def build_text_index() -> dict:
+    index = {}
+    for page, (builder, key_fn, samples) in TEXT_INDEX_PAGES.items():
+        table = {}
+        for yf, pf in samples():
+            key = key_fn(yf, pf)
+            if key not in table:
+                entry = builder(
+                    _TEXT_NAME_A, _TEXT_NAME_B, _features_core(yf), _features_core(pf)
+                )
+                # 名前の目印を含むかどうかも一緒に持っておく（含まなければ置換不要）
+                table[key] = (entry, _has_name_mark(entry))
+        index[page] = table
+    return index
+
+
+def _has_name_mark(obj) -> bool:
+    if isinstance(obj, str):
+        return _NAME_MARK in obj
+    if isinstance(obj, (tuple, list)):
+        return any(_has_name_mark(v) for v in obj)
+    return False
+
+
+def _fill_names(obj, your_name: str, partner_name: str):
+    """表の中の名前の目印を実際の名前に置き換える（str / tuple / list を再帰的に）"""
+    if isinstance(obj, str):
+        if _NAME_MARK in obj:
+            return obj.replace(_TEXT_NAME_A, your_name).replace(_TEXT_NAME_B, partner_name)
+        return obj
+    if isinstance(obj, tuple):
+        return tuple(_fill_names(v, your_name, partner_name) for v in obj)
+    if isinstance(obj, list):
+        return [_fill_names(v, your_name, partner_name) for v in obj]
+    return obj
+
+
+TEXT_INDEX = build_text_index()
+
+
+# ------------------------------------------------------------------
+# 名前の入らないページ（4・6）は描画結果そのものを特徴キーでキャッシュする
+# ※ 5（good_text）と 7（最後のコツ・まとめ）は名前が入るので毎回描く
+# ------------------------------------------------------------------
+FRAGMENT_PAGES = (4, 6)
+
+PAGE_FRAGMENTS = PageFragmentCache(
+    ASSETS,
+    max_entries=int(os.environ.get("PAGE_FRAGMENT_CACHE_SIZE", 2048)),
+)
+
+
+def page_fragment_keys(your_core, partner_core, pages=FRAGMENT_PAGES) -> dict:
+    """{ページ番号: (ページ番号, 特徴キー)}。表にない core なら空（＝毎回描く）"""
+    yf = person_features(your_core)
+    pf = person_features(partner_core)
+    if yf is None or pf is None:
+        return {}
+    return {
+        page: (page, TEXT_INDEX_PAGES[page][1](yf, pf))
+        for page in pages
+    }
+
+
+def select_report_texts(your_name, partner_name, your_core, partner_core) -> dict:
+    """
+    Page3〜8 のテキストをまとめて返す {ページ番号: build_pageN_texts と同じ戻り値}
+    正規の星座名でない core（表にないパターン）は従来の builder で作る
+    """
+    yf = person_features(your_core)
+    pf = person_features(partner_core)
+    # 名前に目印の文字が入っていると置換が壊れるので除いておく
+    your_name = your_name.replace(_NAME_MARK, "")
+    partner_name = partner_name.replace(_NAME_MARK, "")
+
+    texts = {}
+    for page, (builder, key_fn, _) in TEXT_INDEX_PAGES.items():
+        found = None
+        if yf is not None and pf is not None:
+            found = TEXT_INDEX[page].get(key_fn(yf, pf))
+        if found is None:
+            texts[page] = builder(your_name, partner_name, your_core, partner_core)
+            continue
+        entry, has_names = found
+        if has_names:
+            texts[page] = _fill_names(entry, your_name, partner_name)
+        else:
+            texts[page] = entry
+    return texts
+
+
+@app.cli.command("check-text-index")
+@click.option("--sample", type=int, default=0,
+              help="check N random combinations instead of all of them")
+def check_text_index(sample):
+    """TEXT_INDEX が全組み合わせで build_page3〜8_texts と一致するか確認する"""
+    people = list(itertools.product(*_FEATURE_DOMAINS))
+    pairs = itertools.product(people, repeat=2)
+    total = len(people) ** 2
+    if sample:
+        rng = random.Random(0)
+        pairs = [(rng.choice(people), rng.choice(people)) for _ in range(sample)]
+        total = sample
+
+    # 表は代表星座で作っているので、確認は同じ元素の別の星座も混ぜて行う
+    signs_of = {el: [s for s, e in SIGN_ELEMENT.items() if e == el] for el in _ELEMENTS}
+    asc_signs_of = {
+        g: [s for s, e in SIGN_ELEMENT.items() if _ASC_GROUP_OF_ELEMENT[e] == g]
+        for g in _ASC_GROUPS
+    }
+    sign_rng = random.Random(1)
+
+    def random_core(features):
+        sun, moon, venus, mars, asc_group = features
+        return _sample_core(
+            sun=sign_rng.choice(signs_of[sun]),
+            moon=sign_rng.choice(signs_of[moon]),
+            venus=sign_rng.choice(signs_of[venus]),
+            mars=sign_rng.choice(signs_of[mars]),
+            asc=sign_rng.choice(asc_signs_of[asc_group]),
+        )
+
+    names = ("太郎", "花子")
+    mismatches = 0
+    for yf, pf in pairs:
+        your_core = random_core(yf)
+        partner_core = random_core(pf)
+        got = select_report_texts(*names, your_core, partner_core)
+        for page, (builder, _, _) in TEXT_INDEX_PAGES.items():
+            if got[page] != builder(*names, your_core, partner_core):
+                mismatches += 1
+                if mismatches <= 10:
+                    click.echo(f"mismatch: page {page} {yf} {pf}")
+    click.echo(f"checked {total} combinations x {len(TEXT_INDEX_PAGES)} pages: "
+               f"{mismatches} mismatches")
+    if mismatches:
+        raise SystemExit(1)
+
+
 # ============================================================
 # 出生時間の文字（例: "08:00〜09:00"）を HH:MM に変換する小関数
 # ============================================================
@@ -1776,76 +2468,240 @@ def normalize_time_label(v: str) -> str:
     return v
 
 
+# ============================================================
+# 生年月日・出生時間の正規化（キャッシュキーと描画で同じ値を使う）
+# ============================================================
+def normalize_dob(v: str) -> str:
+    """'1990-5-1' → '1990-05-01'。読めない場合は既定値（計算側と同じ 1990-01-01）"""
+    try:
+        y, m, d = [int(x) for x in v.strip().split("-")]
+    except Exception:
+        return "1990-01-01"
+    return f"{y:04d}-{m:02d}-{d:02d}"
+
+
+def normalize_time(v: str) -> tuple:
+    """
+    HH:MM / HH:MM:SS → (分単位に丸めた HH:MM, 繰り上がった日数)
+    範囲外（25:00・12:60 など）や読めない場合は 12:00。23:59:30 は (00:00, 1)
+    """
+    try:
+        parts = [int(x) for x in v.strip().split(":")]
+        hh, mm = parts[0], parts[1]
+        ss = parts[2] if len(parts) > 2 else 0
+    except Exception:
+        return "12:00", 0
+    if len(parts) > 3 or not (0 <= hh <= 23 and 0 <= mm <= 59 and 0 <= ss <= 59):
+        return "12:00", 0
+    total = hh * 60 + mm + (1 if ss >= 30 else 0)
+    days, total = divmod(total, 24 * 60)
+    return f"{total // 60:02d}:{total % 60:02d}", days
+
+
+def normalize_birth(dob: str, time_value: str) -> tuple:
+    """(生年月日, 出生時間) をまとめて正規化する（秒の丸めで日付が変わる分は日付に繰り上げる）"""
+    dob = normalize_dob(dob)
+    time_value, days = normalize_time(time_value)
+    if days:
+        try:
+            d = datetime.date.fromisoformat(dob) + datetime.timedelta(days=days)
+        except ValueError:
+            return dob, "23:59"     # 実在しない日付は繰り上げられないので、その日の最後に留める
+        dob = d.isoformat()
+    return dob, time_value
+
+
 # ==============================================================
 #                    生成 PDF 主入口
 # ==============================================================
 
-@app.route("/api/generate_report", methods=["GET", "POST"])
-def generate_report():
+# 描画ロジックを変えたらここを上げる（キャッシュ・ETag が切り替わる）
+REPORT_VERSION = "4"
+
+REPORT_CACHE = ReportCache(
+    max_items=int(os.environ.get("REPORT_CACHE_SIZE", 64)),
+    max_bytes=int(os.environ.get("REPORT_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+    disk_dir=os.environ.get("REPORT_CACHE_DIR") or None,
+    disk_max_bytes=int(os.environ.get("REPORT_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024)),
+)
+
+# 生成した PDF の書き出し先
+#   memfd : 名前のないメモリファイル（Linux）。fd があるので gunicorn が sendfile で返せる
+#   file  : 一時ファイル（memfd が使えない環境でも sendfile 可）
+#   memory: 従来どおり BytesIO
+# memfd / file のときはレポートキャッシュのメモリ層もこのファイルをそのまま持つ（bytes に読み直さない）
+# → キャッシュ命中も開き直した fd を返すので sendfile のまま。memory のときだけ BytesIO で返る
+REPORT_SPOOL = os.environ.get("REPORT_SPOOL", "memfd")
+
+
+def open_report_spool():
+    """PDF 1 件ぶんの書き出し先（読み書き可・先頭位置）を作る"""
+    if REPORT_SPOOL == "memory":
+        return io.BytesIO()
+    if REPORT_SPOOL == "memfd" and hasattr(os, "memfd_create"):
+        fd = os.memfd_create("report.pdf", os.MFD_CLOEXEC)
+        return open(fd, "w+b")
+    return tempfile.TemporaryFile(suffix=".pdf")
 
-    # ---- 1. 读取参数 ----
+
+class _ClosingFile:
+    """
+    close() されたらコールバックも呼ぶファイルのプロキシ（read / fileno などはそのまま委譲）
+    send_file の応答は direct_passthrough なので、WSGI サーバーが close するのは
+    ファイルだけで、Response.call_on_close に登録した処理が呼ばれない。その橋渡し用
+    """
+
+    def __init__(self, f):
+        self._f = f
+        self.callbacks = []
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def close(self):
+        callbacks, self.callbacks = self.callbacks, []
+        try:
+            self._f.close()
+        finally:
+            for cb in callbacks:
+                cb()
+
+
+def send_report_file(f, filename: str, etag: str):
+    """
+    PDF のファイルオブジェクトをそのまま返す（wsgi.file_wrapper 経由 → sendfile）
+    send_file はファイルオブジェクトだと長さが分からず Range も効かないので、
+    長さはここで測って、条件付きリクエストの処理も自分で呼ぶ
+    """
+    size = f.seek(0, io.SEEK_END)
+    f.seek(0)
+    body = _ClosingFile(f)
+    resp = send_file(
+        body,
+        as_attachment=True,
+        download_name=filename,
+        mimetype="application/pdf",
+        etag=etag,
+        conditional=False,
+    )
+    resp.content_length = size
+    resp = resp.make_conditional(request, accept_ranges=True, complete_length=size)
+    # 本文を送り終えてファイルが閉じられたら、応答の close 処理（call_on_close）も走らせる
+    body.callbacks.append(resp.close)
+    return resp
+
+
+def parse_report_params(args) -> dict:
+    """リクエスト引数 → 正規化済みのレポート入力（キャッシュキーにもなる）"""
     your_name = (
-        request.args.get("your_name")
-        or request.args.get("name")
+        args.get("your_name")
+        or args.get("name")
         or ""
-    )
+    ).strip()
 
     partner_name = (
-        request.args.get("partner_name")
-        or request.args.get("partner")
+        args.get("partner_name")
+        or args.get("partner")
         or ""
+    ).strip()
+
+    raw_date = args.get("date")
+
+    your_dob, your_time = normalize_birth(
+        args.get("your_dob") or "1990-01-01",
+        normalize_time_label(args.get("your_time") or "12:00"),
+    )
+    partner_dob, partner_time = normalize_birth(
+        args.get("partner_dob") or "1990-01-01",
+        normalize_time_label(args.get("partner_time") or "12:00"),
     )
 
-    raw_date = request.args.get("date")
-    date_display = get_display_date(raw_date)
+    return {
+        "your_name": your_name,
+        "partner_name": partner_name,
+        "date_display": get_display_date(raw_date),
+        "your_dob": your_dob,
+        "your_time": your_time,
+        "your_place": (args.get("your_place") or "Tokyo").strip(),
+        "partner_dob": partner_dob,
+        "partner_time": partner_time,
+        "partner_place": (args.get("partner_place") or "Tokyo").strip(),
+    }
 
-    your_dob = request.args.get("your_dob") or "1990-01-01"
-    raw_your_time = request.args.get("your_time") or "12:00"
-    your_time = normalize_time_label(raw_your_time)
-    your_place = request.args.get("your_place") or "Tokyo"
 
-    partner_dob = request.args.get("partner_dob") or "1990-01-01"
-    raw_partner_time = request.args.get("partner_time") or "12:00"
-    partner_time = normalize_time_label(raw_partner_time)
-    partner_place = request.args.get("partner_place") or "Tokyo"
+# キャッシュキー・強い ETag に入れる描画設定（切り替えたり素材を作り直したりすると PDF のバイト列が変わる）
+REPORT_RENDER_CONFIG = ":".join((
+    REPORT_VERSION,
+    f"fonts={int(EMBED_FONTS)}",
+    f"vector={int(VECTOR_CHART)}",
+    f"rl={rl_compat.VERSION}/{int(rl_compat.INTERNALS)}",
+    f"assets={ASSETS.content_hash()}",
+))
 
-    # ---- 2. 计算双方核心星盘 ----
-    your_core = compute_core_from_birth(your_dob, your_time, your_place)
-    partner_core = compute_core_from_birth(partner_dob, partner_time, partner_place)
 
-    # ---- 3. PDF 缓冲区 ----
-    buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=A4)
+def report_cache_key(params: dict) -> str:
+    return make_cache_key(params, REPORT_RENDER_CONFIG)
+
+
+def render_report_pdf(params: dict, out, timer=None):
+    """
+    正規化済みパラメータから 8 ページの PDF を out（file-like）に書き出す
+    timer（StageTimer）を渡すと、星盤・文章・各ページ・書き出しの段階ごとに lap を記録する
+    （渡さなくても、指標が有効なら内部で計測して /metrics のヒストグラムに入れる）
+    """
+    if timer is None:
+        timer = StageTimer() if METRICS.enabled else NULL_TIMER
+    first_stage = len(timer.stages)
+    # 初回だけフォントの読み込み・変換がある（chart_you に混ぜない）
+    ensure_report_fonts()
+    timer.lap("fonts")
+
+    your_name = params["your_name"]
+    partner_name = params["partner_name"]
+    date_display = params["date_display"]
+
+    # ---- 计算双方核心星盘 ----
+    your_core = compute_core_from_birth(
+        params["your_dob"], params["your_time"], params["your_place"]
+    )
+    timer.lap("chart_you")
+    partner_core = compute_core_from_birth(
+        params["partner_dob"], params["partner_time"], params["partner_place"]
+    )
+    timer.lap("chart_partner")
+
+    # ---- PDF（invariant：同じ入力なら同じバイト列 → 強い ETag が使える）----
+    c = canvas.Canvas(out, pagesize=A4, invariant=1)
 
     # =======================
     # PAGE 1：封面
     # =======================
     draw_full_bg(c, "cover.jpg")
-    c.setFont(JP_SANS, 20)
     c.setFillColorRGB(0.1, 0.1, 0.1)
     couple_text = f"{your_name} さん ＆ {partner_name} さん"
+    c.setFont(sans_font_for(couple_text), 20)
     c.drawCentredString(PAGE_WIDTH / 2, 420, couple_text)
 
     c.setFont(JP_SANS, 12)
     date_text = f"作成日：{date_display}"
     c.drawCentredString(PAGE_WIDTH / 2, 80, date_text)
     c.showPage()
+    timer.lap("page1")
 
     # =======================
-    # PAGE 2：イントロ
+    # PAGE 2：イントロ（完全に静的）
     # =======================
-    draw_full_bg(c, "index.jpg")
-    c.showPage()
+    PAGE_TEMPLATES["index.jpg"].stamp_page(c)
+    timer.lap("page2")
 
     # =======================
     # PAGE 3：相性まとめ
     # =======================
-    compat_text, sun_text, moon_text, asc_text = build_page3_texts(
-        your_name,
-        partner_name,
-        your_core,
-        partner_core,
-    )
+    # Page3〜8 の文章はテキスト選択インデックスからまとめて取る
+    texts = select_report_texts(your_name, partner_name, your_core, partner_core)
+    fragment_keys = page_fragment_keys(your_core, partner_core)
+    timer.lap("texts")
+    compat_text, sun_text, moon_text, asc_text = texts[3]
 
     draw_page3_basic_and_synastry(
         c,
@@ -1858,6 +2714,7 @@ def generate_report():
         moon_text,
         asc_text,
     )
+    timer.lap("page3")
 
     # =======================
     # PAGE 4：コミュニケーション
@@ -1866,14 +2723,15 @@ def generate_report():
         talk_text, talk_summary,
         problem_text, problem_summary,
         values_text, values_summary,
-    ) = build_page4_texts(your_name, partner_name, your_core, partner_core)
+    ) = texts[4]
 
-    draw_page4_communication(
-        c,
+    PAGE_FRAGMENTS.draw(
+        c, fragment_keys.get(4), draw_page4_communication,
         talk_text, talk_summary,
         problem_text, problem_summary,
         values_text, values_summary,
     )
+    timer.lap("page4")
 
     # =======================
     # PAGE 5：良い点・すれ違い
@@ -1882,7 +2740,7 @@ def generate_report():
         good_text, good_summary,
         gap_text, gap_summary,
         hint_text, hint_summary,
-    ) = build_page5_texts(your_name, partner_name, your_core, partner_core)
+    ) = texts[5]
 
     draw_page5_points(
         c,
@@ -1890,77 +2748,693 @@ def generate_report():
         gap_text, gap_summary,
         hint_text, hint_summary,
     )
+    timer.lap("page5")
 
     # ======================
     # PAGE 6：方向性と今後
     # ======================
-    (
-        theme_text, theme_summary,
-        emotion_text, emotion_summary,
-        style_text, style_summary,
-        future_text, future_summary,
-    ) = build_page6_texts(your_name, partner_name, your_core, partner_core)
-
-    # --- 新レイアウト用にマッピング ---
-    # ① 行動タイプ / エネルギーの方向性 → 旧：テーマ部分
-    type_text = theme_text
-    type_summary = theme_summary
-
-    # ② 支え方・安心感 → 旧：感情＋スタイル部分をまとめて本文にする
-    care_text = emotion_text + " " + style_text
-    care_summary = emotion_summary  # サマリーはまず感情側だけ使う
-
-    # ③ これからの伸ばし方・成長ポイント → 旧：future をそのまま使う
-
-    draw_page6_support(
-        c,
-        type_text, type_summary,
-        care_text, care_summary,
-        future_text, future_summary,
+    PAGE_FRAGMENTS.draw(
+        c, fragment_keys.get(6), draw_page6_support,
+        *page6_layout_texts(texts[6]),
     )
+    timer.lap("page6")
 
 
     # =======================
     # PAGE 7：アドバイス
     # =======================
-    advice_rows, footer_text = build_page7_texts(
-        your_name, partner_name, your_core, partner_core
-    )
+    advice_rows, footer_text = texts[7]
 
     draw_page7_advice(c, advice_rows, footer_text)
+    timer.lap("page7")
 
     # =======================
     # PAGE 8：まとめ（動的版）
     # =======================
-    summary_text = build_page8_texts(
-    your_name, partner_name, your_core, partner_core
-    )
+    summary_text = texts[8]
     draw_page8_summary(c, summary_text)
+    timer.lap("page8")
 
 
     # =======================
     # 完成
     # =======================
     c.save()
-    buffer.seek(0)
+    timer.lap("serialize")
+    observe_render(timer.stages[first_stage:], out)
 
-    filename = f"love_report_{your_name}_{partner_name}.pdf"
-    return send_file(
-        buffer,
-        as_attachment=True,
-        download_name=filename,
-        mimetype="application/pdf",
+
+def observe_render(stages, out):
+    """1回分のレンダリングの段階別時間と PDF サイズを /metrics に記録する"""
+    if not METRICS.enabled or not stages:
+        return
+    total = 0.0
+    for name, sec in stages:
+        RENDER_STAGE_LATENCY.observe(sec, stage=name)
+        total += sec
+    RENDER_LATENCY.observe(total)
+    PDF_SIZE.observe(out.tell())
+
+
+# 段階別の計測（Server-Timing ヘッダー + 1行 JSON のログ）。0 で無効
+REPORT_TIMING = os.environ.get("REPORT_TIMING", "1") != "0"
+TIMING_LOG = get_timing_logger()
+
+
+def finish_report_timing(resp, timer, key: str, outcome: str):
+    """
+    Server-Timing ヘッダーを付け、送信が終わった時点（close）でログを1行出す
+    ログの send_ms はヘッダーを付けた後〜本文を送り切るまで
+    """
+    REPORT_REQUESTS.inc(outcome=outcome)
+    if not REPORT_TIMING:
+        return resp
+    resp.headers["Server-Timing"] = timer.server_timing()
+    handled = timer.total()
+
+    def log_line():
+        log_json(TIMING_LOG, {
+            "event": "generate_report",
+            "key": key[:16],
+            "outcome": outcome,
+            "status": resp.status_code,
+            "bytes": resp.content_length,
+            "stages_ms": timer.as_ms(),
+            "handle_ms": round(handled * 1000.0, 3),
+            "send_ms": round((timer.elapsed() - handled) * 1000.0, 3),
+        })
+
+    resp.call_on_close(log_line)
+    return resp
+
+
+# 本番リクエストのプロファイル（X-Profile: <PROFILE_TOKEN> または PROFILE_SAMPLE_RATE の確率）
+# 集計は python -m profiling top
+PROFILER = RequestProfiler(
+    os.environ.get("PROFILE_DIR") or PROFILE_DEFAULT_DIR,
+    keep=int(os.environ.get("PROFILE_KEEP", 200)),
+    sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0)),
+    token=os.environ.get("PROFILE_TOKEN"),
+)
+
+
+def report_feature_key(params: dict) -> str:
+    """プロファイルの分類用：2人分の person_features を "-" と "/" でつないだ文字列（表にない core は "?"）"""
+    parts = []
+    for who in ("your", "partner"):
+        core = compute_signs_from_birth(
+            params[f"{who}_dob"], params[f"{who}_time"], params[f"{who}_place"]
+        )
+        features = person_features(core)
+        parts.append("-".join(features) if features is not None else "?")
+    return "/".join(parts)
+
+
+def report_cusp_header(params: dict) -> str:
+    """X-Cusp-Bodies 用：出生時刻が星座の境目（CUSP_WINDOW_HOURS 以内）に近い天体 例 "your=moon; partner=" """
+    parts = []
+    for who in ("your", "partner"):
+        core = compute_signs_from_birth(
+            params[f"{who}_dob"], params[f"{who}_time"], params[f"{who}_place"]
+        )
+        parts.append(f"{who}={','.join(core['cusp_bodies'])}")
+    return "; ".join(parts)
+
+
+@app.route("/api/generate_report", methods=["GET", "POST"])
+def generate_report():
+    trigger = PROFILER.trigger(request.headers.get(PROFILE_HEADER))
+    timer = StageTimer() if REPORT_TIMING or METRICS.enabled or trigger else NULL_TIMER
+    if trigger is None:
+        return finish_report_timing(*_generate_report(timer))
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        resp, timer, key, outcome = _generate_report(timer)
+    finally:
+        profile.disable()
+
+    meta = {
+        "key": key,
+        "features": report_feature_key(parse_report_params(request.args)),
+        "outcome": outcome,
+        "trigger": trigger,
+        "stages_ms": timer.as_ms(),
+        "handle_ms": round(timer.total() * 1000.0, 3),
+    }
+    if trigger == "header":
+        # 管理者が指定したときはその場で保存して、どのファイルかを返す
+        stem = PROFILER.save(profile, meta)
+        if stem:
+            resp.headers["X-Profile-Id"] = stem
+    else:
+        resp.call_on_close(lambda: PROFILER.save(profile, meta))
+    return finish_report_timing(resp, timer, key, outcome)
+
+
+def _generate_report(timer):
+    """→ (応答, timer, キャッシュキー, outcome)"""
+    # ---- 1. 读取参数 → 缓存键（同时作为强 ETag）----
+    params = parse_report_params(request.args)
+    key = report_cache_key(params)
+    timer.lap("parse")
+
+    # ---- 2. 客户端已有同一份 PDF → 304 ----
+    if request.if_none_match.contains(key):
+        resp = app.response_class(status=304)
+        resp.set_etag(key)
+        return resp, timer, key, "not_modified"
+
+    # ---- 3. 缓存命中则直接返回，否则渲染到 spool（内存里不再多拷一份）----
+    pdf_file = REPORT_CACHE.open(key)
+    timer.lap("cache")
+    outcome = "hit"
+    if pdf_file is None:
+        outcome = "rendered"
+        pdf_file = open_report_spool()
+        render_report_pdf(params, pdf_file, timer=timer)
+        REPORT_CACHE.put_file(key, pdf_file)
+        timer.lap("cache_store")
+
+    filename = f"love_report_{params['your_name']}_{params['partner_name']}.pdf"
+    resp = send_report_file(pdf_file, filename, key)
+    # 境目の天体は星座が入れ替わりやすい（出生時刻の誤差で別の文章になる）ので、受け取り側に知らせる
+    resp.headers["X-Cusp-Bodies"] = report_cusp_header(params)
+    timer.lap("respond")
+    return resp, timer, key, outcome
+
+
+# ==============================================================
+#          プレビュー（購入前のサムネイル PNG：表紙・Page3・Page8）
+# ==============================================================
+# reportlab は通さず Pillow で合成する（preview.py）
+# 座標・大きさ・折り返しは draw_* と同じ値（描画側を変えたらここも直す）
+PREVIEW_PAGES = (1, 3, 8)
+
+PREVIEW = ThumbnailRenderer(
+    ASSETS_DIR,
+    (PAGE_WIDTH, PAGE_HEIGHT),
+    font_path=os.path.join(ASSETS_DIR, fonts.FACES["regular"]),
+    width=int(os.environ.get("PREVIEW_WIDTH", 240)),
+    max_entries=int(os.environ.get("PREVIEW_CACHE_SIZE", 512)),
+)
+
+# 星盤と惑星記号は PDF と同じもの：ベクターのときは同じ描画命令をラスタライズした画像、そうでなければ PNG
+if CHART_FORMS is not None:
+    PREVIEW_CHART_IMAGE = "vector:wheel"
+    PREVIEW_PLANET_IMAGES = {key: f"vector:{key}" for key in PLANET_ICON_FILES}
+    for _name in ("wheel", *PLANET_ICON_FILES):
+        PREVIEW.register_image(f"vector:{_name}", functools.partial(CHART_FORMS.image, _name))
+else:
+    PREVIEW_CHART_IMAGE = "chart_base.png"
+    PREVIEW_PLANET_IMAGES = PLANET_ICON_FILES
+
+_PREVIEW_GRAY = (0.2, 0.2, 0.2)
+_PREVIEW_PAGE_NUM_GRAY = (0.6, 0.6, 0.6)
+
+
+def _preview_block(lines, x, y, size, line_height, color=_PREVIEW_GRAY):
+    """draw_wrapped_block_limited と同じ並べ方 → (命令のリスト, 次の y)"""
+    ops = []
+    for line in lines:
+        ops.append(("text", x, y, line, size, color, "left"))
+        y -= line_height
+    return ops, y
+
+
+def _preview_page_number(page_num: int):
+    return ("text", PAGE_WIDTH / 2, 40, str(page_num), 10, _PREVIEW_PAGE_NUM_GRAY, "center")
+
+
+def _preview_page1(params):
+    couple_text = f"{params['your_name']} さん ＆ {params['partner_name']} さん"
+    ops = [
+        ("text", PAGE_WIDTH / 2, 420, couple_text, 20, (0.1, 0.1, 0.1), "center"),
+        ("text", PAGE_WIDTH / 2, 80, f"作成日：{params['date_display']}", 12,
+         (0.1, 0.1, 0.1), "center"),
+    ]
+    return (1,), "cover.jpg", [], ops
+
+
+def _preview_page3(params, texts, your_core, partner_core):
+    """星盤・本文・ページ番号は特徴キーで決まる層、名前・ラベル・アイコンは毎回"""
+    chart_size = 180
+    left_x, left_y = 90, 520
+    right_x, right_y = PAGE_WIDTH - chart_size - 90, left_y
+
+    layer = [
+        ("image", PREVIEW_CHART_IMAGE, left_x, left_y, chart_size, chart_size),
+        ("image", PREVIEW_CHART_IMAGE, right_x, right_y, chart_size, chart_size),
+    ]
+    compat_text, sun_text, moon_text, asc_text = texts[3]
+    block, _ = _preview_block(
+        LINE_CACHE.lines(compat_text, 400, JP_SERIF, 12, 3), 120, 350, 12, 18
+    )
+    layer += block
+    y = 240
+    for block_text in (sun_text, moon_text, asc_text):
+        block, y = _preview_block(
+            LINE_CACHE.lines(block_text, 400, JP_SERIF, 12, 3), 120, y, 12, 18
+        )
+        layer += block
+        y -= 18 * 1.4
+    layer.append(_preview_page_number(3))
+
+    ops = []
+    sides = (
+        (params["your_name"], your_core, left_x, left_y, (0.15, 0.45, 0.9)),
+        (params["partner_name"], partner_core, right_x, right_y, (0.9, 0.35, 0.65)),
+    )
+    for name, core, x, y0, color in sides:
+        cx, cy = x + chart_size / 2, y0 + chart_size / 2
+        planets = build_planet_block(core)
+        for key, info in planets.items():
+            (px, py), (ix, iy) = planet_icon_points(cx, cy, chart_size, info["deg"])
+            half = PLANET_ICON_SIZE / 2
+            ops.append(("dot", px, py, PLANET_DOT_RADIUS, color))
+            ops.append(("image", PREVIEW_PLANET_IMAGES[key], ix - half, iy - half,
+                        PLANET_ICON_SIZE, PLANET_ICON_SIZE))
+        ops.append(("text", cx, y0 - 25, f"{name} さん", 14, _PREVIEW_GRAY, "center"))
+        for i, info in enumerate(planets.values()):
+            ops.append(("text", cx - 30, y0 - 45 - i * 11, info["label"], 8.5,
+                        _PREVIEW_GRAY, "left"))
+
+    # 表にない core（特徴キーが作れない）なら層もキャッシュしない
+    layer_key = page_fragment_keys(your_core, partner_core, pages=(3,)).get(3)
+    return layer_key, "page_basic.jpg", layer, ops
+
+
+def _preview_page8(texts):
+    # 本文は名前入りなので層には入れない（折り返しも draw_page8_summary と同じく store=False）
+    ops, _ = _preview_block(
+        LINE_CACHE.lines(texts[8], 420, JP_SERIF, 12, 22, store=False), 90, 670, 12, 19
+    )
+    return (8,), "page_summary.jpg", [_preview_page_number(8)], ops
+
+
+def render_preview_png(params: dict, page: int) -> bytes:
+    if page == 1:
+        return PREVIEW.render(*_preview_page1(params))
+
+    # Page8 は文章だけなので星座だけの core で足りる（Page3 は星盤を描くので度数も要る）
+    chart = compute_core_from_birth if page == 3 else compute_signs_from_birth
+    your_core = chart(params["your_dob"], params["your_time"], params["your_place"])
+    partner_core = chart(params["partner_dob"], params["partner_time"], params["partner_place"])
+    texts = select_report_texts(
+        params["your_name"], params["partner_name"], your_core, partner_core
+    )
+    if page == 3:
+        return PREVIEW.render(*_preview_page3(params, texts, your_core, partner_core))
+    return PREVIEW.render(*_preview_page8(texts))
+
+
+@app.route("/api/preview")
+def preview():
+    """?page=1|3|8 と generate_report と同じ引数 → そのページのサムネイル PNG"""
+    page = request.args.get("page", default=1, type=int)
+    if page not in PREVIEW_PAGES:
+        return {"error": f"page must be one of {list(PREVIEW_PAGES)}"}, 400
+    params = parse_report_params(request.args)
+    # PDF と同じ描画設定（ベクターの星盤かどうか・素材）が変わったら ETag も変わる
+    etag = make_cache_key(params, f"{REPORT_RENDER_CONFIG}-preview{page}-{PREVIEW.size[0]}")
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+        resp.set_etag(etag)
+        return resp
+
+    resp = app.response_class(render_preview_png(params, page), mimetype="image/png")
+    resp.set_etag(etag)
+    return resp
+
+
+# ==============================================================
+#                    一括生成（ZIP ストリーミング）
+# ==============================================================
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 500))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", os.cpu_count() or 1))
+
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def get_batch_pool(broken=None):
+    """
+    worker プロセスごとに1つだけ作るプロセスプール（最初の一括リクエスト時に起動）
+    子プロセスが1つでも落ちるとプールは BrokenProcessPool で使えなくなるので、
+    broken にそのプールを渡すと作り直す（別のスレッドが作り直し済みなら新しい方を返すだけ）
+    """
+    global _batch_pool
+    with _batch_pool_lock:
+        if broken is not None and _batch_pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _batch_pool = None
+        if _batch_pool is None:
+            _batch_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+        return _batch_pool
+
+
+def render_report_bytes(params: dict) -> bytes:
+    """プロセスプールから呼ぶ用：PDF を bytes で返す"""
+    buffer = io.BytesIO()
+    render_report_pdf(params, buffer)
+    return buffer.getvalue()
+
+
+def _safe_filename_part(v: str) -> str:
+    return v.replace("/", "_").replace("\\", "_")
+
+
+@app.route("/api/generate_reports", methods=["POST"])
+def generate_reports():
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("couples")
+    if not isinstance(data, list) or not data:
+        return {"error": "JSON list of couples is required"}, 400
+    if len(data) > BATCH_MAX_ITEMS:
+        return {"error": f"too many couples (max {BATCH_MAX_ITEMS})"}, 400
+
+    # 入力を先に全部正規化しておく（不正なアイテムは manifest にエラーとして残す）
+    jobs = []
+    for i, item in enumerate(data, start=1):
+        if not isinstance(item, dict):
+            jobs.append({"index": i, "error": "item must be a JSON object"})
+            continue
+        params = parse_report_params(
+            {k: str(v) for k, v in item.items() if v is not None}
+        )
+        filename = "{:04d}_love_report_{}_{}.pdf".format(
+            i,
+            _safe_filename_part(params["your_name"]),
+            _safe_filename_part(params["partner_name"]),
+        )
+        jobs.append({
+            "index": i,
+            "filename": filename,
+            "params": params,
+            "key": report_cache_key(params),
+        })
+
+    stream = iter_reports_zip(
+        jobs,
+        render_report_bytes,
+        get_batch_pool,
+        max_in_flight=BATCH_WORKERS * 2,
+        cache=REPORT_CACHE,
+    )
+    return app.response_class(
+        stream,
+        mimetype="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="love_reports.zip"'},
     )
 
 
 # ------------------------------------------------------------------
 # Tally webhook
 # ------------------------------------------------------------------
+# ==============================================================
+#          バックグラウンド生成（Tally webhook → ジョブ）
+# ==============================================================
+JOBS_DIR = os.environ.get("JOBS_DIR") or os.path.join(BASE_DIR, "jobs")
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 600))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", 7 * 24 * 3600))
+JOB_MAINTENANCE_SECONDS = int(os.environ.get("JOB_MAINTENANCE_SECONDS", 60))
+TALLY_FIELD_LABELS = load_field_labels()
+
+_job_queue = None
+
+
+def get_job_queue() -> JobQueue:
+    """
+    worker プロセスごとに1つ
+    呼ばれるたびに maintain()（取り残されたジョブの拾い直し・古いジョブの削除。実際に走るのは間隔ごと）
+    """
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(
+            JobStore(JOBS_DIR),
+            render_report_bytes,
+            get_batch_pool,
+            cache=REPORT_CACHE,
+            stale_seconds=JOB_STALE_SECONDS,
+            retention_seconds=JOB_RETENTION_SECONDS,
+            maintenance_seconds=JOB_MAINTENANCE_SECONDS,
+        )
+    _job_queue.maintain()
+    return _job_queue
+
+
+def job_view(job: dict) -> dict:
+    """API で返すジョブの情報（入力パラメータそのものは返さない）"""
+    view = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+        "status_url": f"/api/jobs/{job['id']}",
+    }
+    if job["status"] == "done":
+        view["pdf_url"] = f"/api/jobs/{job['id']}/pdf"
+        view["pdf_bytes"] = job["pdf_bytes"]
+    if job["status"] == "failed":
+        view["error"] = job["error"]
+    return view
+
+
 @app.route("/tally_webhook", methods=["POST"])
 def tally_webhook():
     data = request.get_json(silent=True) or request.form.to_dict() or {}
-    print("Tally webhook payload:", data)
-    return {"status": "ok"}
+
+    # Tally の形式ならフィールドを対応づける。それ以外は generate_report と同じ引数名とみなす
+    # （どちらも必須項目がなければ 400。認証のない入口なので、既定値だけのジョブは作らない）
+    source_id = None
+    if is_tally_payload(data):
+        try:
+            args, source_id = tally_to_args(data, TALLY_FIELD_LABELS)
+        except ValueError as e:
+            return {"status": "error", "error": str(e)}, 400
+    elif isinstance(data, dict):
+        args = {k: v for k, v in data.items() if isinstance(v, str)}
+        try:
+            check_required(args)
+        except ValueError as e:
+            return {"status": "error", "error": str(e)}, 400
+    else:
+        return {"status": "error", "error": "JSON object is required"}, 400
+
+    try:
+        params = parse_report_params(args)
+    except (ValueError, TypeError) as e:
+        return {"status": "error", "error": f"{type(e).__name__}: {e}"}, 400
+
+    queue = get_job_queue()
+    job = queue.store.create(params, report_cache_key(params), source_id=source_id)
+    if job["status"] == "queued":
+        queue.submit(job["id"])
+        job = queue.store.get(job["id"])
+    return job_view(job), 202
+
+
+@app.route("/api/jobs/<job_id>")
+def job_status(job_id):
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        return {"error": "job not found"}, 404
+    return job_view(job)
+
+
+@app.route("/api/jobs/<job_id>/pdf")
+def job_pdf(job_id):
+    queue = get_job_queue()
+    job = queue.store.get(job_id)
+    if job is None:
+        return {"error": "job not found"}, 404
+    if job["status"] == "failed":
+        return job_view(job), 409
+    if job["status"] != "done":
+        return job_view(job), 202
+
+    if request.if_none_match.contains(job["cache_key"]):
+        resp = app.response_class(status=304)
+        resp.set_etag(job["cache_key"])
+        return resp
+
+    try:
+        f = open(queue.store.pdf_path(job_id), "rb")
+    except OSError:
+        return {"error": "job result is missing"}, 410
+
+    params = job["params"]
+    filename = f"love_report_{params['your_name']}_{params['partner_name']}.pdf"
+    return send_report_file(f, filename, job["cache_key"])
+
+
+@app.route("/api/job_stats")
+def job_stats():
+    return get_job_queue().store.stats()
+
+
+# ==============================================================
+#          ウォームアップ（gunicorn の preload 時に master で1回）
+# ==============================================================
+# 架空の1組で1回だけ通しで生成し、フォント・画像・swisseph・reportlab の
+# 遅延 import をすべて済ませておく。終わったら gc.freeze() で、fork した
+# worker がそのページを copy-on-write のまま共有できるようにする
+WARMUP_ARGS = {
+    "your_name": "ウォームアップ",
+    "partner_name": "ウォームアップ",
+    "your_dob": "1990-01-01",
+    "your_time": "12:00",
+    "partner_dob": "1991-07-15",
+    "partner_time": "06:30",
+}
+
+WARMUP_STATE = {
+    "ready": False,
+    "error": None,
+    "warmup_seconds": None,
+    "render_seconds": None,
+    "frozen_objects": 0,
+    "pid": None,
+    "lazy": False,      # preload なしで起動し、最初の /readyz でウォームアップしたとき True
+}
+
+_warmup_lock = threading.Lock()
+_lazy_warmup_thread = None
+
+
+def warmup(freeze: bool = True) -> dict:
+    """1回だけ実行される（2回目以降は状態を返すだけ。同時に呼ばれたら後の方は終わるまで待つ）"""
+    with _warmup_lock:
+        return _warmup(freeze)
+
+
+def _warmup(freeze: bool) -> dict:
+    if WARMUP_STATE["ready"]:
+        return WARMUP_STATE
+
+    t0 = time.perf_counter()
+    try:
+        # swisseph の ephe ファイルは黄経表があっても1回開いておく（範囲外の日付用）
+        jd = swe.julday(2000, 1, 1, 12.0)
+        for _, body_id in CORE_BODIES:
+            swe.calc_ut(jd, body_id)
+
+        t1 = time.perf_counter()
+        render_report_pdf(parse_report_params(WARMUP_ARGS), io.BytesIO())
+        render_seconds = time.perf_counter() - t1
+        # プレビューの背景・アイコンの縮小とフォントの読み込みも fork 前に済ませる
+        for page in PREVIEW_PAGES:
+            render_preview_png(parse_report_params(WARMUP_ARGS), page)
+    except Exception as e:
+        WARMUP_STATE["error"] = f"{type(e).__name__}: {e}"
+        return WARMUP_STATE
+
+    gc.collect()
+    if freeze:
+        gc.freeze()
+
+    WARMUP_STATE.update(
+        ready=True,
+        error=None,
+        warmup_seconds=round(time.perf_counter() - t0, 4),
+        render_seconds=round(render_seconds, 4),
+        frozen_objects=gc.get_freeze_count(),
+        pid=os.getpid(),
+    )
+    return WARMUP_STATE
+
+
+def start_lazy_warmup():
+    """
+    gunicorn.conf.py を通さずに起動した場合（flask run・別の WSGI サーバーなど）の保険
+    最初の /readyz でウォームアップをバックグラウンドで始める（プローブ自体は待たせない）
+    失敗したら次の /readyz でやり直す
+    """
+    global _lazy_warmup_thread
+    with _warmup_lock:
+        if WARMUP_STATE["ready"]:
+            return
+        if _lazy_warmup_thread is not None and _lazy_warmup_thread.is_alive():
+            return
+        WARMUP_STATE["lazy"] = True
+        # リクエストを受けている worker なので gc.freeze はしない（post_worker_init と同じ）
+        _lazy_warmup_thread = threading.Thread(
+            target=warmup, kwargs={"freeze": False}, name="lazy-warmup", daemon=True
+        )
+        _lazy_warmup_thread.start()
+
+
+@app.route("/readyz")
+def readyz():
+    """ロードバランサ用：ウォームアップ済みなら 200、まだなら 503（まだ始まっていなければ始める）"""
+    if not WARMUP_STATE["ready"]:
+        start_lazy_warmup()
+    body = dict(WARMUP_STATE, worker_pid=os.getpid())
+    return body, (200 if WARMUP_STATE["ready"] else 503)
+
+
+# ==============================================================
+#                 Prometheus 指標（/metrics）
+# ==============================================================
+# RSS とキャッシュの hits / misses は worker ごとのメモリ上の値なので、
+# リクエストのついでに（最短でもこの秒数おきに）mmap 側へ書き写す
+METRICS_SAMPLE_SECONDS = float(os.environ.get("METRICS_SAMPLE_SECONDS", 5))
+_metrics_sampled_at = 0.0
+
+
+def sample_process_metrics():
+    global _metrics_sampled_at
+    _metrics_sampled_at = time.monotonic()
+    PROCESS_RSS.set(read_rss_bytes())
+    for name, stats in (
+        ("report", REPORT_CACHE.stats()),
+        ("chart", chart_cache_stats()),
+        ("page_fragment", PAGE_FRAGMENTS.stats()),
+        ("place", GAZETTEER.stats()),
+        ("line", LINE_CACHE.stats()),
+        ("asset", ASSETS.stats()),
+    ):
+        CACHE_HITS.set(stats["hits"], cache=name)
+        CACHE_MISSES.set(stats["misses"], cache=name)
+
+
+@app.before_request
+def _metrics_start():
+    request.environ["astro.started"] = time.perf_counter()
+
+
+def _observe_request(status):
+    # 未処理の例外も handle_exception → 500 の応答として after_request を通る
+    started = request.environ.get("astro.started")
+    if started is None:
+        return
+    rule = request.url_rule
+    HTTP_LATENCY.observe(
+        time.perf_counter() - started,
+        route=rule.rule if rule is not None else "<unmatched>",
+        method=request.method,
+        status=status,
+    )
+    if time.monotonic() - _metrics_sampled_at >= METRICS_SAMPLE_SECONDS:
+        sample_process_metrics()
+
+
+@app.after_request
+def _metrics_finish(resp):
+    if METRICS.enabled:
+        _observe_request(resp.status_code)
+    return resp
+
+
+@app.route("/metrics")
+def metrics_view():
+    if not METRICS.enabled:
+        return {"error": "metrics are disabled"}, 404
+    sample_process_metrics()
+    return app.response_class(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
 
 
 # ------------------------------------------------------------------
@@ -1976,9 +3450,64 @@ def test_page():
     return app.send_static_file("test.html")
 
 
+# ------------------------------------------------------------------
+# 图片缓存统计（hits / misses）
+# ------------------------------------------------------------------
+@app.route("/api/asset_stats")
+def asset_stats():
+    return dict(ASSETS.stats(), vector_chart=CHART_FORMS.stats() if CHART_FORMS else None)
+
+
+@app.route("/api/report_cache_stats")
+def report_cache_stats():
+    return REPORT_CACHE.stats()
+
+
+@app.route("/api/chart_cache_stats")
+def chart_cache_stats_view():
+    return chart_cache_stats()
+
+
+@app.route("/api/page_fragment_stats")
+def page_fragment_stats():
+    return PAGE_FRAGMENTS.stats()
+
+
+@app.route("/api/place_cache_stats")
+def place_cache_stats():
+    return GAZETTEER.stats()
+
+
+@app.route("/api/profile_stats")
+def profile_stats():
+    """保存先のパスなどを返すので、X-Profile に PROFILE_TOKEN を付けたときだけ（未設定なら 404）"""
+    if PROFILER.token is None:
+        return {"error": "profile stats are disabled"}, 404
+    if not PROFILER.authorized(request.headers.get(PROFILE_HEADER)):
+        return {"error": f"{PROFILE_HEADER} header with the profile token is required"}, 403
+    return PROFILER.stats()
+
+
+@app.route("/api/font_stats")
+def font_stats():
+    return report_font_stats()
+
+
+@app.route("/api/preview_stats")
+def preview_stats():
+    return PREVIEW.stats()
+
+
+@app.route("/api/line_cache_stats")
+def line_cache_stats():
+    return LINE_CACHE.stats()
+
+
 # ------------------------------------------------------------------
 # 主程序入口
 # ------------------------------------------------------------------
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
+    METRICS.clear()
+    warmup(freeze=False)
     app.run(host="0.0.0.0", port=port)
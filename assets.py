@@ -0,0 +1,610 @@
+"""
+public/assets 图片资源的进程级缓存
+
+・启动时把 assets 目录下所有图片读进内存，每个 worker 只解码一次
+・ImageReader 共享使用（只读）
+・PDF 用的图片流（JPEG 原始数据 / PNG 的 Flate 数据 + alpha SMask）也只编码一次，
+  之后每个请求只是把同一份 bytes 挂到新文档上
+・图片流一律用二进制（不套 ASCII85）：文本流每个文档都要重新编码一遍，又大 25%
+・有 python -m assets build 生成的 manifest 时，改用按目标 DPI / 画质重新编码好的流
+  （manifest 里记着源文件和输出的 sha256，对不上的图片退回原文件）
+
+    python -m assets build [--profile print|high|screen] [--dpi 150] [--quality 82]
+"""
+import argparse
+import copy
+import fnmatch
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+import zlib
+
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfbase.pdfdoc import PDFObjectReference
+from reportlab.pdfbase.pdfutils import asciiBase85Decode
+from reportlab.lib.rl_accel import fp_str
+
+import rl_compat
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png")
+
+MANIFEST_VERSION = 1
+DEFAULT_COMPILED_DIR = "compiled"     # assets_dir 下的子目录
+MANIFEST_NAME = "manifest.json"
+# build が書く出力の名前（<元の名前>.<sha256 先頭12桁>.<種類>）。掃除ではこれと前回の manifest にあるものだけ消す
+_COMPILED_NAME = re.compile(r".+\.[0-9a-f]{12}\.(jpg|rgb\.zz|alpha\.zz)(\.tmp)?")
+
+
+def _digest_name(data: bytes, mask) -> str:
+    """canvas.drawImage と同じ方式で XObject 名を作る（画像内容 + mask）"""
+    return pdfdoc._digester(data + str(mask).encode("utf8"))
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _binary_stream(xobj):
+    """reportlab が ASCII85 にした図像ストリームを元のバイナリに戻す"""
+    if xobj._filters and xobj._filters[0] == "ASCII85Decode":
+        xobj.streamContent = asciiBase85Decode(xobj.streamContent)
+        xobj._filters = tuple(xobj._filters[1:])
+    return xobj
+
+
+def _compiled_xobj(name, data: bytes, width, height, color_space, filter_name):
+    """エンコード済みのストリームから XObject を作る（デコードも再圧縮もしない）"""
+    xobj = pdfdoc.PDFImageXObject(name)
+    xobj.width = width
+    xobj.height = height
+    xobj.bitsPerComponent = 8
+    xobj.colorSpace = color_space
+    xobj._filters = (filter_name,)
+    xobj.streamContent = data
+    xobj.mask = None
+    return xobj
+
+
+def load_manifest(assets_dir: str, manifest_path: str) -> tuple:
+    """
+    manifest → ({filename: (情報, ストリーム, alpha ストリーム or None)}, [使えなかった filename])
+    源ファイルが変わっている・出力が壊れているものは使わない
+    """
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}, []
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}, sorted(manifest.get("assets", {}))
+
+    out_dir = os.path.dirname(manifest_path)
+    compiled = {}
+    stale = []
+    for filename, info in manifest.get("assets", {}).items():
+        try:
+            with open(os.path.join(assets_dir, filename), "rb") as f:
+                source_ok = _sha256(f.read()) == info["source_sha256"]
+            with open(os.path.join(out_dir, info["stream"]), "rb") as f:
+                stream = f.read()
+            alpha = None
+            if info.get("smask"):
+                with open(os.path.join(out_dir, info["smask"]), "rb") as f:
+                    alpha = f.read()
+        except (OSError, KeyError):
+            stale.append(filename)
+            continue
+        if (
+            not source_ok
+            or _sha256(stream) != info["stream_sha256"]
+            or (alpha is not None and _sha256(alpha) != info["smask_sha256"])
+        ):
+            stale.append(filename)
+            continue
+        compiled[filename] = (info, stream, alpha)
+    return compiled, stale
+
+
+class _ImageEntry:
+    """1枚の画像 × mask 指定ごとの、エンコード済み XObject"""
+
+    __slots__ = ("name", "xobj", "smask")
+
+    def __init__(self, name, xobj, smask):
+        self.name = name
+        self.xobj = xobj
+        self.smask = smask
+
+
+class AssetRegistry:
+    """
+    画像アセットのレジストリ
+    reader() で共有 ImageReader、draw_image() でエンコード済みストリームを使った描画
+    fast=False（reportlab が未確認の版）のときは canvas.drawImage に任せる（manifest も使わない）
+    """
+
+    def __init__(self, assets_dir: str, manifest_path=None, fast=None):
+        """manifest_path：python -m assets build の出力（なければ元の画像をそのまま使う）"""
+        self.assets_dir = assets_dir
+        self.fast = rl_compat.INTERNALS if fast is None else fast
+        self._compiled, self.stale = (
+            load_manifest(assets_dir, manifest_path) if manifest_path and self.fast else ({}, [])
+        )
+        self._raw = {}        # filename → ファイルの bytes
+        self._readers = {}    # filename → ImageReader
+        self._entries = {}    # (filename, mask) → _ImageEntry
+        self._templates = {}  # (filename, w, h) → PageTemplate
+        self._lock = threading.Lock()
+        self._content_hash = None
+        self.hits = 0
+        self.misses = 0
+
+    # ------------------------------------------------------------------
+    # 読み込み
+    # ------------------------------------------------------------------
+    def preload(self):
+        """assets 以下の画像をすべて読み込み、よく使う形でエンコードしておく"""
+        for filename in sorted(os.listdir(self.assets_dir)):
+            if not filename.lower().endswith(IMAGE_EXTS):
+                continue
+            if not self.fast:
+                self._load(filename)
+                continue
+            # 背景 JPEG は mask なし、PNG（アイコン・星盤）は alpha 付きで使う
+            mask = "auto" if filename.lower().endswith(".png") else None
+            self._entry(filename, mask)
+        return self
+
+    def _load(self, filename: str) -> ImageReader:
+        reader = self._readers.get(filename)
+        if reader is None:
+            path = os.path.join(self.assets_dir, filename)
+            with open(path, "rb") as f:
+                data = f.read()
+            reader = ImageReader(io.BytesIO(data))
+            self._raw[filename] = data
+            self._readers[filename] = reader
+        return reader
+
+    def _entry(self, filename: str, mask=None) -> _ImageEntry:
+        key = (filename, mask)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                if filename in self._compiled:
+                    entry = self._compiled_entry(filename, mask)
+                else:
+                    reader = self._load(filename)
+                    name = _digest_name(self._raw[filename], mask)
+                    xobj = _binary_stream(pdfdoc.PDFImageXObject(name, reader, mask=mask))
+                    smask = getattr(xobj, "_smask", None)
+                    if smask is not None:
+                        del xobj._smask
+                        _binary_stream(smask)
+                    entry = _ImageEntry(name, xobj, smask)
+                self._entries[key] = entry
+            else:
+                self.hits += 1
+        return entry
+
+    def _compiled_entry(self, filename: str, mask) -> _ImageEntry:
+        info, stream, alpha = self._compiled[filename]
+        size = (info["width"], info["height"])
+        smask = None
+        if alpha is not None and mask == "auto":
+            smask = _compiled_xobj(_digest_name(alpha, None), alpha, *size, "DeviceGray", "FlateDecode")
+            smask._decode = [0, 1]
+        # アイコンは RGB がどれも同じ（形は alpha にある）ので、名前には alpha も含める
+        name = _digest_name(stream + (alpha if smask is not None else b""), mask)
+        xobj = _compiled_xobj(name, stream, *size, info["color_space"], info["filter"])
+        self._raw[filename] = stream
+        return _ImageEntry(xobj.name, xobj, smask)
+
+    # ------------------------------------------------------------------
+    # 公開 API
+    # ------------------------------------------------------------------
+    def reader(self, filename: str) -> ImageReader:
+        """共有 ImageReader を返す（読み取り専用として使うこと）"""
+        reader = self._readers.get(filename)
+        if reader is not None:
+            self.hits += 1
+            return reader
+        with self._lock:
+            self.misses += 1
+            return self._load(filename)
+
+    def attach(self, c, filename, mask=None) -> str:
+        """
+        エンコード済み XObject を文書 c に登録し、内部名（/FormXob.xxx）を返す
+        同じ文書内で2回目以降は既存の XObject を参照するだけ
+        """
+        entry = self._entry(filename, mask)
+        doc = c._doc
+
+        reg_name = doc.getXObjectName(entry.name)
+        if doc.idToObject.get(reg_name) is None:
+            # XObject 本体は浅いコピー（streamContent の bytes は共有）
+            img_obj = copy.copy(entry.xobj)
+            c._setXObjects(img_obj)
+            doc.Reference(img_obj, reg_name)
+            doc.addForm(entry.name, img_obj)
+            if entry.smask is not None:
+                m_reg_name = doc.getXObjectName(entry.smask.name)
+                if doc.idToObject.get(m_reg_name) is None:
+                    smask = copy.copy(entry.smask)
+                    c._setXObjects(smask)
+                    img_obj.smask = doc.Reference(smask, m_reg_name)
+                else:
+                    img_obj.smask = PDFObjectReference(m_reg_name)
+
+        c._currentPageHasImages = 1
+        c._formsinuse.append(entry.name)
+        return reg_name
+
+    def source_of(self, name: str):
+        """XObject 名 → (filename, mask)。このレジストリで作ったものでなければ None"""
+        for (filename, mask), entry in self._entries.items():
+            if entry.name == name:
+                return filename, mask
+        return None
+
+    def draw_image(self, c, filename, x, y, width, height, mask=None):
+        """canvas.drawImage と同じ結果を、エンコード済みストリームで描く"""
+        if not self.fast:
+            c.drawImage(self.reader(filename), x, y, width, height, mask=mask)
+            return
+        reg_name = self.attach(c, filename, mask)
+        c.saveState()
+        c.translate(x, y)
+        c.scale(width, height)
+        c._code.append("/%s Do" % reg_name)
+        c.restoreState()
+
+    def page_template(self, filename, width, height) -> "PageTemplate":
+        """背景 1 枚ぶんの PageTemplate（プロセス内で1回だけ作る）"""
+        key = (filename, width, height)
+        tpl = self._templates.get(key)
+        if tpl is None:
+            tpl = PageTemplate(self, filename, width, height)
+            self._templates[key] = tpl
+        return tpl
+
+    def content_hash(self) -> str:
+        """
+        PDF に載る画像の中身のハッシュ（先頭16桁）。manifest の出力を使う画像はそのハッシュ、それ以外は元画像
+        → 再ビルド・元画像の差し替え・ASSET_COMPILED の切り替えで変わる（レポートのキャッシュキーに入れる）
+        """
+        if self._content_hash is None:
+            h = hashlib.sha256()
+            for filename in sorted(os.listdir(self.assets_dir)):
+                if not filename.lower().endswith(IMAGE_EXTS):
+                    continue
+                compiled = self._compiled.get(filename)
+                if compiled is not None:
+                    info = compiled[0]
+                    digest = f"{info['stream_sha256']}:{info.get('smask_sha256', '')}"
+                else:
+                    with open(os.path.join(self.assets_dir, filename), "rb") as f:
+                        digest = _sha256(f.read())
+                h.update(f"{filename}={digest}\n".encode("utf-8"))
+            self._content_hash = h.hexdigest()[:16]
+        return self._content_hash
+
+    def stats(self) -> dict:
+        return {
+            "content_hash": self.content_hash(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "files": len(self._raw),
+            "bytes": sum(len(v) for v in self._raw.values()),
+            "compiled": len(self._compiled),
+            "stale": list(self.stale),
+        }
+
+
+# ------------------------------------------------------------------
+# ページ背景テンプレート：静的レイヤーを事前シリアライズしておく
+# ------------------------------------------------------------------
+class PageTemplate:
+    """
+    全面背景だけのページ静的レイヤー
+    描画命令（q … cm /FormXob.xxx Do Q）は作成時に1回だけ文字列化し、
+    リクエストごとには XObject の登録とこの断片の追加だけを行う
+    """
+
+    def __init__(self, registry: AssetRegistry, filename: str, width, height):
+        self.registry = registry
+        self.filename = filename
+        self.width = width
+        self.height = height
+        self.fragment = None
+        if not registry.fast:
+            return
+        entry = registry._entry(filename, None)
+        reg_name = pdfdoc.xObjectName(entry.name)
+        self.fragment = "q\n%s cm\n/%s Do\nQ" % (
+            fp_str(width, 0, 0, height, 0, 0),
+            reg_name,
+        )
+
+    def stamp(self, c):
+        """現在のページに静的レイヤーを置く（この上に動的な文字・アイコンを描く）"""
+        if self.fragment is None:
+            self.registry.draw_image(c, self.filename, 0, 0, self.width, self.height)
+            return
+        self.registry.attach(c, self.filename)
+        c._code.append(self.fragment)
+
+    def stamp_page(self, c):
+        """動的要素のないページ：静的レイヤーだけで1ページを完成させる"""
+        self.stamp(c)
+        c.showPage()
+
+
+# ------------------------------------------------------------------
+# ビルド：python -m assets build
+# ------------------------------------------------------------------
+PROFILES = {
+    # name: (DPI, JPEG 画質)
+    "print": (150, 82),
+    "high": (220, 88),
+    "screen": (110, 72),
+}
+DEFAULT_PROFILE = "print"
+
+_A4 = (595.2756, 841.8898)
+# PDF 上での最大の描画サイズ（pt）。これ × DPI / 72 px より大きい画像だけ縮める（拡大はしない）
+DRAWN_SIZES = (
+    ("chart_base.png", (180, 180)),
+    ("icon_*.png", (11, 11)),
+    ("*.jpg", _A4),
+)
+
+
+def drawn_size(filename: str):
+    for pattern, size in DRAWN_SIZES:
+        if fnmatch.fnmatch(filename, pattern):
+            return size
+    return None
+
+
+def _target_px(size_px, size_pt, dpi):
+    w, h = size_px
+    if size_pt is None:
+        return w, h
+    scale = min(1.0, size_pt[0] * dpi / 72.0 / w, size_pt[1] * dpi / 72.0 / h)
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+
+def _compile_jpeg(img, size, quality):
+    from PIL import Image
+
+    img = img.convert("RGB")
+    if img.size != size:
+        img = img.resize(size, Image.LANCZOS)
+    buf = io.BytesIO()
+    # ベースライン・4:2:0・メタデータなし（reportlab がそのまま DCT ストリームとして載せる）
+    img.save(buf, "JPEG", quality=quality, optimize=True, subsampling=2, progressive=False)
+    return buf.getvalue(), None, "DeviceRGB", "DCTDecode"
+
+
+def _compile_png(img, size):
+    """alpha は事前乗算で縮小して分離（不透明なら SMask なし）"""
+    from PIL import Image
+
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "transparency" in img.info or "A" in img.getbands() else "RGB")
+    if img.mode == "RGBA":
+        if img.size != size:
+            img = img.convert("RGBa").resize(size, Image.LANCZOS).convert("RGBA")
+        alpha = img.getchannel("A")
+        if alpha.getextrema() == (255, 255):
+            rgb, alpha = img.convert("RGB"), None
+        else:
+            # 完全に透明な画素の色は見えないので 0 に揃える（圧縮が効く）
+            rgb = Image.composite(img.convert("RGB"), Image.new("RGB", size), alpha.point(lambda a: 255 if a else 0))
+    else:
+        rgb = img.resize(size, Image.LANCZOS) if img.size != size else img
+        alpha = None
+    stream = zlib.compress(rgb.tobytes(), 9)
+    smask = zlib.compress(alpha.tobytes(), 9) if alpha is not None else None
+    return stream, smask, "DeviceRGB", "FlateDecode"
+
+
+def compile_asset(path: str, dpi: int, quality: int):
+    """→ (ストリーム, alpha ストリーム or None, 情報 dict)"""
+    from PIL import Image
+
+    filename = os.path.basename(path)
+    with Image.open(path) as img:
+        img.load()
+        size = _target_px(img.size, drawn_size(filename), dpi)
+        if filename.lower().endswith((".jpg", ".jpeg")):
+            stream, smask, color_space, filter_name = _compile_jpeg(img, size, quality)
+        else:
+            stream, smask, color_space, filter_name = _compile_png(img, size)
+    info = {
+        "width": size[0],
+        "height": size[1],
+        "color_space": color_space,
+        "filter": filter_name,
+    }
+    return stream, smask, info
+
+
+def _embed_ms(registry: AssetRegistry, filename: str, repeat: int) -> float:
+    """1ページに描いて保存するまでの時間（背景なしの文書との差、ms / 文書）"""
+    from reportlab.pdfgen import canvas
+
+    mask = "auto" if filename.lower().endswith(".png") else None
+    registry._entry(filename, mask)
+
+    def run(draw):
+        best = float("inf")
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            c = canvas.Canvas(io.BytesIO(), pagesize=_A4)
+            if draw:
+                registry.draw_image(c, filename, 0, 0, 100, 100, mask=mask)
+            c.showPage()
+            c.save()
+            best = min(best, time.perf_counter() - t0)
+        return best
+
+    return max(0.0, run(True) - run(False)) * 1000.0
+
+
+def _embedded_bytes(registry: AssetRegistry, filename: str) -> int:
+    mask = "auto" if filename.lower().endswith(".png") else None
+    entry = registry._entry(filename, mask)
+    n = len(entry.xobj.streamContent)
+    if entry.smask is not None:
+        n += len(entry.smask.streamContent)
+    return n
+
+
+def _load_ms(registry: AssetRegistry, filename: str) -> float:
+    """まだ何も読んでいないレジストリで、1枚を XObject にするまで"""
+    mask = "auto" if filename.lower().endswith(".png") else None
+    t0 = time.perf_counter()
+    registry._entry(filename, mask)
+    return (time.perf_counter() - t0) * 1000.0
+
+
+def _manifest_outputs(manifest_path: str) -> set:
+    """前回の manifest に載っている出力ファイル名（読めなければ空）"""
+    try:
+        with open(manifest_path, encoding="utf-8") as f:
+            assets = json.load(f).get("assets", {})
+    except (OSError, ValueError, AttributeError):
+        return set()
+    names = set()
+    for info in assets.values() if isinstance(assets, dict) else ():
+        for field in ("stream", "smask"):
+            name = info.get(field) if isinstance(info, dict) else None
+            if isinstance(name, str) and os.path.basename(name) == name:
+                names.add(name)
+    return names
+
+
+def build(assets_dir: str, out_dir: str, dpi: int, quality: int, profile=None,
+          repeat=5, out=sys.stdout) -> dict:
+    """assets_dir の画像を out_dir に書き出し、manifest を返す（古い出力は消す）"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, MANIFEST_NAME)
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "profile": profile,
+        "dpi": dpi,
+        "quality": quality,
+        "created_at": time.time(),
+        "assets": {},
+    }
+    written = {MANIFEST_NAME}
+    previous = _manifest_outputs(manifest_path)
+    filenames = sorted(f for f in os.listdir(assets_dir) if f.lower().endswith(IMAGE_EXTS))
+    for filename in filenames:
+        with open(os.path.join(assets_dir, filename), "rb") as f:
+            source = f.read()
+        stream, smask, info = compile_asset(os.path.join(assets_dir, filename), dpi, quality)
+        stem = os.path.splitext(filename)[0]
+        ext = ".jpg" if info["filter"] == "DCTDecode" else ".rgb.zz"
+        info["source_sha256"] = _sha256(source)
+        info["stream"] = f"{stem}.{_sha256(stream)[:12]}{ext}"
+        info["stream_sha256"] = _sha256(stream)
+        if smask is not None:
+            info["smask"] = f"{stem}.{_sha256(smask)[:12]}.alpha.zz"
+            info["smask_sha256"] = _sha256(smask)
+        for name, data in ((info["stream"], stream), (info.get("smask"), smask)):
+            if name is None:
+                continue
+            written.add(name)
+            tmp = os.path.join(out_dir, name + ".tmp")
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, os.path.join(out_dir, name))
+        manifest["assets"][filename] = info
+
+    tmp = manifest_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_path)
+    # 古い出力の掃除：--out が元画像のディレクトリなどを指していても、build の出力以外には触れない
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if name in written or not os.path.isfile(path) or os.path.islink(path):
+            continue
+        if name in previous or _COMPILED_NAME.fullmatch(name):
+            os.remove(path)
+
+    # 効果の確認：元の画像と比べて、PDF に載るバイト数・読み込み・1文書あたりの埋め込み時間
+    before = AssetRegistry(assets_dir)
+    after = AssetRegistry(assets_dir, manifest_path)
+    print(f"profile={profile} dpi={dpi} quality={quality}  -> {manifest_path}", file=out)
+    print(f"{'asset':<24}{'px':>11}{'source':>10}{'before':>10}{'after':>10}{'saved':>7}"
+          f"{'load ms':>16}{'embed ms/doc':>16}", file=out)
+    totals = [0, 0, 0]
+    for filename in filenames:
+        info = manifest["assets"][filename]
+        src = os.path.getsize(os.path.join(assets_dir, filename))
+        b, a = _embedded_bytes(before, filename), _embedded_bytes(after, filename)
+        info["bytes_before"], info["bytes_after"] = b, a
+        lb = _load_ms(AssetRegistry(assets_dir), filename)
+        la = _load_ms(AssetRegistry(assets_dir, manifest_path), filename)
+        eb, ea = _embed_ms(before, filename, repeat), _embed_ms(after, filename, repeat)
+        totals[0] += src
+        totals[1] += b
+        totals[2] += a
+        print(f"{filename:<24}{info['width']:>5}x{info['height']:<5}{src:>10,}{b:>10,}{a:>10,}"
+              f"{1 - a / b:>7.0%}{lb:>7.1f} ->{la:>6.1f}{eb:>7.2f} ->{ea:>6.2f}", file=out)
+    print(f"{'total':<35}{totals[0]:>10,}{totals[1]:>10,}{totals[2]:>10,}"
+          f"{1 - totals[2] / max(1, totals[1]):>7.0%}", file=out)
+
+    # before / after を manifest にも残す（ハッシュには関係しない）
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, manifest_path)
+    return manifest
+
+
+def main(argv=None):
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    assets_dir = os.path.join(base_dir, "public", "assets")
+
+    parser = argparse.ArgumentParser(prog="python -m assets")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="背景・アイコンを目標 DPI / 画質で PDF 用ストリームに変換する")
+    p_build.add_argument("--profile", default=DEFAULT_PROFILE, choices=sorted(PROFILES))
+    p_build.add_argument("--dpi", type=int, help="プロファイルの DPI を上書き")
+    p_build.add_argument("--quality", type=int, help="プロファイルの JPEG 画質を上書き")
+    p_build.add_argument("--assets-dir", default=assets_dir)
+    p_build.add_argument("--out", help=f"出力先（既定：<assets-dir>/{DEFAULT_COMPILED_DIR}）")
+    p_build.add_argument("--repeat", type=int, default=5, help="埋め込み時間の計測回数（最小値を使う）")
+    args = parser.parse_args(argv)
+
+    dpi, quality = PROFILES[args.profile]
+    build(
+        args.assets_dir,
+        args.out or os.path.join(args.assets_dir, DEFAULT_COMPILED_DIR),
+        args.dpi or dpi,
+        args.quality or quality,
+        profile=args.profile,
+        repeat=args.repeat,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""
+一括生成：複数ペアの PDF をプロセスプールで並列に作り、ZIP でストリーミング返却
+
+・プールに同時に投げる件数を max_in_flight で抑える → 件数が多くてもメモリは一定
+・PDF が1件できるたびに ZIP のエントリとして書き出し、すぐクライアントへ流す
+・最後に manifest.json（各アイテムの成否・エラー内容）を入れる
+・子プロセスが落ちてプールが壊れたら（BrokenProcessPool）、その時点で流していた分はエラーにして
+  executor_fn(broken=プール) で作り直したプールで続ける
+"""
+import json
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+class _ZipSink:
+    """ZipFile の書き込み先。seek できないストリームとして扱わせ、書かれた分を都度取り出す"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_reports_zip(jobs, render_fn, executor_fn, max_in_flight=4, cache=None):
+    """
+    jobs: {"index", "filename", "params", "key"}（正常）または {"index", "error"}（入力エラー）の list
+    render_fn: params → PDF bytes（プロセスプールで実行される、pickle 可能な関数）
+    executor_fn: () → プール、(broken=壊れたプール) → 作り直したプール
+    cache: ReportCache（あればプール前に引き、生成結果も入れる）
+    ZIP のバイト列を少しずつ yield する
+    """
+    sink = _ZipSink()
+    zf = zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED)
+    manifest = []
+    pending = {}   # future → job
+    queue = list(reversed(jobs))
+    executor = executor_fn()
+
+    def write_entry(job, pdf):
+        zf.writestr(job["filename"], pdf)
+        manifest.append({
+            "index": job["index"],
+            "file": job["filename"],
+            "status": "ok",
+            "bytes": len(pdf),
+        })
+
+    def write_error(job, message):
+        manifest.append({
+            "index": job["index"],
+            "file": job.get("filename"),
+            "status": "error",
+            "error": message,
+        })
+
+    while queue or pending:
+        # 空きがある分だけプールに投げる（キャッシュにあるものはその場で書く）
+        while queue and len(pending) < max_in_flight:
+            job = queue.pop()
+            if "error" in job:
+                write_error(job, job["error"])
+                continue
+            pdf = cache.get(job["key"]) if cache is not None else None
+            if pdf is not None:
+                write_entry(job, pdf)
+                yield sink.drain()
+                continue
+            try:
+                fut = executor.submit(render_fn, job["params"])
+            except BrokenProcessPool:
+                executor = executor_fn(broken=executor)
+                fut = executor.submit(render_fn, job["params"])
+            pending[fut] = job
+
+        if not pending:
+            continue
+
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            job = pending.pop(fut)
+            try:
+                pdf = fut.result()
+            except BrokenProcessPool as e:
+                write_error(job, f"{type(e).__name__}: {e}")
+                executor = executor_fn(broken=executor)
+                continue
+            except Exception as e:
+                write_error(job, f"{type(e).__name__}: {e}")
+                continue
+            if cache is not None:
+                cache.put(job["key"], pdf)
+            write_entry(job, pdf)
+            yield sink.drain()
+
+    manifest.sort(key=lambda m: m["index"])
+    zf.writestr(
+        "manifest.json",
+        json.dumps(manifest, ensure_ascii=False, indent=2),
+    )
+    zf.close()
+    yield sink.drain()
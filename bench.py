@@ -0,0 +1,330 @@
+"""
+レポート生成パイプラインのベンチマーク（オフライン・Flask のテストクライアント経由）
+
+    python -m bench run  [-o bench_result.json] [--pairs 40] [--repeat 3]
+    python -m bench run  --baseline bench_baseline.json [--threshold 0.25]
+    python -m bench compare bench_result.json bench_baseline.json [--threshold 0.25]
+
+・固定のコーパス（乱数の種を固定した出生データのペア）で各段階を計測する
+    chart            compute_core_from_birth（星盤キャッシュ・地名キャッシュを毎回クリア）
+    texts_pageN      build_pageN_texts（インデックスを使わない従来の組み立て）
+    select_texts     select_report_texts（インデックス経由）
+    draw_pageN       draw_pageN_*（1ページを描いて showPage まで）
+    serialize        canvas.save()（3〜8ページを描いた canvas）
+    render           render_report_pdf（8ページ通し）
+    http_generate    GET /api/generate_report（レポートキャッシュなし）
+    http_cached      GET /api/generate_report（メモリキャッシュにヒット）
+・各段階の mean / p50 / p99（ms）と、1回あたりの確保メモリのピーク（KiB, tracemalloc）を出す
+・baseline と比べて、どれかの段階が threshold（既定 25%）を超えて遅くなったら終了コード 1
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from timing import percentile
+
+DEFAULT_PAIRS = 40
+DEFAULT_REPEAT = 3
+DEFAULT_THRESHOLD = 0.25
+DEFAULT_METRIC = "p50_ms"
+
+# 地名辞典・タイムゾーンの分岐も通るように出生地もばらけさせる
+_PLACES = ("Tokyo", "大阪", "札幌市", "福岡県福岡市", "那覇", "New York", "London", "")
+_SEED = 20240101
+
+
+def make_corpus(n: int) -> list:
+    """generate_report と同じ形の引数 dict を n 件（毎回同じ内容）"""
+    rng = random.Random(_SEED)
+    names = ("太郎", "花子", "さくら", "健", "Alexander", "Maria", "山田花子", "佐藤一郎")
+    corpus = []
+    for _ in range(n):
+        pair = {}
+        for side in ("your", "partner"):
+            pair[f"{side}_name"] = rng.choice(names)
+            pair[f"{side}_dob"] = "%d-%02d-%02d" % (
+                rng.randint(1945, 2008), rng.randint(1, 12), rng.randint(1, 28)
+            )
+            pair[f"{side}_time"] = "%02d:%02d" % (rng.randint(0, 23), rng.randint(0, 59))
+            pair[f"{side}_place"] = rng.choice(_PLACES)
+        pair["date"] = "2025-01-01"
+        corpus.append(pair)
+    return corpus
+
+
+def summarize(samples: list) -> dict:
+    ms = sorted(s * 1000.0 for s in samples)
+    return {
+        "n": len(ms),
+        "mean_ms": round(statistics.fmean(ms), 4),
+        "p50_ms": round(percentile(ms, 50), 4),
+        "p99_ms": round(percentile(ms, 99), 4),
+    }
+
+
+class Bench:
+    def __init__(self, app_module, corpus, repeat):
+        self.A = app_module
+        self.corpus = corpus
+        self.repeat = repeat
+        self.stages = {}
+
+        A = app_module
+        self.params = [A.parse_report_params(p) for p in corpus]
+        self.cores = [
+            (
+                A.compute_core_from_birth(p["your_dob"], p["your_time"], p["your_place"]),
+                A.compute_core_from_birth(p["partner_dob"], p["partner_time"], p["partner_place"]),
+            )
+            for p in self.params
+        ]
+        self.texts = [
+            A.select_report_texts(p["your_name"], p["partner_name"], yc, pc)
+            for p, (yc, pc) in zip(self.params, self.cores)
+        ]
+
+    # ------------------------------------------------------------------
+    def measure(self, name, items, fn, setup=None):
+        """
+        items の各要素で fn(item) を repeat 回計測する
+        setup(item) があれば計測の外で先に呼び、その戻り値を fn に渡す
+        """
+        for item in items[:2]:
+            fn(setup(item) if setup else item)    # 空回し
+
+        samples = []
+        for _ in range(self.repeat):
+            for item in items:
+                arg = setup(item) if setup else item
+                t0 = time.perf_counter()
+                fn(arg)
+                samples.append(time.perf_counter() - t0)
+
+        # 確保メモリは別に数回だけ測る（tracemalloc 中は遅くなるので時間とは分ける）
+        peaks = []
+        for item in items[: min(5, len(items))]:
+            arg = setup(item) if setup else item
+            tracemalloc.start()
+            base, _ = tracemalloc.get_traced_memory()
+            fn(arg)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peaks.append(peak - base)
+
+        result = summarize(samples)
+        result["alloc_peak_kib"] = round(statistics.fmean(peaks) / 1024.0, 1) if peaks else 0.0
+        self.stages[name] = result
+        return result
+
+    def new_canvas(self, _item=None):
+        from reportlab.lib.pagesizes import A4
+        from reportlab.pdfgen import canvas
+
+        return canvas.Canvas(io.BytesIO(), pagesize=A4, invariant=1)
+
+    # ------------------------------------------------------------------
+    def run_all(self):
+        A = self.A
+        pairs = list(zip(self.params, self.cores, self.texts))
+        # ページ単体の描画も計るので、埋め込みフォントは先に読み込んでおく
+        A.ensure_report_fonts()
+
+        # ---- 星盤 ----
+        def chart(p):
+            A._calc_chart_lons.cache_clear()
+            A.GAZETTEER.resolve.cache_clear()
+            A.compute_core_from_birth(p["your_dob"], p["your_time"], p["your_place"])
+            A.compute_core_from_birth(p["partner_dob"], p["partner_time"], p["partner_place"])
+
+        self.measure("chart", self.params, chart)
+
+        # ---- 文章 ----
+        for page, (builder, _, _) in A.TEXT_INDEX_PAGES.items():
+            self.measure(
+                f"texts_page{page}",
+                pairs,
+                lambda it, b=builder: b(it[0]["your_name"], it[0]["partner_name"], *it[1]),
+            )
+        self.measure(
+            "select_texts",
+            pairs,
+            lambda it: A.select_report_texts(it[0]["your_name"], it[0]["partner_name"], *it[1]),
+        )
+
+        # ---- 描画（1ページずつ、毎回新しい canvas に）----
+        drawers = {
+            3: lambda c, p, cores, t: A.draw_page3_basic_and_synastry(
+                c, p["your_name"], p["partner_name"], cores[0], cores[1], *t[3]
+            ),
+            4: lambda c, p, cores, t: A.draw_page4_communication(c, *t[4]),
+            5: lambda c, p, cores, t: A.draw_page5_points(c, *t[5]),
+            6: lambda c, p, cores, t: A.draw_page6_support(c, *A.page6_layout_texts(t[6])),
+            7: lambda c, p, cores, t: A.draw_page7_advice(c, *t[7]),
+            8: lambda c, p, cores, t: A.draw_page8_summary(c, t[8]),
+        }
+        for page, draw in drawers.items():
+            self.measure(
+                f"draw_page{page}",
+                pairs,
+                lambda arg, d=draw: d(*arg),
+                setup=lambda it: (self.new_canvas(), *it),
+            )
+
+        # ---- 書き出し（3〜8ページを描いた canvas の save）----
+        def filled_canvas(it):
+            c = self.new_canvas()
+            for draw in drawers.values():
+                draw(c, *it)
+            return c
+
+        self.measure("serialize", pairs, lambda c: c.save(), setup=filled_canvas)
+
+        # ---- 通し ----
+        sizes = []
+
+        def render(p):
+            buf = io.BytesIO()
+            A.render_report_pdf(p, buf)
+            sizes.append(buf.tell())
+
+        self.measure("render", self.params, render)
+
+        # ---- HTTP（Flask テストクライアント）----
+        client = A.app.test_client()
+        cache = A.REPORT_CACHE
+        saved = (cache.max_items, cache.disk_dir)
+
+        cache.max_items, cache.disk_dir = 0, None
+        self.measure(
+            "http_generate",
+            self.corpus,
+            lambda q: client.get("/api/generate_report", query_string=q).get_data(),
+        )
+
+        cache.max_items = max(saved[0], len(self.corpus))
+        for q in self.corpus:
+            client.get("/api/generate_report", query_string=q).get_data()
+        self.measure(
+            "http_cached",
+            self.corpus,
+            lambda q: client.get("/api/generate_report", query_string=q).get_data(),
+        )
+        cache.max_items, cache.disk_dir = saved
+
+        return {
+            "meta": {
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "pairs": len(self.corpus),
+                "repeat": self.repeat,
+                "report_version": A.REPORT_VERSION,
+            },
+            "stages": self.stages,
+            "pdf_bytes": {
+                "mean": round(statistics.fmean(sizes)),
+                "min": min(sizes),
+                "max": max(sizes),
+            },
+        }
+
+
+# ------------------------------------------------------------------
+# 比較
+# ------------------------------------------------------------------
+def compare(result: dict, baseline: dict, threshold: float, metric=DEFAULT_METRIC):
+    """→ (表示用の行 list, 悪化した段階名 list)"""
+    lines = [f"{'stage':<16}{'baseline':>12}{'current':>12}{'change':>10}"]
+    regressions = []
+    for name, cur in result["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if base is None or not base.get(metric):
+            lines.append(f"{name:<16}{'-':>12}{cur[metric]:>12.3f}{'new':>10}")
+            continue
+        change = cur[metric] / base[metric] - 1.0
+        mark = ""
+        if change > threshold:
+            regressions.append(name)
+            mark = "  << REGRESSION"
+        lines.append(
+            f"{name:<16}{base[metric]:>12.3f}{cur[metric]:>12.3f}{change:>+10.1%}{mark}"
+        )
+
+    base_size = baseline.get("pdf_bytes", {}).get("mean")
+    if base_size:
+        cur_size = result["pdf_bytes"]["mean"]
+        lines.append(f"{'pdf_bytes':<16}{base_size:>12}{cur_size:>12}{cur_size / base_size - 1.0:>+10.1%}")
+    return lines, regressions
+
+
+def print_result(result: dict):
+    print(f"{'stage':<16}{'mean':>10}{'p50':>10}{'p99':>10}{'alloc KiB':>12}")
+    for name, st in result["stages"].items():
+        print(
+            f"{name:<16}{st['mean_ms']:>10.3f}{st['p50_ms']:>10.3f}"
+            f"{st['p99_ms']:>10.3f}{st['alloc_peak_kib']:>12.1f}"
+        )
+    pb = result["pdf_bytes"]
+    print(f"pdf bytes: mean {pb['mean']}  min {pb['min']}  max {pb['max']}")
+
+
+def _load_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_run = sub.add_parser("run", help="計測して JSON に保存")
+    p_run.add_argument("-o", "--output", default="bench_result.json")
+    p_run.add_argument("--pairs", type=int, default=DEFAULT_PAIRS)
+    p_run.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    p_run.add_argument("--baseline", help="比較する baseline の JSON")
+    p_run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    p_run.add_argument("--metric", default=DEFAULT_METRIC, choices=("mean_ms", "p50_ms", "p99_ms"))
+
+    p_cmp = sub.add_parser("compare", help="保存済みの結果 2 つを比較")
+    p_cmp.add_argument("result")
+    p_cmp.add_argument("baseline")
+    p_cmp.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    p_cmp.add_argument("--metric", default=DEFAULT_METRIC, choices=("mean_ms", "p50_ms", "p99_ms"))
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "run":
+        # キャッシュの設定は import 前に決める（ディスク層・ジョブには触らない）
+        os.environ["REPORT_CACHE_DIR"] = ""
+        import app as app_module
+
+        result = Bench(app_module, make_corpus(args.pairs), args.repeat).run_all()
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print_result(result)
+        print(f"saved: {args.output}")
+        if not args.baseline:
+            return 0
+        baseline = _load_json(args.baseline)
+    else:
+        result = _load_json(args.result)
+        baseline = _load_json(args.baseline)
+
+    lines, regressions = compare(result, baseline, args.threshold, args.metric)
+    print()
+    print("\n".join(lines))
+    if regressions:
+        print(f"\nregressed beyond {args.threshold:.0%} ({args.metric}): {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,541 @@
+"""
+星盤（ホイール）のベクター描画
+
+・chart_base.png と惑星アイコン（PNG）の代わりに、円・区切り線・度の目盛り（1°/5°/10°）・星座記号・ハウス番号・惑星記号を
+  PDF のパスで描く（拡大しても荒れない・画像を埋め込まないので PDF も小さい）
+・ホイールは 600×600 の座標系（chart_base.png のピクセルと同じ位置）、記号は 1×1 の箱で定義する
+・星座記号・惑星記号は下の線画の定義から、数字と「AS」は Noto Sans JP のアウトライン（fontTools）から作る
+・ホイール本体と惑星記号 5 種は、プロセス内で1回だけ描画命令を組み立てて圧縮しておき、
+  文書ごとには Form XObject として1回登録するだけ（ページからは q … cm /FormXob.xxx Do Q で参照）
+・プレビュー（Pillow）用には同じ描画命令をそのままラスタライズする（ChartForms.image）
+  → サムネイルの星盤も PDF と同じ形になる
+"""
+import io
+import math
+import os
+import zlib
+
+from PIL import Image, ImageChops, ImageDraw
+from reportlab.lib.rl_accel import fp_str
+from reportlab.pdfbase import pdfdoc
+from reportlab.pdfgen import canvas
+
+import rl_compat
+from fonts import FACES, FTFont
+
+if FTFont is not None:
+    from fontTools.pens.basePen import BasePen
+else:       # fontTools がなければ使えない（app 側は PNG の星盤のまま）
+    BasePen = object
+
+WHEEL_UNITS = 600.0
+GLYPH_UNITS = 100.0
+GOLD = (167 / 255.0, 128 / 255.0, 63 / 255.0)
+BLACK = (0.0, 0.0, 0.0)
+
+# 円（半径, 線幅）
+_WHEEL_CIRCLES = (
+    (59, 1.0), (79, 2.0), (98, 1.0), (201, 1.0), (213, 1.0),
+    (217, 2.0), (287, 2.0), (290, 1.0),
+)
+_DIVISION = (79, 287)         # 区切り線の内側・外側の半径
+# 度の目盛り（201〜213 の帯に、外側の円から内向き）：(間隔°, 内側の半径, 線幅)
+# 長い目盛りの位置には短い目盛りを重ねない。30° ごとは区切り線があるので描かない
+_TICK_OUTER = 213
+_TICKS = ((10, 204, 0.8), (5, 207, 0.6), (1, 210, 0.4))
+_SIGN_RADIUS = 252
+_SIGN_SIZE = 46
+_SIGN_LINE = 0.055            # 記号の線幅（記号の大きさに対する比）
+_HOUSE_RADIUS = 88.5
+_HOUSE_FONT_SIZE = 12
+_PLANET_LINE = 0.035
+
+# ラスタライズは縦横この倍率で描いてから縮める（細い目盛りもかすれて残る）
+_RASTER_SUPERSAMPLE = 4
+_CURVE_PX = 3.0               # ベジェ曲線を折れ線にするときの1区間のおよその長さ（描く側の px）
+
+# ----------------------------------------------------------------------
+# 記号の線画（1×1 の箱、中心が原点・y は上向き）
+#   ("M", x, y) ("L", x, y) ("C", x1, y1, x2, y2, x3, y3)  … パス
+#   ("O", cx, cy, r)   … 円（線）
+#   ("D", cx, cy, r)   … 塗りつぶしの点
+#   ("A", cx, cy, r, 開始角, 角度) ("AT", …)  … 円弧（A は新しい線、AT は直前の点からつなぐ）
+#   ("Z",)             … 閉じる
+# ----------------------------------------------------------------------
+_HUMPS = (
+    ("M", -0.34, -0.38), ("L", -0.34, 0.18),
+    ("M", -0.34, 0.14), ("C", -0.3, 0.34, -0.1, 0.34, -0.1, 0.14), ("L", -0.1, -0.38),
+    ("M", -0.1, 0.14), ("C", -0.06, 0.34, 0.14, 0.34, 0.14, 0.14),
+)
+
+SIGN_GLYPHS = (
+    # 牡羊座
+    (
+        ("M", -0.38, 0.12), ("C", -0.48, 0.3, -0.36, 0.46, -0.2, 0.44),
+        ("C", -0.05, 0.42, 0.0, 0.25, 0.0, 0.05), ("L", 0.0, -0.45),
+        ("M", 0.38, 0.12), ("C", 0.48, 0.3, 0.36, 0.46, 0.2, 0.44),
+        ("C", 0.05, 0.42, 0.0, 0.25, 0.0, 0.05),
+    ),
+    # 牡牛座
+    (
+        ("O", 0.0, -0.17, 0.24),
+        ("M", -0.42, 0.42), ("C", -0.28, -0.05, 0.28, -0.05, 0.42, 0.42),
+    ),
+    # 双子座
+    (
+        ("M", -0.38, 0.42), ("C", -0.15, 0.3, 0.15, 0.3, 0.38, 0.42),
+        ("M", -0.38, -0.42), ("C", -0.15, -0.3, 0.15, -0.3, 0.38, -0.42),
+        ("M", -0.15, 0.34), ("L", -0.15, -0.34),
+        ("M", 0.15, 0.34), ("L", 0.15, -0.34),
+    ),
+    # 蟹座
+    (
+        ("O", -0.22, 0.1, 0.11),
+        ("M", -0.22, 0.21), ("C", -0.05, 0.33, 0.25, 0.3, 0.42, 0.14),
+        ("O", 0.22, -0.1, 0.11),
+        ("M", 0.22, -0.21), ("C", 0.05, -0.33, -0.25, -0.3, -0.42, -0.14),
+    ),
+    # 獅子座
+    (
+        ("O", -0.24, -0.16, 0.12),
+        ("M", -0.14, -0.1), ("C", -0.3, 0.2, -0.1, 0.44, 0.1, 0.43),
+        ("C", 0.32, 0.42, 0.34, 0.18, 0.2, -0.05),
+        ("C", 0.08, -0.25, 0.12, -0.42, 0.26, -0.42),
+        ("C", 0.34, -0.42, 0.4, -0.36, 0.42, -0.3),
+    ),
+    # 乙女座
+    _HUMPS + (
+        ("L", 0.14, -0.2), ("C", 0.14, -0.36, 0.2, -0.45, 0.3, -0.45),
+        ("M", 0.14, 0.0), ("C", 0.34, 0.12, 0.48, -0.12, 0.3, -0.3),
+        ("C", 0.22, -0.38, 0.08, -0.44, -0.02, -0.45),
+    ),
+    # 天秤座
+    (
+        ("M", -0.42, -0.3), ("L", 0.42, -0.3),
+        ("M", -0.42, -0.1), ("L", -0.15, -0.1),
+        ("C", -0.3, 0.1, -0.2, 0.36, 0.0, 0.36),
+        ("C", 0.2, 0.36, 0.3, 0.1, 0.15, -0.1), ("L", 0.42, -0.1),
+    ),
+    # 蠍座
+    _HUMPS + (
+        ("L", 0.14, -0.28), ("C", 0.14, -0.38, 0.22, -0.4, 0.4, -0.3),
+        ("M", 0.26, -0.22), ("L", 0.4, -0.3), ("L", 0.32, -0.44),
+    ),
+    # 射手座
+    (
+        ("M", -0.4, -0.4), ("L", 0.4, 0.4),
+        ("M", 0.06, 0.4), ("L", 0.4, 0.4), ("L", 0.4, 0.06),
+        ("M", -0.32, 0.02), ("L", 0.02, -0.32),
+    ),
+    # 山羊座
+    (
+        ("M", -0.44, 0.3), ("C", -0.36, 0.38, -0.26, 0.3, -0.22, 0.05),
+        ("L", -0.12, -0.42), ("L", 0.02, 0.2),
+        ("C", 0.08, 0.42, 0.3, 0.36, 0.24, 0.0),
+        ("C", 0.2, -0.3, 0.46, -0.36, 0.42, -0.18),
+        ("C", 0.38, -0.02, 0.16, -0.1, 0.12, -0.3),
+        ("C", 0.1, -0.42, 0.0, -0.46, -0.06, -0.44),
+    ),
+    # 水瓶座
+    (
+        ("M", -0.42, 0.06), ("L", -0.21, 0.22), ("L", 0.0, 0.06), ("L", 0.21, 0.22), ("L", 0.42, 0.06),
+        ("M", -0.42, -0.2), ("L", -0.21, -0.04), ("L", 0.0, -0.2), ("L", 0.21, -0.04), ("L", 0.42, -0.2),
+    ),
+    # 魚座
+    (
+        ("M", -0.36, 0.42), ("C", -0.1, 0.22, -0.1, -0.22, -0.36, -0.42),
+        ("M", 0.36, 0.42), ("C", 0.1, 0.22, 0.1, -0.22, 0.36, -0.42),
+        ("M", -0.24, 0.0), ("L", 0.24, 0.0),
+    ),
+)
+
+
+def _crescent(cx, cy, r_outer, dx, r_inner, mirror=False):
+    """
+    中心 (cx, cy) の円から右へ dx ずらした円を欠いた三日月（左が太い）
+    mirror=True なら左右反転（右が太い）
+    """
+    # 2つの円の交点（外側の円の中心から見た角度と、内側の円の中心から見た角度）
+    x = (r_outer ** 2 - r_inner ** 2 + dx ** 2) / (2 * dx)
+    y = math.sqrt(r_outer ** 2 - x ** 2)
+    a_outer = math.degrees(math.atan2(y, x))
+    a_inner = math.degrees(math.atan2(y, x - dx))
+    # 外側は上の交点から左回りで下の交点へ、内側は下の交点から右回りで上の交点へ
+    arcs = (
+        ("A", 0.0, r_outer, a_outer, 360 - 2 * a_outer),
+        ("AT", dx, r_inner, -a_inner, -(360 - 2 * a_inner)),
+    )
+    ops = []
+    for kind, ox, r, start, extent in arcs:
+        if mirror:
+            ox, start, extent = -ox, 180 - start, -extent
+        ops.append((kind, cx + ox, cy, r, start, extent))
+    ops.append(("Z",))
+    return tuple(ops)
+
+
+PLANET_GLYPHS = {
+    "sun": (("O", 0.0, 0.0, 0.42), ("D", 0.0, 0.0, 0.06)),
+    # 右に膨らむ三日月
+    "moon": _crescent(-0.08, 0.0, 0.42, 0.22, 0.46, mirror=True),
+    "venus": (
+        ("O", 0.0, 0.15, 0.27),
+        ("M", 0.0, -0.12), ("L", 0.0, -0.48),
+        ("M", -0.16, -0.32), ("L", 0.16, -0.32),
+    ),
+    "mars": (
+        ("O", -0.12, -0.12, 0.28),
+        ("M", 0.078, 0.078), ("L", 0.42, 0.42),
+        ("M", 0.18, 0.42), ("L", 0.42, 0.42), ("L", 0.42, 0.18),
+    ),
+}
+
+
+def _draw_strokes(c, ops, line_width, fill=False):
+    """線画の定義を現在の座標系に描く（fill=True なら線と塗り。"D" の点は常に塗り）"""
+    c.setLineWidth(line_width)
+    path = c.beginPath()
+    used = False
+    for op in ops:
+        kind = op[0]
+        if kind == "M":
+            path.moveTo(*op[1:])
+        elif kind == "L":
+            path.lineTo(*op[1:])
+        elif kind == "C":
+            path.curveTo(*op[1:])
+        elif kind in ("A", "AT"):
+            _, cx, cy, r, start, extent = op
+            arc = path.arc if kind == "A" else path.arcTo
+            arc(cx - r, cy - r, cx + r, cy + r, start, extent)
+        elif kind == "Z":
+            path.close()
+        elif kind == "O":
+            path.circle(*op[1:])
+        elif kind == "D":
+            c.circle(*op[1:], stroke=0, fill=1)
+            continue
+        used = True
+    if used:
+        c.drawPath(path, stroke=1, fill=1 if fill else 0)
+
+
+# ----------------------------------------------------------------------
+# フォントのアウトライン（数字・AS）
+# ----------------------------------------------------------------------
+class _PathPen(BasePen):
+    """fontTools のペン → reportlab のパス（2次ベジェは BasePen が3次に直す）"""
+
+    def __init__(self, glyph_set, path, scale, dx, dy):
+        super().__init__(glyph_set)
+        self.path = path
+        self.scale = scale
+        self.dx = dx
+        self.dy = dy
+
+    def _pt(self, pt):
+        return self.dx + pt[0] * self.scale, self.dy + pt[1] * self.scale
+
+    def _moveTo(self, pt):
+        self.path.moveTo(*self._pt(pt))
+
+    def _lineTo(self, pt):
+        self.path.lineTo(*self._pt(pt))
+
+    def _curveToOne(self, p1, p2, p3):
+        self.path.curveTo(*self._pt(p1), *self._pt(p2), *self._pt(p3))
+
+    def _closePath(self):
+        self.path.close()
+
+
+class _Outlines:
+    def __init__(self, font_path: str):
+        font = FTFont(font_path, lazy=True)
+        self.glyph_set = font.getGlyphSet()
+        self.cmap = font.getBestCmap()
+        self.upm = font["head"].unitsPerEm
+        # 数字の高さ（縦方向の中心合わせ用）
+        self.digit_height = font["OS/2"].sCapHeight / self.upm if hasattr(font["OS/2"], "sCapHeight") else 0.73
+
+    def width(self, text: str, size: float) -> float:
+        return sum(self.glyph_set[self.cmap[ord(ch)]].width for ch in text) * size / self.upm
+
+    def draw(self, c, text: str, x: float, y: float, size: float):
+        """(x, y) をベースラインの左端として text を塗りで描く"""
+        path = c.beginPath()
+        scale = size / self.upm
+        for ch in text:
+            glyph = self.glyph_set[self.cmap[ord(ch)]]
+            glyph.draw(_PathPen(self.glyph_set, path, scale, x, y))
+            x += glyph.width * scale
+        c.drawPath(path, stroke=0, fill=1, fillMode=canvas.FILL_NON_ZERO)
+
+    def draw_centred(self, c, text: str, x: float, y: float, size: float):
+        """(x, y) を文字の中心として描く"""
+        self.draw(c, text, x - self.width(text, size) / 2, y - self.digit_height * size / 2, size)
+
+
+# ----------------------------------------------------------------------
+# 描画命令の組み立て（プロセス内で1回）
+# ----------------------------------------------------------------------
+def _record(draw) -> str:
+    """draw(c) がキャンバスに積んだ描画命令を文字列にする"""
+    c = canvas.Canvas(io.BytesIO())
+    c.setLineCap(1)
+    c.setLineJoin(1)
+    draw(c)
+    return "\n".join(c._code)
+
+
+def _polar(r, angle_deg, center=WHEEL_UNITS / 2):
+    """0° が 12 時の方向、時計回り（app.polar_to_xy と同じ向き）"""
+    theta = math.radians(90 - angle_deg)
+    return center + r * math.cos(theta), center + r * math.sin(theta)
+
+
+def _wheel_code(digits: _Outlines) -> str:
+    def draw(c):
+        c.setStrokeColorRGB(*GOLD)
+        c.setFillColorRGB(*GOLD)
+        mid = WHEEL_UNITS / 2
+
+        for r, width in _WHEEL_CIRCLES:
+            c.setLineWidth(width)
+            c.circle(mid, mid, r, stroke=1, fill=0)
+
+        c.setLineWidth(1.0)
+        for i in range(12):
+            c.line(*_polar(_DIVISION[0], i * 30), *_polar(_DIVISION[1], i * 30))
+
+        # 目盛りは太さごとに1本のパスにまとめて描く（1°/5°/10° の3回だけ stroke）
+        for step, r_inner, width in _TICKS:
+            longer = [other for other, _, _ in _TICKS if other > step] + [30]
+            p = c.beginPath()
+            for deg in range(0, 360, step):
+                if any(deg % other == 0 for other in longer):
+                    continue
+                p.moveTo(*_polar(_TICK_OUTER, deg))
+                p.lineTo(*_polar(r_inner, deg))
+            c.setLineWidth(width)
+            c.drawPath(p, stroke=1, fill=0)
+
+        # 中央の三日月（chart_base.png と同じ左向き）
+        _draw_strokes(c, _crescent(mid, mid, 58, 23, 54), 0.5, fill=True)
+
+        scale = _SIGN_SIZE
+        for i, glyph in enumerate(SIGN_GLYPHS):
+            x, y = _polar(_SIGN_RADIUS, 15 + i * 30)
+            c.saveState()
+            c.translate(x, y)
+            c.scale(scale, scale)
+            _draw_strokes(c, glyph, _SIGN_LINE)
+            c.restoreState()
+
+        for house in range(1, 13):
+            x, y = _polar(_HOUSE_RADIUS, 15 + (house - 1) * 30)
+            digits.draw_centred(c, str(house), x, y, _HOUSE_FONT_SIZE)
+        digits.draw(c, "0°", mid - digits.width("0", 9) / 2, WHEEL_UNITS - 7, 9)
+
+    return _record(draw)
+
+
+def _planet_code(ops=None, text=None, outlines=None) -> str:
+    def draw(c):
+        c.setStrokeColorRGB(*BLACK)
+        c.setFillColorRGB(*BLACK)
+        c.scale(GLYPH_UNITS, GLYPH_UNITS)
+        if ops is not None:
+            _draw_strokes(c, ops, _PLANET_LINE)
+        else:
+            size = 0.8 / outlines.width(text, 1.0)    # 箱の幅の 8 割
+            outlines.draw_centred(c, text, 0.0, 0.0, min(size, 0.62))
+
+    return _record(draw)
+
+
+# ----------------------------------------------------------------------
+# ラスタライズ（プレビュー用）
+# ----------------------------------------------------------------------
+def _bezier(p0, p1, p2, p3):
+    """p0 の次から p3 までの折れ線の点（分割数は制御点をつないだ長さから決める）"""
+    hull = math.dist(p0, p1) + math.dist(p1, p2) + math.dist(p2, p3)
+    steps = max(2, min(64, math.ceil(hull / _CURVE_PX)))
+    out = []
+    for i in range(1, steps + 1):
+        t = i / steps
+        u = 1 - t
+        out.append((
+            u * u * u * p0[0] + 3 * u * u * t * p1[0] + 3 * u * t * t * p2[0] + t * t * t * p3[0],
+            u * u * u * p0[1] + 3 * u * u * t * p1[1] + 3 * u * t * t * p2[1] + t * t * t * p3[1],
+        ))
+    return out
+
+
+def rasterize(code: str, bbox, size) -> Image.Image:
+    """
+    _record が作った描画命令を Pillow で描いた RGBA 画像（size = (幅, 高さ) px、bbox が画像全体）
+    使う演算子だけ（q Q cm w RG rg J j / m l c h re n / S f f* B B*）に対応する
+    塗りはすべて偶奇規則（記号・数字のアウトラインは重ならないので非ゼロ規則と同じ結果）
+    """
+    x0, y0, x1, y1 = bbox
+    width, height = (max(1, round(v * _RASTER_SUPERSAMPLE)) for v in size)
+    sx, sy = width / (x1 - x0), height / (y1 - y0)
+    img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+
+    ctm = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+    line_width = 1.0
+    stroke = fill = (0, 0, 0, 255)
+    stack = []
+    subpaths = []       # [[点, ...], 閉じたか]（点は画像の px）
+    operands = []
+
+    def to_px(x, y):
+        a, b, c, d, e, f = ctm
+        ux, uy = a * x + c * y + e, b * x + d * y + f
+        return (ux - x0) * sx, (y1 - uy) * sy
+
+    def do_stroke():
+        a, b, c, d, _, _ = ctm
+        px = max(1, round(line_width * math.sqrt(abs(a * d - b * c)) * sx))
+        for points, closed in subpaths:
+            if closed:
+                points = points + points[:1]
+            if len(points) > 1:
+                draw.line(points, fill=stroke, width=px, joint="curve")
+
+    def do_fill():
+        mask = Image.new("1", img.size)
+        for points, _ in subpaths:
+            if len(points) > 2:
+                part = Image.new("1", img.size)
+                ImageDraw.Draw(part).polygon(points, fill=1)
+                mask = ImageChops.logical_xor(mask, part)
+        img.paste(fill, mask=mask)
+
+    for token in code.split():
+        try:
+            operands.append(float(token))
+            continue
+        except ValueError:
+            pass
+        args, operands = operands, []
+        if token == "q":
+            stack.append((ctm, line_width, stroke, fill))
+        elif token == "Q":
+            ctm, line_width, stroke, fill = stack.pop()
+        elif token == "cm":
+            a, b, c, d, e, f = args
+            A, B, C, D, E, F = ctm
+            ctm = (a * A + b * C, a * B + b * D, c * A + d * C, c * B + d * D,
+                   e * A + f * C + E, e * B + f * D + F)
+        elif token == "w":
+            line_width = args[0]
+        elif token in ("RG", "rg"):
+            color = tuple(round(v * 255) for v in args) + (255,)
+            if token == "RG":
+                stroke = color
+            else:
+                fill = color
+        elif token in ("J", "j"):
+            pass    # 線端・角はいつも丸（draw.line の joint="curve"）
+        elif token == "m":
+            subpaths.append([[to_px(*args)], False])
+        elif token == "l":
+            subpaths[-1][0].append(to_px(*args))
+        elif token == "c":
+            points = subpaths[-1][0]
+            points += _bezier(points[-1], to_px(*args[0:2]), to_px(*args[2:4]), to_px(*args[4:6]))
+        elif token == "h":
+            subpaths[-1][1] = True
+        elif token == "re":
+            x, y, w, h = args
+            subpaths.append([[to_px(x, y), to_px(x + w, y), to_px(x + w, y + h), to_px(x, y + h)], True])
+        elif token in ("S", "f", "f*", "B", "B*", "n"):
+            if token in ("f", "f*", "B", "B*"):
+                do_fill()
+            if token in ("S", "B", "B*"):
+                do_stroke()
+            subpaths = []
+        else:
+            raise ValueError(f"unsupported operator in chart code: {token}")
+
+    # 縁が黒ずまないよう、事前乗算した状態で縮める（preview.py の素材と同じ）
+    return img.convert("RGBa").resize(tuple(size), Image.LANCZOS).convert("RGBA")
+
+
+class _Form:
+    __slots__ = ("name", "bbox", "stream", "code_bytes")
+
+    def __init__(self, name, bbox, code: str):
+        self.bbox = bbox
+        data = code.encode("latin-1")
+        self.code_bytes = len(data)
+        self.stream = zlib.compress(data, 9)
+        self.name = f"{name}_{pdfdoc._digester(self.stream)[:8]}"
+
+
+def available(assets_dir: str) -> bool:
+    """fontTools・フォントがあり、reportlab が確認済みの版のときだけ（Form の登録に内部 API を使う）"""
+    return rl_compat.INTERNALS and FTFont is not None and all(
+        os.path.exists(os.path.join(assets_dir, FACES[face])) for face in ("regular", "bold")
+    )
+
+
+class ChartForms:
+    """ホイールと惑星記号の Form XObject（内容はプロセス内で1回だけ作る）"""
+
+    def __init__(self, assets_dir: str):
+        digits = _Outlines(os.path.join(assets_dir, FACES["regular"]))
+        bold = _Outlines(os.path.join(assets_dir, FACES["bold"]))
+        half = GLYPH_UNITS / 2
+        glyph_box = (-half, -half, half, half)
+
+        self.wheel = _Form("ChartWheel", (0, 0, WHEEL_UNITS, WHEEL_UNITS), _wheel_code(digits))
+        self.planets = {
+            key: _Form(f"Planet_{key}", glyph_box, _planet_code(ops))
+            for key, ops in PLANET_GLYPHS.items()
+        }
+        self.planets["asc"] = _Form("Planet_asc", glyph_box, _planet_code(text="AS", outlines=bold))
+
+    def _attach(self, c, form: _Form) -> str:
+        """文書 c にまだなければ Form XObject を登録し、内部名を返す"""
+        doc = c._doc
+        reg_name = doc.getXObjectName(form.name)
+        if doc.idToObject.get(reg_name) is None:
+            xobj = pdfdoc.PDFFormXObject(*form.bbox)
+            # 圧縮済みのストリームをそのまま使う（Filter が付いていれば再圧縮されない）
+            stream = pdfdoc.PDFStream(content=form.stream)
+            stream.dictionary["Filter"] = pdfdoc.PDFArray([pdfdoc.PDFName("FlateDecode")])
+            stream.__Comment__ = "xobject form stream"
+            xobj.Contents = stream
+            xobj.hasImages = 0
+            doc.addForm(form.name, xobj)
+        c._formsinuse.append(form.name)
+        return reg_name
+
+    def _place(self, c, form: _Form, x, y, scale):
+        reg_name = self._attach(c, form)
+        c._code.append("q\n%s cm\n/%s Do\nQ" % (fp_str(scale, 0, 0, scale, x, y), reg_name))
+
+    def draw_wheel(self, c, x, y, size):
+        """左下 (x, y)、一辺 size の星盤（chart_base.png と同じ置き方）"""
+        self._place(c, self.wheel, x, y, size / WHEEL_UNITS)
+
+    def draw_planet(self, c, planet: str, cx, cy, size):
+        """中心 (cx, cy)、一辺 size の惑星記号"""
+        self._place(c, self.planets[planet], cx, cy, size / GLYPH_UNITS)
+
+    def image(self, name: str, size) -> Image.Image:
+        """"wheel" または惑星のキー → 同じ描画命令をラスタライズした RGBA 画像（プレビュー用）"""
+        form = self.wheel if name == "wheel" else self.planets[name]
+        return rasterize(zlib.decompress(form.stream).decode("latin-1"), form.bbox, size)
+
+    def stats(self) -> dict:
+        forms = [self.wheel, *self.planets.values()]
+        return {
+            "forms": len(forms),
+            "code_bytes": sum(f.code_bytes for f in forms),
+            "stream_bytes": sum(len(f.stream) for f in forms),
+        }
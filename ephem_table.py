@@ -0,0 +1,301 @@
+"""
+太陽 / 月 / 金星 / 火星 の黄経テーブル（事前計算 + mmap）
+
+・オフラインで swisseph から一定間隔でサンプリングし、ephe/core_lons.npy に保存
+・実行時は np.load(mmap_mode="r") で開くだけ（gunicorn の各 worker はページキャッシュを共有）
+・任意の時刻は前後4点の3次ラグランジュ補間で求める（許容誤差 TOLERANCE_DEG）
+・あわせて各天体が星座を移る瞬間（イングレス）の一覧を ephe/core_ingress.npz に保存
+  → 星座だけ知りたいときは二分探索で済み、直近のイングレスまでの距離もすぐ分かる
+
+使い方:
+    python -m ephem_table build            # テーブル + イングレス一覧の作成
+    python -m ephem_table check -n 20000   # swisseph とのランダム比較レポート
+"""
+import argparse
+import bisect
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+EPHE_DIR = os.path.join(BASE_DIR, "ephe")
+TABLE_PATH = os.path.join(EPHE_DIR, "core_lons.npy")
+META_PATH = os.path.join(EPHE_DIR, "core_lons.json")
+INGRESS_PATH = os.path.join(EPHE_DIR, "core_ingress.npz")
+
+# 列の順番（compute_core_from_birth の CORE_BODIES と同じ）
+BODY_NAMES = ("sun", "moon", "venus", "mars")
+
+DEFAULT_START_YEAR = 1920
+DEFAULT_END_YEAR = 2031
+DEFAULT_STEP_DAYS = 0.5
+
+# 0.5 日間隔・3次補間での保証値（check で実測して確認する）
+TOLERANCE_DEG = 0.001
+
+# イングレス時刻の精度（日）。約 0.1 秒
+INGRESS_EPS_DAYS = 1e-6
+
+
+# ------------------------------------------------------------------
+# 実行時：テーブル読み込み + 補間
+# ------------------------------------------------------------------
+class EphemerisTable:
+    def __init__(self, table, start_jd: float, step: float):
+        self.table = table
+        self.start_jd = float(start_jd)
+        self.step = float(step)
+        n = table.shape[0]
+        # 補間に前後1点ずつ余分に要るので、両端1ステップは範囲外扱い
+        self.min_jd = self.start_jd + self.step
+        self.max_jd = self.start_jd + (n - 3) * self.step
+
+    @classmethod
+    def load(cls, path=TABLE_PATH, meta_path=META_PATH):
+        """ファイルがなければ None（呼び出し側は swisseph にフォールバック）"""
+        if not (os.path.exists(path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if tuple(meta.get("bodies", ())) != BODY_NAMES:
+            return None
+        table = np.load(path, mmap_mode="r")
+        return cls(table, meta["start_jd"], meta["step"])
+
+    def covers(self, jd: float) -> bool:
+        return self.min_jd <= jd < self.max_jd
+
+    def lons(self, jd: float):
+        """jd（UT）における4天体の黄経 tuple。範囲外なら ValueError"""
+        if not self.covers(jd):
+            raise ValueError(f"jd {jd} is outside the ephemeris table")
+
+        x = (jd - self.start_jd) / self.step
+        i = int(x)
+        t = x - i
+
+        # 3次ラグランジュ補間（節点 -1, 0, 1, 2）の重み
+        w0 = -t * (t - 1) * (t - 2) / 6.0
+        w1 = (t + 1) * (t - 1) * (t - 2) / 2.0
+        w2 = -(t + 1) * t * (t - 2) / 2.0
+        w3 = (t + 1) * t * (t - 1) / 6.0
+
+        # 4点 (i-1, i, i+1, i+2) は tolist() で Python float にしてから計算する
+        # （要素数が少ないので numpy の演算よりこの方が速い）
+        r0, r1, r2, r3 = self.table[i - 1:i + 3].tolist()
+        out = []
+        for a, b, c, d in zip(r0, r1, r2, r3):
+            # 0/360 の境目をまたぐ場合は a を基準に連続な値へ展開
+            b = a + (b - a + 180.0) % 360.0 - 180.0
+            c = b + (c - b + 180.0) % 360.0 - 180.0
+            d = c + (d - c + 180.0) % 360.0 - 180.0
+            out.append((w0 * a + w1 * b + w2 * c + w3 * d) % 360.0)
+        return tuple(out)
+
+
+class IngressIndex:
+    """
+    天体ごとの「星座が変わる瞬間」のソート済み配列
+    times[k] 以降（次の times[k+1] まで）は signs[k] の星座（0=牡羊座 … 11=魚座）
+    逆行で前の星座に戻る場合も1件のイングレスとして入っている
+    """
+
+    def __init__(self, times: dict, signs: dict):
+        # bisect は list の方が速いので Python の list で持つ
+        self.times = {name: list(map(float, times[name])) for name in times}
+        self.signs = {name: list(map(int, signs[name])) for name in signs}
+
+    @classmethod
+    def load(cls, path=INGRESS_PATH):
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            times = {name: data[f"{name}_jd"] for name in BODY_NAMES}
+            signs = {name: data[f"{name}_sign"] for name in BODY_NAMES}
+        return cls(times, signs)
+
+    def covers(self, body: str, jd: float) -> bool:
+        times = self.times.get(body)
+        return bool(times) and times[0] <= jd < times[-1]
+
+    def sign_at(self, body: str, jd: float) -> int:
+        """jd（UT）における星座番号。範囲外なら ValueError"""
+        if not self.covers(body, jd):
+            raise ValueError(f"jd {jd} is outside the ingress index for {body}")
+        k = bisect.bisect_right(self.times[body], jd) - 1
+        return self.signs[body][k]
+
+    def nearest_ingress_days(self, body: str, jd: float) -> float:
+        """直前・直後のイングレスのうち近い方までの日数（範囲外なら ValueError）"""
+        if not self.covers(body, jd):
+            raise ValueError(f"jd {jd} is outside the ingress index for {body}")
+        times = self.times[body]
+        k = bisect.bisect_right(times, jd) - 1
+        # times[0] は範囲の始点（本当のイングレスではない）
+        prev_d = jd - times[k] if k > 0 else float("inf")
+        next_d = times[k + 1] - jd if k + 1 < len(times) - 1 else float("inf")
+        return min(prev_d, next_d)
+
+
+# ------------------------------------------------------------------
+# オフライン：テーブル作成 & 精度チェック
+# ------------------------------------------------------------------
+def _swe():
+    import swisseph as swe
+
+    swe.set_ephe_path(EPHE_DIR)
+    return swe
+
+
+def _body_ids(swe):
+    return (swe.SUN, swe.MOON, swe.VENUS, swe.MARS)
+
+
+def _find_ingresses(swe, ids, table, start_jd, step):
+    """
+    サンプル間で星座番号が変わる区間を探し、swisseph で二分探索して時刻を求める
+    （0.5 日で 30° 動く天体はないので、1区間にイングレスは高々1回）
+    """
+    n = table.shape[0]
+    end_jd = start_jd + (n - 1) * step
+    out = {}
+    for j, (name, body_id) in enumerate(zip(BODY_NAMES, ids)):
+        sign = (table[:, j] // 30).astype(np.int64) % 12
+        changed = np.nonzero(sign[1:] != sign[:-1])[0]
+
+        times = [start_jd]
+        signs = [int(sign[0])]
+        for k in changed:
+            lo = start_jd + k * step
+            hi = lo + step
+            s_lo = int(sign[k])
+            while hi - lo > INGRESS_EPS_DAYS:
+                mid = (lo + hi) / 2
+                if int(swe.calc_ut(mid, body_id)[0][0] // 30) % 12 == s_lo:
+                    lo = mid
+                else:
+                    hi = mid
+            times.append(hi)
+            signs.append(int(sign[k + 1]))
+        # 終点（範囲の終わりを示す番兵）
+        times.append(end_jd)
+        signs.append(int(sign[-1]))
+
+        out[f"{name}_jd"] = np.asarray(times, dtype=np.float64)
+        out[f"{name}_sign"] = np.asarray(signs, dtype=np.int8)
+    return out
+
+
+def build(start_year=DEFAULT_START_YEAR, end_year=DEFAULT_END_YEAR,
+          step=DEFAULT_STEP_DAYS, path=TABLE_PATH, meta_path=META_PATH,
+          ingress_path=INGRESS_PATH):
+    swe = _swe()
+    ids = _body_ids(swe)
+
+    # 補間用に前後へ1点ずつ余分に取る
+    start_jd = swe.julday(start_year, 1, 1, 0.0) - step
+    end_jd = swe.julday(end_year, 1, 1, 0.0) + 2 * step
+    n = int(round((end_jd - start_jd) / step)) + 1
+
+    tmp_path = path + ".tmp.npy"
+    table = np.lib.format.open_memmap(
+        tmp_path, mode="w+", dtype=np.float64, shape=(n, len(ids))
+    )
+    for k in range(n):
+        jd = start_jd + k * step
+        for j, body_id in enumerate(ids):
+            table[k, j] = swe.calc_ut(jd, body_id)[0][0]
+    table.flush()
+    ingress = _find_ingresses(swe, ids, np.asarray(table), start_jd, step)
+    del table
+    os.replace(tmp_path, path)
+
+    with open(ingress_path, "wb") as f:
+        np.savez(f, **ingress)
+
+    meta = {
+        "bodies": list(BODY_NAMES),
+        "start_jd": start_jd,
+        "step": step,
+        "rows": n,
+        "start_year": start_year,
+        "end_year": end_year,
+        "tolerance_deg": TOLERANCE_DEG,
+    }
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def check(samples=10000, seed=0, table=None):
+    """ランダムな時刻で swisseph と比較し、天体ごとの最大・平均誤差（度）を返す"""
+    swe = _swe()
+    ids = _body_ids(swe)
+    table = table or EphemerisTable.load()
+    if table is None:
+        raise SystemExit("ephemeris table not found; run `python -m ephem_table build`")
+
+    rng = random.Random(seed)
+    max_err = [0.0] * len(ids)
+    sum_err = [0.0] * len(ids)
+    for _ in range(samples):
+        jd = rng.uniform(table.min_jd, table.max_jd)
+        got = table.lons(jd)
+        for j, body_id in enumerate(ids):
+            want = swe.calc_ut(jd, body_id)[0][0]
+            err = abs((got[j] - want + 180.0) % 360.0 - 180.0)
+            max_err[j] = max(max_err[j], err)
+            sum_err[j] += err
+
+    return {
+        name: {"max_deg": max_err[j], "mean_deg": sum_err[j] / samples}
+        for j, name in enumerate(BODY_NAMES)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ephem_table")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_build = sub.add_parser("build", help="build ephe/core_lons.npy from swisseph")
+    p_build.add_argument("--start-year", type=int, default=DEFAULT_START_YEAR)
+    p_build.add_argument("--end-year", type=int, default=DEFAULT_END_YEAR)
+    p_build.add_argument("--step", type=float, default=DEFAULT_STEP_DAYS)
+
+    p_check = sub.add_parser("check", help="compare the table against swisseph")
+    p_check.add_argument("-n", "--samples", type=int, default=10000)
+    p_check.add_argument("--seed", type=int, default=0)
+
+    args = parser.parse_args(argv)
+
+    if args.cmd == "build":
+        t0 = time.perf_counter()
+        meta = build(args.start_year, args.end_year, args.step)
+        print(
+            f"wrote {TABLE_PATH}: {meta['rows']} rows x {len(BODY_NAMES)} bodies, "
+            f"{os.path.getsize(TABLE_PATH) / 1024:.0f} KiB "
+            f"in {time.perf_counter() - t0:.1f}s"
+        )
+        ingress = IngressIndex.load()
+        counts = ", ".join(
+            f"{name} {len(ingress.times[name]) - 2}" for name in BODY_NAMES
+        )
+        print(f"wrote {INGRESS_PATH}: ingresses {counts}")
+        return 0
+
+    report = check(args.samples, args.seed)
+    ok = True
+    print(f"{'body':<6} {'max err (deg)':>14} {'mean err (deg)':>15}")
+    for name, r in report.items():
+        print(f"{name:<6} {r['max_deg']:>14.2e} {r['mean_deg']:>15.2e}")
+        ok = ok and r["max_deg"] <= TOLERANCE_DEG
+    print(f"tolerance {TOLERANCE_DEG} deg: {'OK' if ok else 'EXCEEDED'}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+"""
+PDF に埋め込む日本語フォント（public/assets の Noto Sans JP）
+
+・同梱の .otf は CFF（PostScript）アウトラインなので reportlab の TTFont では読めない
+  fontTools で TrueType（glyf）に変換したものを FONT_CACHE_DIR に置いて使う
+  （名前に元ファイルのハッシュを含めるので、.otf を差し替えれば作り直される）
+  変換は1フェイス10秒ほどかかるため、最初に必要になったときに1回だけ行い、worker 間はファイルで共有する
+  デプロイ時に済ませておくなら：  python -m fonts build
+・PDF にはその文書で使った字だけが埋め込まれる（reportlab の TTFont のサブセット化）
+・CorpusTTFont：固定の文言（ページ番号・日付・見出しなど）の字は、どの文書でも同じコードに割り当てて
+  先頭の subset にまとめる。その subset のフォントプログラムは1回だけ作ってプロセス内で使い回し、
+  文書ごとに作るのは名前など残りの字の subset だけになる
+  （コードが文書をまたいで変わらないので、ページ単位の描画キャッシュにもそのまま載る）
+  TTFont の内部（State・face.makeSubset）に手を入れるので、reportlab が未確認の版なら普通の TTFont を使う
+"""
+import argparse
+import fcntl
+import hashlib
+import os
+import sys
+import time
+
+from reportlab.pdfbase.ttfonts import TTFont
+
+import rl_compat
+
+try:
+    from fontTools.pens.cu2quPen import Cu2QuPen
+    from fontTools.pens.ttGlyphPen import TTGlyphPen
+    from fontTools.ttLib import TTFont as FTFont, newTable
+except ImportError:     # fontTools がなければ埋め込みフォントは使わない（CID フォントのまま）
+    FTFont = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSETS_DIR = os.path.join(BASE_DIR, "public", "assets")
+DEFAULT_CACHE_DIR = os.path.join(BASE_DIR, "font_cache")
+
+FACES = {
+    "regular": "NotoSansJP-Regular.otf",
+    "medium": "NotoSansJP-Medium.otf",
+    "bold": "NotoSansJP-Bold.otf",
+}
+
+# 変換方法を変えたら上げる（キャッシュのファイル名に入る）
+CONVERTER_VERSION = "1"
+
+_MAX_ERR = 1.0      # 3次 → 2次ベジェの許容誤差（1000 em 単位）
+
+
+# ----------------------------------------------------------------------
+# OTF（CFF）→ TTF（glyf）
+# ----------------------------------------------------------------------
+def convert_otf_to_ttf(src: str, dst: str):
+    """fontTools の otf2ttf と同じ手順。dst は一時ファイルに書いてから置き換える"""
+    font = FTFont(src)
+    order = font.getGlyphOrder()
+    glyph_set = font.getGlyphSet()
+
+    glyf = newTable("glyf")
+    glyf.glyphOrder = order
+    glyf.glyphs = {}
+    for name in order:
+        pen = TTGlyphPen(glyph_set)
+        glyph_set[name].draw(Cu2QuPen(pen, _MAX_ERR, reverse_direction=True))
+        glyf.glyphs[name] = pen.glyph()
+    font["loca"] = newTable("loca")
+    font["glyf"] = glyf
+    del font["CFF "]
+    if "VORG" in font:
+        del font["VORG"]
+    glyf.compile(font)
+
+    # 左サイドベアリングを glyf の xMin に合わせる
+    hmtx = font["hmtx"]
+    for name, glyph in glyf.glyphs.items():
+        if hasattr(glyph, "xMin"):
+            hmtx[name] = (hmtx[name][0], glyph.xMin)
+
+    maxp = font["maxp"] = newTable("maxp")
+    maxp.tableVersion = 0x00010000
+    maxp.maxZones = 1
+    maxp.maxTwilightPoints = 0
+    maxp.maxStorage = 0
+    maxp.maxFunctionDefs = 0
+    maxp.maxInstructionDefs = 0
+    maxp.maxStackElements = 0
+    maxp.maxSizeOfInstructions = 0
+    maxp.maxComponentElements = 0
+    maxp.compile(font)
+
+    post = font["post"]
+    post.formatType = 3.0     # グリフ名は持たない（reportlab は使わない）
+    post.extraNames = []
+    post.mapping = {}
+    post.glyphOrder = order
+    font.sfntVersion = "\x00\x01\x00\x00"
+
+    tmp = f"{dst}.{os.getpid()}.tmp"
+    font.save(tmp)
+    os.replace(tmp, dst)
+
+
+def _source_hash(path: str) -> str:
+    h = hashlib.sha256(CONVERTER_VERSION.encode("ascii"))
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()[:12]
+
+
+def cached_ttf(src: str, cache_dir=DEFAULT_CACHE_DIR) -> str:
+    """変換済み TTF のパス（なければ変換する。同時に複数の worker が来ても変換は1回）"""
+    stem = os.path.splitext(os.path.basename(src))[0]
+    dst = os.path.join(cache_dir, f"{stem}-{_source_hash(src)}.ttf")
+    if os.path.exists(dst):
+        return dst
+    if FTFont is None:
+        raise RuntimeError("fontTools is required to convert " + os.path.basename(src))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(dst + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(dst):
+                convert_otf_to_ttf(src, dst)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    return dst
+
+
+def embedding_available(face="regular", assets_dir=ASSETS_DIR, cache_dir=DEFAULT_CACHE_DIR) -> bool:
+    """元の .otf があり、変換できる（または変換済みの）ときだけ True"""
+    src = os.path.join(assets_dir, FACES[face])
+    if not os.path.exists(src):
+        return False
+    if FTFont is not None:
+        return True
+    stem = os.path.splitext(FACES[face])[0]
+    return os.path.isdir(cache_dir) and any(
+        name.startswith(stem + "-") and name.endswith(".ttf") for name in os.listdir(cache_dir)
+    )
+
+
+# ----------------------------------------------------------------------
+# reportlab 側
+# ----------------------------------------------------------------------
+class _SeedDoc:
+    """固定文言の割り当てを作るときだけ使うダミーの文書（TTFont.state の weakref キー）"""
+
+
+class CorpusTTFont(TTFont):
+    """
+    corpus（固定文言）の字をどの文書でも同じコードに割り当てる TTFont
+    fixed_subsets 未満の subset は corpus の字だけで中身が変わらないので、makeSubset の結果を使い回す
+    """
+
+    def __init__(self, name: str, filename: str, corpus: str = ""):
+        super().__init__(name, filename, asciiReadable=False)
+        self.corpus = corpus
+        self._seed = self._build_seed()
+        self.fixed_subsets = len(self._seed.subsets)
+        self._fixed_programs = {}
+
+        make_subset = self.face.makeSubset
+
+        def cached_make_subset(subset):
+            key = tuple(subset)
+            program = self._fixed_programs.get(key)
+            if program is None:
+                program = make_subset(subset)
+                if key in self._fixed_keys:
+                    self._fixed_programs[key] = program
+            return program
+
+        self.face.makeSubset = cached_make_subset
+        self._fixed_keys = {tuple(s) for s in self._seed.subsets}
+
+    def _build_seed(self) -> TTFont.State:
+        doc = _SeedDoc()
+        # reportlab の割り当て処理をそのまま通す（corpus の順に 1, 2, … とコードが決まる）
+        TTFont.splitString(self, "".join(dict.fromkeys(self.corpus)), doc)
+        seed = self.state.pop(doc)
+        # 残りの字は次の subset の先頭から（corpus の subset には文書ごとの字を混ぜない）
+        seed.nextCode = len(seed.subsets) * 256
+        return seed
+
+    def _doc_state(self, doc) -> TTFont.State:
+        state = self.state.get(doc)
+        if state is None:
+            seed = self._seed
+            state = TTFont.State(False, self)
+            state.assignments = dict(seed.assignments)
+            state.subsets = [list(s) for s in seed.subsets]
+            state.nextCode = seed.nextCode
+            self.state[doc] = state
+        return state
+
+    def splitString(self, text, doc, encoding="utf-8"):
+        self._doc_state(doc)
+        return TTFont.splitString(self, text, doc, encoding)
+
+    def getSubsetInternalName(self, subset, doc):
+        self._doc_state(doc)
+        return TTFont.getSubsetInternalName(self, subset, doc)
+
+    def stats(self) -> dict:
+        return {
+            "font": self.fontName,
+            "corpus_chars": len(set(self.corpus)),
+            "fixed_subsets": self.fixed_subsets,
+            "fixed_programs_built": len(self._fixed_programs),
+        }
+
+
+def load_face(face: str, font_name: str, corpus: str = "",
+              assets_dir=ASSETS_DIR, cache_dir=DEFAULT_CACHE_DIR) -> TTFont:
+    path = cached_ttf(os.path.join(assets_dir, FACES[face]), cache_dir)
+    if not rl_compat.INTERNALS:
+        return TTFont(font_name, path, asciiReadable=False)
+    return CorpusTTFont(font_name, path, corpus)
+
+
+# ----------------------------------------------------------------------
+# CLI（デプロイ時に変換を済ませておく）
+# ----------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m fonts")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help=".otf を TrueType に変換して FONT_CACHE_DIR に置く")
+    p_build.add_argument("--faces", default="regular,bold", help="カンマ区切り（regular / medium / bold）")
+    p_build.add_argument("--cache-dir", default=os.environ.get("FONT_CACHE_DIR") or DEFAULT_CACHE_DIR)
+    args = parser.parse_args(argv)
+
+    for face in args.faces.split(","):
+        src = os.path.join(ASSETS_DIR, FACES[face])
+        t0 = time.perf_counter()
+        path = cached_ttf(src, args.cache_dir)
+        print(f"{face:<8} {os.path.getsize(src):>10,} -> {os.path.getsize(path):>10,} bytes  "
+              f"{time.perf_counter() - t0:6.1f}s  {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,268 @@
+"""
+出生地の名前 → 緯度経度・タイムゾーン（オフライン地名辞書）
+
+・data/places.tsv（都道府県・主な市・海外の主要都市）を起動時に読み込む
+・名前の検索はトライ木：完全一致 →「神奈川県横浜市中区」のような連結表記の最長一致 → 前方一致（かな入力の途中など）
+・緯度経度からの逆引きは k-d 木（単位球上の3次元座標で最近傍）
+・resolve() の結果は LRU で覚えておく（同じ地名は辞書を引かない）
+"""
+import functools
+import math
+import os
+import re
+import unicodedata
+from typing import NamedTuple
+
+# 同じ表記が複数の地名に当たるときの優先度（「大阪」は大阪府より大阪市）
+_KIND_PRIORITY = {"city": 3, "world": 2, "pref": 1}
+
+# 表記の末尾の行政区分 → その読み
+_SUFFIX_READING = {"都": "と", "府": "ふ", "県": "けん", "市": "し"}
+
+_SEPARATORS = re.compile(r"[\s,、，/／・]+")
+_DROP_CHARS = re.compile(r"[.\-'’()（）]")
+_COORD = re.compile(r"^\s*([-+]?\d+(?:\.\d+)?)\s*[,、， ]\s*([-+]?\d+(?:\.\d+)?)\s*$")
+
+
+class Place(NamedTuple):
+    name: str
+    kana: str
+    lat: float
+    lon: float
+    tz: str
+    kind: str
+    rank: int
+
+
+def normalize(text: str) -> str:
+    """全角半角・大文字小文字・カタカナ/ひらがなの違いをなくす"""
+    s = unicodedata.normalize("NFKC", text).lower()
+    s = "".join(
+        chr(ord(ch) - 0x60) if "ァ" <= ch <= "ヶ" else ch
+        for ch in s
+    )
+    return _DROP_CHARS.sub("", s)
+
+
+class _Node:
+    __slots__ = ("children", "place", "full", "best")
+
+    def __init__(self):
+        self.children = {}
+        self.place = None   # この表記で終わる地名
+        self.full = False   # 行政区分付きの正式表記か（連結表記の区切りに使える）
+        self.best = None    # この部分木で rank が最大の地名（前方一致用）
+
+
+def _better(a: Place, b: Place) -> bool:
+    """完全一致がぶつかったとき a を b より優先するか"""
+    return (_KIND_PRIORITY[a.kind], a.rank) > (_KIND_PRIORITY[b.kind], b.rank)
+
+
+def _to_xyz(lat, lon):
+    la = math.radians(lat)
+    lo = math.radians(lon)
+    return (math.cos(la) * math.cos(lo), math.cos(la) * math.sin(lo), math.sin(la))
+
+
+class Gazetteer:
+    def __init__(self, entries, cache_size=4096):
+        """entries: (Place, 別名の list) の列"""
+        self.places = []
+        self._root = _Node()
+        for place, aliases in entries:
+            self.places.append(place)
+            for key, full in self._keys(place, aliases):
+                self._insert(key, place, full)
+        self._kd = self._build_kd(
+            [(_to_xyz(p.lat, p.lon), p) for p in self.places], 0
+        )
+        self.resolve = functools.lru_cache(maxsize=cache_size)(self._resolve)
+
+    @classmethod
+    def load(cls, path: str, cache_size=4096):
+        entries = []
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line or line.startswith("#"):
+                    continue
+                kind, name, kana, aliases, lat, lon, tz, rank = line.split("\t")
+                place = Place(name, kana, float(lat), float(lon), tz, kind, int(rank))
+                entries.append((place, [a for a in aliases.split(",") if a]))
+        return cls(entries, cache_size=cache_size)
+
+    # ------------------------------------------------------------------
+    # トライ木
+    # ------------------------------------------------------------------
+    @staticmethod
+    def _keys(place: Place, aliases):
+        """(正規化したキー, 連結表記の区切りに使えるか) を列挙"""
+        has_suffix = place.kind in ("pref", "city")
+        yield normalize(place.name), has_suffix
+        reading = _SUFFIX_READING.get(place.name[-1])
+        if has_suffix and reading and len(place.name) > 1:
+            yield normalize(place.name[:-1]), False
+            yield normalize(place.kana + reading), True
+        if place.kana:
+            yield normalize(place.kana), False
+        for alias in aliases:
+            yield normalize(alias), False
+
+    def _insert(self, key: str, place: Place, full: bool):
+        if not key:
+            return
+        node = self._root
+        path = [node]
+        for ch in key:
+            node = node.children.setdefault(ch, _Node())
+            path.append(node)
+        if node.place is None or _better(place, node.place):
+            node.place = place
+            node.full = full or node.full
+        elif node.place == place:
+            node.full = full or node.full
+        for n in path:
+            if n.best is None or place.rank > n.best.rank:
+                n.best = place
+
+    def _walk(self, key: str):
+        node = self._root
+        for ch in key:
+            node = node.children.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def lookup(self, name: str):
+        """表記の完全一致（正式名・略称・かな・ローマ字）"""
+        node = self._walk(normalize(name))
+        return node.place if node is not None else None
+
+    def complete(self, prefix: str):
+        """前方一致で一番大きい地名"""
+        key = normalize(prefix)
+        if not key:
+            return None
+        node = self._walk(key)
+        return node.best if node is not None else None
+
+    def _segments(self, token: str):
+        """「神奈川県横浜市中区」→ [神奈川県, 横浜市]（正式表記の最長一致を左から順に）"""
+        found = []
+        i = 0
+        while i < len(token):
+            node = self._root
+            match = None
+            for j in range(i, len(token)):
+                node = node.children.get(token[j])
+                if node is None:
+                    break
+                if node.place is not None and node.full:
+                    match = (j + 1, node.place)
+            if match is None:
+                break
+            i, place = match
+            found.append(place)
+        return found
+
+    # ------------------------------------------------------------------
+    # k-d 木（逆引き）
+    # ------------------------------------------------------------------
+    def _build_kd(self, points, depth):
+        if not points:
+            return None
+        axis = depth % 3
+        points.sort(key=lambda p: p[0][axis])
+        mid = len(points) // 2
+        xyz, place = points[mid]
+        return (
+            xyz, place, axis,
+            self._build_kd(points[:mid], depth + 1),
+            self._build_kd(points[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, lat: float, lon: float) -> Place:
+        """緯度経度にいちばん近い地名"""
+        target = tx, ty, tz = _to_xyz(lat, lon)
+        best = [None, float("inf")]
+
+        def visit(node):
+            if node is None:
+                return
+            xyz, place, axis, left, right = node
+            dx = xyz[0] - tx
+            dy = xyz[1] - ty
+            dz = xyz[2] - tz
+            d = dx * dx + dy * dy + dz * dz
+            if d < best[1]:
+                best[0], best[1] = place, d
+            diff = target[axis] - xyz[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            if diff * diff < best[1]:
+                visit(far)
+
+        visit(self._kd)
+        return best[0]
+
+    # ------------------------------------------------------------------
+    # 公開 API
+    # ------------------------------------------------------------------
+    def _resolve(self, text: str):
+        """
+        出生地の入力 → Place（見つからなければ None）
+        "35.0, 135.7" のような座標はそのまま使い、タイムゾーンは最寄りの地名から取る
+        """
+        if not text:
+            return None
+        m = _COORD.match(text)
+        if m:
+            lat, lon = float(m.group(1)), float(m.group(2))
+            if -90 <= lat <= 90 and -180 <= lon <= 180:
+                near = self.nearest(lat, lon)
+                return Place(text.strip(), "", lat, lon, near.tz, "coord", 0)
+
+        tokens = [normalize(t) for t in _SEPARATORS.split(text)]
+        tokens = [t for t in tokens if t]
+
+        # 隣り合う語をつないだ表記も試す（"New York" → newyork）
+        # 候補が複数なら、より細かい区分 → より多くの語にまたがる方を選ぶ
+        best = None
+        best_score = None
+        for i in range(len(tokens)):
+            for j in range(i + 1, len(tokens) + 1):
+                node = self._walk("".join(tokens[i:j]))
+                if node is not None and node.place is not None:
+                    place = node.place
+                elif j == i + 1:
+                    found = self._segments(tokens[i])
+                    place = found[-1] if found else None
+                else:
+                    place = None
+                if place is None:
+                    continue
+                score = (_KIND_PRIORITY[place.kind], j - i)
+                if best_score is None or score > best_score:
+                    best, best_score = place, score
+        if best is not None:
+            return best
+
+        # 入力途中のかな・漢字は前方一致（ローマ字の途中は誤爆しやすいので使わない）
+        joined = "".join(tokens)
+        if len(joined) >= 2 and not joined.isascii():
+            return self.complete(joined)
+        return None
+
+    def stats(self) -> dict:
+        info = self.resolve.cache_info()
+        return {
+            "places": len(self.places),
+            "hits": info.hits,
+            "misses": info.misses,
+            "currsize": info.currsize,
+            "maxsize": info.maxsize,
+        }
+
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "places.tsv")
@@ -0,0 +1,37 @@
+# gunicorn 設定（カレントディレクトリの gunicorn.conf.py は自動で読み込まれる）
+#
+# app を master で読み込んでから fork する。ウォームアップも master で1回だけ行い、
+# worker はフォント・画像・テキスト表などを copy-on-write で共有する
+preload_app = True
+
+
+def on_starting(server):
+    # preload 済みなので import は読み込み済みのモジュールを返すだけ
+    from app import METRICS, warmup
+
+    # 前回起動時の /metrics の値を消してから（ウォームアップの1件は master の分として残る）
+    METRICS.clear()
+    state = warmup()
+    server.log.info(
+        "warmup: ready=%s render=%ss total=%ss frozen=%s error=%s",
+        state["ready"],
+        state["render_seconds"],
+        state["warmup_seconds"],
+        state["frozen_objects"],
+        state["error"],
+    )
+
+
+def post_worker_init(worker):
+    # preload を無効にして起動した場合は worker ごとにウォームアップする
+    # （preload 済みなら fork 前の状態を引き継いでいるので何もしない）
+    from app import warmup
+
+    warmup(freeze=False)
+
+
+def child_exit(server, worker):
+    # 終了した worker の gauge（RSS など）を /metrics から外す。counter はそのまま残す
+    from app import METRICS
+
+    METRICS.mark_process_dead(worker.pid)
@@ -0,0 +1,266 @@
+"""
+バックグラウンド生成ジョブ（Tally の webhook など、すぐに PDF を返さなくてよい入力用）
+
+・ジョブの状態は SQLite（jobs.sqlite3）に置く → gunicorn の worker 間で共有できる
+・生成はプロセスプールに投げ、終わったら PDF を <jobs_dir>/<id[:2]>/<id>.pdf に保存
+・状態の遷移：queued → running → done / failed
+・worker が落ちて running のまま残ったジョブは、一定時間後に queued に戻して拾い直す
+・終わった（done / failed）ジョブは保持期間を過ぎたら PDF ごと消す
+  どちらも JobQueue.maintain() で、API が呼ばれたついでに（最短でも maintenance_seconds おきに）行う
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id          TEXT PRIMARY KEY,
+    source_id   TEXT UNIQUE,
+    status      TEXT NOT NULL,
+    params      TEXT NOT NULL,
+    cache_key   TEXT NOT NULL,
+    error       TEXT,
+    pdf_bytes   INTEGER,
+    created_at  REAL NOT NULL,
+    started_at  REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+STATUSES = ("queued", "running", "done", "failed")
+
+
+class JobStore:
+    """SQLite + ファイルによるジョブの永続化（接続は操作ごとに開く：スレッド・プロセス安全）"""
+
+    def __init__(self, jobs_dir: str):
+        self.jobs_dir = jobs_dir
+        self.db_path = os.path.join(jobs_dir, "jobs.sqlite3")
+        os.makedirs(jobs_dir, exist_ok=True)
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(_SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_path, timeout=30)
+        db.row_factory = sqlite3.Row
+        return db
+
+    def pdf_path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, job_id[:2], f"{job_id}.pdf")
+
+    # ------------------------------------------------------------------
+    # 作成・取得
+    # ------------------------------------------------------------------
+    def create(self, params: dict, cache_key: str, source_id=None) -> dict:
+        """
+        ジョブを queued で登録して返す
+        source_id（Tally の responseId など）が既にあれば、新しく作らず既存のジョブを返す
+        """
+        job_id = uuid.uuid4().hex
+        with self._connect() as db:
+            # 同じ source_id が2つの worker に同時に届いても、INSERT は片方だけが通る
+            # （もう片方は何もせず、先に入った方のジョブを返す）
+            cur = db.execute(
+                "INSERT OR IGNORE INTO jobs (id, source_id, status, params, cache_key, created_at)"
+                " VALUES (?, ?, 'queued', ?, ?, ?)",
+                (
+                    job_id,
+                    source_id,
+                    json.dumps(params, ensure_ascii=False),
+                    cache_key,
+                    time.time(),
+                ),
+            )
+            if cur.rowcount == 0 and source_id is not None:
+                row = db.execute(
+                    "SELECT * FROM jobs WHERE source_id = ?", (source_id,)
+                ).fetchone()
+                return _row_to_job(row)
+        return self.get(job_id)
+
+    def get(self, job_id: str):
+        with self._connect() as db:
+            row = db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _row_to_job(row) if row is not None else None
+
+    def queued_ids(self, limit=100) -> list:
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [r["id"] for r in rows]
+
+    # ------------------------------------------------------------------
+    # 状態遷移
+    # ------------------------------------------------------------------
+    def claim(self, job_id: str) -> bool:
+        """queued → running。他の worker が先に取っていたら False"""
+        with self._connect() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = 'running', started_at = ?"
+                " WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            )
+        return cur.rowcount == 1
+
+    def finish(self, job_id: str, pdf: bytes):
+        path = self.pdf_path(job_id)
+        d = os.path.dirname(path)
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(pdf)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'done', pdf_bytes = ?, finished_at = ?, error = NULL"
+                " WHERE id = ?",
+                (len(pdf), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, message: str):
+        with self._connect() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                (message, time.time(), job_id),
+            )
+
+    def requeue_stale(self, older_than: float) -> int:
+        """running のまま older_than 秒以上たったジョブを queued に戻す"""
+        with self._connect() as db:
+            cur = db.execute(
+                "UPDATE jobs SET status = 'queued', started_at = NULL"
+                " WHERE status = 'running' AND started_at < ?",
+                (time.time() - older_than,),
+            )
+        return cur.rowcount
+
+    def purge(self, older_than: float) -> int:
+        """done / failed になってから older_than 秒以上たったジョブを PDF ごと消し、件数を返す"""
+        cutoff = time.time() - older_than
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                (cutoff,),
+            ).fetchall()
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(r["id"],) for r in rows])
+        for r in rows:
+            try:
+                os.unlink(self.pdf_path(r["id"]))     # 送信中のものは開いた fd から最後まで読める
+            except OSError:
+                pass
+        return len(rows)
+
+    def stats(self) -> dict:
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"
+            ).fetchall()
+        counts = {s: 0 for s in STATUSES}
+        counts.update({r["status"]: r["n"] for r in rows})
+        return counts
+
+
+def _row_to_job(row) -> dict:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+class JobQueue:
+    """
+    JobStore のジョブをプロセスプールで生成する（worker プロセスごとに1つ）
+    render_fn: params → PDF bytes（pickle 可能な関数）
+    executor_fn: () → プール、(broken=壊れたプール) → 作り直したプール
+    cache: ReportCache（同じ入力の PDF があれば生成しない・生成結果も入れる）
+    retention_seconds: 終わったジョブを残す秒数（0 なら消さない）
+    """
+
+    def __init__(self, store: JobStore, render_fn, executor_fn, cache=None,
+                 stale_seconds=600, retention_seconds=7 * 24 * 3600, maintenance_seconds=60):
+        self.store = store
+        self.render_fn = render_fn
+        self.executor_fn = executor_fn    # 初回に呼んでプールを得る（fork 後に作るため）
+        self.cache = cache
+        self.stale_seconds = stale_seconds
+        self.retention_seconds = retention_seconds
+        self.maintenance_seconds = maintenance_seconds
+        self._maintained_at = None
+        self._lock = threading.Lock()
+
+    def submit(self, job_id: str):
+        """queued のジョブを1件プールに投げる（他の worker が取っていたら何もしない）"""
+        if not self.store.claim(job_id):
+            return
+        job = self.store.get(job_id)
+
+        if self.cache is not None:
+            f = self.cache.open(job["cache_key"])
+            if f is not None:
+                with f:
+                    self.store.finish(job_id, f.read())
+                return
+
+        executor = self.executor_fn()
+        try:
+            try:
+                fut = executor.submit(self.render_fn, job["params"])
+            except BrokenProcessPool:
+                executor = self.executor_fn(broken=executor)
+                fut = executor.submit(self.render_fn, job["params"])
+        except Exception as e:
+            self.store.fail(job_id, f"{type(e).__name__}: {e}")
+            return
+        fut.add_done_callback(lambda f: self._done(job, f, executor))
+
+    def _done(self, job, fut, executor=None):
+        try:
+            pdf = fut.result()
+        except BrokenProcessPool as e:
+            # このジョブ（か同じプールの別の子）で落ちた：ジョブは失敗にし、次からは新しいプールで
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}")
+            if executor is not None:
+                self.executor_fn(broken=executor)
+            return
+        except Exception as e:
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}")
+            return
+        if self.cache is not None:
+            self.cache.put(job["cache_key"], pdf)
+        try:
+            self.store.finish(job["id"], pdf)
+        except OSError as e:
+            self.store.fail(job["id"], f"{type(e).__name__}: {e}")
+
+    def maintain(self) -> bool:
+        """
+        初回と、その後は最短 maintenance_seconds おきに（それ以外の呼び出しは何もしない）：
+        取り残された running を戻して queued をすべて投げ直し、保持期間を過ぎたジョブを消す
+        他の worker も同じことをするが、claim で1つの worker しか取らないので二重には生成しない
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._maintained_at is not None and now - self._maintained_at < self.maintenance_seconds:
+                return False
+            self._maintained_at = now
+        self.store.requeue_stale(self.stale_seconds)
+        for job_id in self.store.queued_ids(limit=10000):
+            self.submit(job_id)
+        if self.retention_seconds > 0:
+            self.store.purge(self.retention_seconds)
+        return True
@@ -0,0 +1,158 @@
+"""
+日本語テキストの折り返しエンジン
+
+・フォントごとのグリフ幅テーブルを1回だけ作り、1文字ずつ幅を足していく（1パスで線形時間）
+・幅の判定は reportlab の stringWidth と同じ式（size * 0.001 * 幅の合計）なので、
+  既定（kinsoku=False）の改行位置は従来の実装と完全に一致する
+・kinsoku=True で禁則処理（追い出し）：行頭禁則文字（。、」など）が行頭に来るときは前の行の最後の字と
+  一緒に次の行へ送り、行末禁則文字（「など）も次の行へ送る。どの行も wrap_width からははみ出さない
+"""
+from reportlab.pdfbase import pdfmetrics
+
+# 行頭に来てはいけない文字（前の行の最後の字と一緒に次の行へ送る）
+KINSOKU_NOT_AT_START = frozenset(
+    "、。，．,.・：；:;？！?!…‥ー―‐〜～"
+    "」』）］｝〕〉》】〙〗)]}’”"
+    "ぁぃぅぇぉっゃゅょゎゕゖァィゥェォッャュョヮヵヶ々ゝゞヽヾ"
+)
+
+# 行末に来てはいけない文字（次の行の先頭へ送る）
+KINSOKU_NOT_AT_END = frozenset("「『（［｛〔〈《【〘〖([{‘“")
+
+_width_tables = {}
+
+
+def glyph_width_table(font_name: str):
+    """
+    font_name → (幅テーブル dict, 既定幅)  ※幅は 1000 em 単位
+    CID フォント（HeiseiMin-W3 / HeiseiKakuGo-W5）は unicodeWidths をそのまま使う。
+    それ以外のフォントは1文字ずつ初めて出てきたときに測ってテーブルに足す。
+    """
+    table = _width_tables.get(font_name)
+    if table is None:
+        font = pdfmetrics.getFont(font_name)
+        widths = getattr(font, "unicodeWidths", None)
+        if widths is not None:
+            table = (widths, 1000)
+        else:
+            table = (_LazyWidths(font), None)
+        _width_tables[font_name] = table
+    return table
+
+
+class _LazyWidths(dict):
+    """CID 以外のフォント用：未登録の文字は測って覚える"""
+
+    def __init__(self, font):
+        super().__init__()
+        self.font = font
+
+    def __missing__(self, ch):
+        w = self.font.stringWidth(ch, 1000)
+        self[ch] = w
+        return w
+
+    def get(self, ch, default=None):
+        return self[ch]
+
+
+def wrap_lines(text, wrap_width, font_name, font_size, max_lines=None,
+               kinsoku=False):
+    """
+    text を wrap_width（pt）に収まる行の list に分ける
+    ・"\\n" は強制改行（空行もそのまま1行として数える）
+    ・max_lines を指定すると、その行数で打ち切る
+    ・kinsoku=False（既定）は禁則処理なし（従来の draw_wrapped_block と同じ改行位置）
+    """
+    widths, default = glyph_width_table(font_name)
+    get = widths.get
+    scale = font_size * 0.001
+
+    lines = []
+    buf = []
+    total = 0
+
+    for ch in text:
+        if ch == "\n":
+            lines.append("".join(buf))
+            buf = []
+            total = 0
+            if max_lines is not None and len(lines) >= max_lines:
+                return lines
+            continue
+
+        w = get(ch, default)
+        if scale * (total + w) <= wrap_width:
+            buf.append(ch)
+            total += w
+            continue
+
+        # ---- ここで折り返し ----
+        carry = [ch]
+        if kinsoku:
+            # 行頭禁則：句読点・閉じ括弧が行頭に来ないよう、前の行の字を一緒に送る
+            # （ぶら下げると wrap_width からはみ出すので追い出しにする）
+            while len(buf) > 1 and carry[0] in KINSOKU_NOT_AT_START:
+                carry.insert(0, buf.pop())
+            # 行末禁則：開き括弧は次の行へ送る
+            while len(buf) > 1 and buf[-1] in KINSOKU_NOT_AT_END:
+                carry.insert(0, buf.pop())
+
+        lines.append("".join(buf))
+        if max_lines is not None and len(lines) >= max_lines:
+            return lines
+        buf = carry
+        total = sum(get(c, default) for c in buf)
+
+    if buf and (max_lines is None or len(lines) < max_lines):
+        lines.append("".join(buf))
+
+    return lines
+
+
+# ------------------------------------------------------------------
+# 折り返し結果のキャッシュ（本文コーパスは有限なので、起動時に全部計算しておける）
+# ------------------------------------------------------------------
+class LineCache:
+    """
+    (フォント, サイズ, 幅, 最大行数, 禁則, テキスト) → 行の tuple
+    ・warm() で起動時にまとめて計算しておく
+    ・描画時は lines() で引くだけ（ヒットすれば幅の計測はゼロ）
+    ・名前入りになりうる文字列は store=False で呼ぶ（引くだけで、ミスしても追加しない）
+    """
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._lines = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lines(self, text, wrap_width, font_name, font_size, max_lines=None,
+              store=True, kinsoku=False):
+        key = (font_name, font_size, wrap_width, max_lines, kinsoku, text)
+        cached = self._lines.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        result = tuple(wrap_lines(text, wrap_width, font_name, font_size, max_lines, kinsoku))
+        if store and len(self._lines) < self.max_entries:
+            self._lines[key] = result
+        return result
+
+    def warm(self, texts, wrap_width, font_name, font_size, max_lines=None,
+             kinsoku=False):
+        """texts をすべて同じボックス設定で折り返してキャッシュに入れる"""
+        for text in texts:
+            key = (font_name, font_size, wrap_width, max_lines, kinsoku, text)
+            if key not in self._lines and len(self._lines) < self.max_entries:
+                self._lines[key] = tuple(
+                    wrap_lines(text, wrap_width, font_name, font_size, max_lines, kinsoku)
+                )
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._lines),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
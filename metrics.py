@@ -0,0 +1,396 @@
+"""
+Prometheus のテキスト形式で出すメトリクス（gunicorn の複数 worker をまたいで合算する）
+
+・各プロセスは METRICS_DIR/<種類>_<pid>.db を mmap して、値（double）をその場で書き換える
+  更新は dict 引き1回 + struct.pack_into 1回だけで、システムコールは発生しない
+・/metrics はどの worker が受けても、ディレクトリ内の全ファイルを読んで合算する
+・counter / histogram は終了した worker の分も残す（値が巻き戻らないように）
+  gauge は生きているプロセスの分だけ（終了した worker のファイルは読み飛ばす）
+・ファイルの中身：先頭 8 バイトが使用済みバイト数、そのあと
+  [キーの長さ u32][キー（JSON）][8 バイト境界までの詰め物][値 double] の繰り返し
+  追記は「本体を書いてから使用済みバイト数を更新」の順なので、読む側は途中の状態を見ない
+"""
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from bisect import bisect_left
+
+_INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct("<Q")
+_KEY_LEN = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+
+COUNTER_FILE = "counter"    # counter / histogram（合計する）
+GAUGE_FILE = "gauge"        # gauge（生きているプロセスの分だけ）
+
+
+class _ValueFile:
+    """1プロセス・1種類分の mmap ファイル"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self._fd).st_size
+        if size < _INITIAL_SIZE:
+            os.ftruncate(self._fd, _INITIAL_SIZE)
+            size = _INITIAL_SIZE
+        self._mm = mmap.mmap(self._fd, size)
+        self._used = _HEADER.unpack_from(self._mm, 0)[0] or _HEADER.size
+        self._offsets = {key: off for key, off, _ in _iter_entries(self._mm, self._used)}
+
+    def offset(self, key: str) -> int:
+        """キーの値の位置（なければ 0 で追加する）"""
+        off = self._offsets.get(key)
+        if off is None:
+            off = self._append(key)
+        return off
+
+    def _append(self, key: str) -> int:
+        data = key.encode("utf-8")
+        pad = -(_KEY_LEN.size + len(data)) % 8
+        need = _KEY_LEN.size + len(data) + pad + _VALUE.size
+        if self._used + need > len(self._mm):
+            size = len(self._mm)
+            while self._used + need > size:
+                size *= 2
+            self._mm.close()
+            os.ftruncate(self._fd, size)
+            self._mm = mmap.mmap(self._fd, size)
+
+        pos = self._used
+        _KEY_LEN.pack_into(self._mm, pos, len(data))
+        self._mm[pos + _KEY_LEN.size:pos + _KEY_LEN.size + len(data)] = data
+        off = pos + _KEY_LEN.size + len(data) + pad
+        _VALUE.pack_into(self._mm, off, 0.0)
+        self._used = off + _VALUE.size
+        _HEADER.pack_into(self._mm, 0, self._used)
+        self._offsets[key] = off
+        return off
+
+    def add(self, off: int, amount: float):
+        _VALUE.pack_into(self._mm, off, _VALUE.unpack_from(self._mm, off)[0] + amount)
+
+    def set(self, off: int, value: float):
+        _VALUE.pack_into(self._mm, off, value)
+
+    def close(self):
+        self._mm.close()
+        os.close(self._fd)
+
+
+def _iter_entries(buf, used: int):
+    pos = _HEADER.size
+    while pos < used:
+        (n,) = _KEY_LEN.unpack_from(buf, pos)
+        key = bytes(buf[pos + _KEY_LEN.size:pos + _KEY_LEN.size + n]).decode("utf-8")
+        off = pos + _KEY_LEN.size + n
+        off += -off % 8
+        yield key, off, _VALUE.unpack_from(buf, off)[0]
+        pos = off + _VALUE.size
+
+
+def _read_file(path: str):
+    """別プロセスのファイルを読む（mmap せずに read するだけ）"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < _HEADER.size:
+        return
+    used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+    yield from _iter_entries(data, used)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _format_value(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    if v == int(v) and abs(v) < 1e15:
+        return str(int(v))
+    return repr(v)
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels.items()) + "}"
+
+
+# ----------------------------------------------------------------------
+# メトリクスの種類
+# ----------------------------------------------------------------------
+class _Metric:
+    kind = ""
+    file_kind = COUNTER_FILE
+
+    def __init__(self, registry, name: str, help_text: str, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._keys = {}     # ラベル値の tuple → mmap 上の位置（プロセスごと）
+        registry.register(self)
+
+    def _reset(self):
+        self._keys = {}
+
+    def _key(self, suffix: str, labels: dict) -> str:
+        return json.dumps([self.name + suffix, labels], ensure_ascii=False, sort_keys=True)
+
+    def _labels(self, kwargs) -> tuple:
+        return tuple(str(kwargs[n]) for n in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        registry = self.registry
+        if not registry.enabled:
+            return
+        values = self._labels(labels)
+        with registry.lock:
+            f = registry.file(self.file_kind)
+            off = self._keys.get(values)
+            if off is None:
+                off = self._keys[values] = f.offset(
+                    self._key("_total", dict(zip(self.labelnames, values)))
+                )
+            f.add(off, amount)
+
+
+class Gauge(_Metric):
+    """
+    mode="sum"：生きているプロセスの値を合計する
+    mode="all"：プロセスごとに pid ラベルを付けてそのまま出す（RSS など）
+    """
+
+    kind = "gauge"
+    file_kind = GAUGE_FILE
+
+    def __init__(self, registry, name, help_text, labelnames=(), mode="sum"):
+        super().__init__(registry, name, help_text, labelnames)
+        self.mode = mode
+
+    def set(self, value: float, **labels):
+        registry = self.registry
+        if not registry.enabled:
+            return
+        values = self._labels(labels)
+        with registry.lock:
+            f = registry.file(self.file_kind)
+            off = self._keys.get(values)
+            if off is None:
+                off = self._keys[values] = f.offset(
+                    self._key("", dict(zip(self.labelnames, values)))
+                )
+            f.set(off, value)
+
+
+class Histogram(_Metric):
+    """バケットごとの件数（累積でない）・合計・件数を持ち、出力するときに累積にする"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=()):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(float(b) for b in buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        registry = self.registry
+        if not registry.enabled:
+            return
+        values = self._labels(labels)
+        with registry.lock:
+            f = registry.file(self.file_kind)
+            offs = self._keys.get(values)
+            if offs is None:
+                offs = self._keys[values] = self._offsets(f, values)
+            f.add(offs[bisect_left(self.buckets, value)], 1.0)
+            f.add(offs[-2], value)
+            f.add(offs[-1], 1.0)
+
+    def _offsets(self, f, values) -> tuple:
+        labels = dict(zip(self.labelnames, values))
+        offs = [
+            f.offset(self._key("_bucket", dict(labels, le=_format_value(b))))
+            for b in self.buckets
+        ]
+        offs.append(f.offset(self._key("_sum", labels)))
+        offs.append(f.offset(self._key("_count", labels)))
+        return tuple(offs)
+
+
+# ----------------------------------------------------------------------
+# レジストリ（ディレクトリ1つ = 1つの集計単位）
+# ----------------------------------------------------------------------
+class MetricsRegistry:
+    def __init__(self, directory):
+        """directory が None なら無効（記録も出力もしない）"""
+        self.directory = directory
+        self.enabled = directory is not None
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._files = {}
+        if self.enabled:
+            os.makedirs(directory, exist_ok=True)
+        # fork した子プロセスは自分の pid のファイルに書き直す
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, metric: _Metric):
+        self.metrics[metric.name] = metric
+
+    def counter(self, name, help_text, labelnames=()) -> Counter:
+        return Counter(self, name, help_text, labelnames)
+
+    def gauge(self, name, help_text, labelnames=(), mode="sum") -> Gauge:
+        return Gauge(self, name, help_text, labelnames, mode=mode)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=()) -> Histogram:
+        return Histogram(self, name, help_text, labelnames, buckets=buckets)
+
+    def file(self, kind: str) -> _ValueFile:
+        f = self._files.get(kind)
+        if f is None:
+            path = os.path.join(self.directory, f"{kind}_{os.getpid()}.db")
+            f = self._files[kind] = _ValueFile(path)
+        return f
+
+    def _after_fork(self):
+        # 親のロックが取られたまま fork されていても子で詰まらないように作り直す
+        self.lock = threading.Lock()
+        self._files = {}
+        for metric in self.metrics.values():
+            metric._reset()
+
+    def clear(self):
+        """前回起動時のファイルを消す（gunicorn の master で起動時に1回）"""
+        if not self.enabled:
+            return
+        with self.lock:
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+            for metric in self.metrics.values():
+                metric._reset()
+            for path in glob.glob(os.path.join(self.directory, "*.db")):
+                os.remove(path)
+
+    def mark_process_dead(self, pid: int):
+        """終了した worker の gauge を捨てる（counter / histogram は残す）"""
+        if not self.enabled:
+            return
+        try:
+            os.remove(os.path.join(self.directory, f"{GAUGE_FILE}_{pid}.db"))
+        except FileNotFoundError:
+            pass
+
+    # ------------------------------------------------------------------
+    # 出力
+    # ------------------------------------------------------------------
+    def collect(self) -> dict:
+        """全プロセス分を合算 → {(メトリクス名, 系列名, ラベルの tuple): 値}"""
+        totals = {}
+        for path in glob.glob(os.path.join(self.directory, "*.db")):
+            kind, _, pid = os.path.basename(path)[:-3].rpartition("_")
+            if not pid.isdigit():
+                continue
+            if kind == GAUGE_FILE and not _pid_alive(int(pid)):
+                continue
+            try:
+                entries = list(_read_file(path))
+            except (OSError, struct.error, UnicodeDecodeError, ValueError):
+                continue
+            for key, _, value in entries:
+                series, labels = json.loads(key)
+                metric = self._metric_of(series)
+                if metric is None:
+                    continue
+                if isinstance(metric, Gauge) and metric.mode == "all":
+                    labels = dict(labels, pid=pid)
+                ident = (metric.name, series, tuple(sorted(labels.items())))
+                totals[ident] = totals.get(ident, 0.0) + value
+        return totals
+
+    def _metric_of(self, series: str):
+        for suffix in ("", "_total", "_bucket", "_sum", "_count"):
+            if suffix and not series.endswith(suffix):
+                continue
+            metric = self.metrics.get(series[:len(series) - len(suffix)] if suffix else series)
+            if metric is not None:
+                return metric
+        return None
+
+    def render(self) -> str:
+        """Prometheus のテキスト形式（version 0.0.4）"""
+        by_metric = {}
+        for (name, series, labels), value in self.collect().items():
+            by_metric.setdefault(name, []).append((series, dict(labels), value))
+
+        lines = []
+        for name in sorted(by_metric):
+            metric = self.metrics[name]
+            # 0.0.4 形式では counter のファミリー名もサンプル名（_total 付き）に揃える
+            family = name + "_total" if isinstance(metric, Counter) else name
+            lines.append(f"# HELP {family} {metric.help}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            samples = by_metric[name]
+            if isinstance(metric, Histogram):
+                samples = self._cumulate(metric, samples)
+            else:
+                samples.sort(key=lambda s: (s[0], sorted(s[1].items())))
+            for series, labels, value in samples:
+                lines.append(f"{series}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _cumulate(metric: Histogram, samples) -> list:
+        """バケットを le の小さい順に累積する（ラベルの組ごと）"""
+        groups = {}
+        for series, labels, value in samples:
+            le = labels.pop("le", None)
+            group = groups.setdefault(tuple(sorted(labels.items())), {"buckets": {}})
+            if series.endswith("_bucket"):
+                group["buckets"][le] = value
+            else:
+                group[series] = value
+
+        out = []
+        for labelset in sorted(groups):
+            group = groups[labelset]
+            labels = dict(labelset)
+            running = 0.0
+            for b in metric.buckets:
+                le = _format_value(b)
+                running += group["buckets"].get(le, 0.0)
+                out.append((metric.name + "_bucket", dict(labels, le=le), running))
+            out.append((metric.name + "_sum", labels, group.get(metric.name + "_sum", 0.0)))
+            out.append((metric.name + "_count", labels, group.get(metric.name + "_count", 0.0)))
+        return out
+
+
+def read_rss_bytes() -> int:
+    """このプロセスの常駐メモリ（Linux の /proc/self/statm。取れなければ 0）"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * mmap.PAGESIZE
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
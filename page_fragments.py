@@ -0,0 +1,166 @@
+"""
+ページ単位の描画結果キャッシュ（名前の入らないページ用）
+
+・特徴キーが同じなら、そのページのコンテンツストリームは毎回まったく同じになる
+・1回目は普通に描画し、showPage の時点で描画命令・使ったフォント・画像を記録する
+・2回目以降は記録した命令列を新しい文書に差し込むだけ（折り返し・描画はしない）
+・フォントの内部名（/F1, /F2 …）は文書ごとに決まるので、差し込むときに必要なら付け替える
+・埋め込みフォント（/F3+0 のように subset 番号が付く）は、字のコードが文書をまたいで変わらない
+  subset（fonts.CorpusTTFont の fixed_subsets 未満）だけを使ったページしか記録しない
+・canvas の内部（_code / _formsinuse）を使うので、reportlab が未確認の版なら記録せず毎回描く（rl_compat）
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from reportlab.pdfbase import pdfmetrics
+
+import rl_compat
+
+_FONT_REF = re.compile(r"(/F\d+)(?:\+(\d+))? [-\d.]+ Tf")
+
+
+class PageFragment:
+    """1ページぶんの描画命令（プリアンブル以降、showPage 直前まで）"""
+
+    __slots__ = ("code", "fonts", "images")
+
+    def __init__(self, code: str, fonts: tuple, images: tuple):
+        self.code = code      # 命令列を "\n" でつないだ文字列
+        self.fonts = fonts    # ((フォント名, 記録時の内部名, 使った subset 番号の tuple), ...)
+        self.images = images  # ((filename, mask), ...)
+
+    @property
+    def size(self) -> int:
+        return len(self.code)
+
+    def splice(self, registry, c):
+        """文書 c の現在のページとして差し込み、ページを閉じる"""
+        doc = c._doc
+        rename = {}
+        for font_name, recorded, subsets in self.fonts:
+            if subsets:
+                # 埋め込みフォントは subset ごとに文書へ登録する（内部名は "/F3+0" の "/F3" 部分）
+                font = pdfmetrics.getFont(font_name)
+                for n in subsets:
+                    internal = font.getSubsetInternalName(n, doc).partition("+")[0]
+            else:
+                internal = doc.getInternalFontName(font_name)
+            if internal != recorded:
+                rename[recorded] = internal
+
+        for filename, mask in self.images:
+            registry.attach(c, filename, mask)
+
+        code = self.code
+        if rename:
+            code = _FONT_REF.sub(
+                lambda m: rename.get(m.group(1), m.group(1)) + m.group(0)[len(m.group(1)):],
+                code,
+            )
+        c._code.append(code)
+        c.showPage()
+
+
+class PageFragmentCache:
+    """
+    (ページ番号, 特徴キー) → PageFragment の LRU
+    draw() に描画関数を渡すと、ヒットすれば差し込み、ミスすれば描画しながら記録する
+    """
+
+    def __init__(self, registry, max_entries=2048):
+        self.registry = registry
+        self.max_entries = max_entries
+        self._fragments = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            frag = self._fragments.get(key)
+            if frag is None:
+                self.misses += 1
+                return None
+            self._fragments.move_to_end(key)
+            self.hits += 1
+            return frag
+
+    def put(self, key, frag: PageFragment):
+        with self._lock:
+            self._fragments[key] = frag
+            self._fragments.move_to_end(key)
+            while len(self._fragments) > self.max_entries:
+                self._fragments.popitem(last=False)
+
+    def draw(self, c, key, draw_fn, *args):
+        """
+        draw_fn(c, *args) は1ページを描いて showPage まで行う関数
+        key が None（特徴キーが作れない入力）のときはキャッシュを使わない
+        """
+        if key is None or self.max_entries <= 0 or not rl_compat.INTERNALS:
+            draw_fn(c, *args)
+            return
+
+        frag = self.get(key)
+        if frag is not None:
+            frag.splice(self.registry, c)
+            return
+
+        captured = []
+        prev = c._onPage
+
+        def capture(page_num):
+            # showPage の中から呼ばれる：この時点ではまだ _code / _formsinuse が残っている
+            captured.append(self._capture(c))
+            if prev:
+                prev(page_num)
+
+        c.setPageCallBack(capture)
+        try:
+            draw_fn(c, *args)
+        finally:
+            c.setPageCallBack(prev)
+
+        if len(captured) == 1 and captured[0] is not None:
+            self.put(key, captured[0])
+
+    def _capture(self, c):
+        # showPage が末尾に足す " " は差し込み時にもう一度足されるので除く
+        code = c._code[:-1] if c._code and c._code[-1] == " " else list(c._code)
+        code = "\n".join(code)
+
+        internal_to_font = {v: k for k, v in c._doc.fontMapping.items()}
+        used = {}
+        for m in _FONT_REF.finditer(code):
+            subsets = used.setdefault(m.group(1), set())
+            if m.group(2) is not None:
+                subsets.add(int(m.group(2)))
+        fonts = []
+        for internal, subsets in used.items():
+            font_name = internal_to_font.get(internal)
+            if font_name is None:
+                return None
+            if subsets and max(subsets) >= getattr(pdfmetrics.getFont(font_name), "fixed_subsets", 0):
+                # 文書ごとにコードが変わる字（名前など）を含むページは差し込めない
+                return None
+            fonts.append((font_name, internal, tuple(sorted(subsets))))
+
+        images = []
+        for form_name in dict.fromkeys(c._formsinuse):
+            source = self.registry.source_of(form_name)
+            if source is None:
+                # レジストリ経由でない画像が混ざっていたら記録しない
+                return None
+            images.append(source)
+
+        return PageFragment(code, tuple(fonts), tuple(images))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._fragments),
+                "bytes": sum(f.size for f in self._fragments.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
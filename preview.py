@@ -0,0 +1,185 @@
+"""
+購入前のプレビュー用サムネイル（PDF のページを小さな PNG にしたもの）
+
+・reportlab の canvas は通さず、Pillow で背景・画像・点・文字を直接重ねる
+・描く内容は「命令」のタプルで受け取る（座標は PDF と同じ pt・左下原点、scale 倍して描く）
+    ("image", filename, x, y, w, h)              … filename は register_image で登録した名前でもよい
+    ("dot", x, y, r, (r, g, b))                  … 色は 0〜1
+    ("text", x, y, text, size, (r, g, b), align) … align は "left" / "center"（y はベースライン）
+・ページは2層に分けてキャッシュする
+    layer：背景＋特徴キーだけで決まる命令（星盤・名前の入らない本文など）→ 特徴キーで LRU
+    PNG  ：layer に名前・日付・アイコン位置などを重ねて書き出したもの → (layer のキー, 残りの命令) で LRU
+・文字は Noto Sans JP の1書体だけで描く（明朝体の本文も。サムネイルの大きさでは読めないので形だけ）
+"""
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw, ImageFont
+
+DEFAULT_WIDTH = 240
+_ALIGN_ANCHOR = {"left": "ls", "center": "ms"}
+
+
+class _LRU:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+    def values(self):
+        with self._lock:
+            return list(self._items.values())
+
+
+class ThumbnailRenderer:
+    def __init__(self, assets_dir: str, page_size, font_path: str,
+                 width=DEFAULT_WIDTH, max_entries=512):
+        self.assets_dir = assets_dir
+        self.page_width, self.page_height = page_size
+        self.scale = width / self.page_width
+        self.size = (width, round(self.page_height * self.scale))
+        self.font_path = font_path
+        self._images = {}     # (filename, (w, h), mode) → 縮小済みの Image
+        self._sources = {}    # 名前 → (w, h) を受けて RGBA の Image を返す関数（ファイルの代わり）
+        self._fonts = {}      # px → FreeTypeFont
+        self._lock = threading.Lock()
+        self._layers = _LRU(max_entries)
+        self._pngs = _LRU(max_entries)
+
+    # ------------------------------------------------------------------
+    # 素材（プロセス内で1回だけ縮小・読み込み）
+    # ------------------------------------------------------------------
+    def register_image(self, name: str, factory):
+        """ファイルではなく factory((w, h)) → RGBA Image で作る素材（ベクターの星盤など）"""
+        self._sources[name] = factory
+
+    def _image(self, filename: str, size, mode="RGBA") -> Image.Image:
+        key = (filename, size, mode)
+        img = self._images.get(key)
+        if img is None:
+            with self._lock:
+                img = self._images.get(key)
+                if img is None and filename in self._sources:
+                    img = self._sources[filename](size).convert(mode)
+                    self._images[key] = img
+                if img is None:
+                    with Image.open(os.path.join(self.assets_dir, filename)) as src:
+                        img = src.convert(mode)
+                        if mode == "RGBA":
+                            # 縁が黒ずまないよう、事前乗算した状態で縮める
+                            img = img.convert("RGBa").resize(size, Image.LANCZOS).convert("RGBA")
+                        else:
+                            img = img.resize(size, Image.LANCZOS)
+                    self._images[key] = img
+        return img
+
+    def _font(self, px: float) -> ImageFont.FreeTypeFont:
+        px = round(px * 4) / 4      # 0.25px 刻み（同じ大きさのフォントを作り直さない）
+        font = self._fonts.get(px)
+        if font is None:
+            font = ImageFont.truetype(self.font_path, max(px, 1.0))
+            self._fonts[px] = font
+        return font
+
+    # ------------------------------------------------------------------
+    # 描画
+    # ------------------------------------------------------------------
+    def _xy(self, x, y):
+        return x * self.scale, (self.page_height - y) * self.scale
+
+    def _draw(self, img: Image.Image, ops):
+        draw = ImageDraw.Draw(img)
+        for op in ops:
+            kind = op[0]
+            if kind == "image":
+                _, filename, x, y, w, h = op
+                size = (max(1, round(w * self.scale)), max(1, round(h * self.scale)))
+                left, top = self._xy(x, y + h)
+                src = self._image(filename, size)
+                img.paste(src, (round(left), round(top)), src)
+            elif kind == "dot":
+                _, x, y, r, color = op
+                px, py = self._xy(x, y)
+                pr = r * self.scale
+                draw.ellipse((px - pr, py - pr, px + pr, py + pr), fill=_rgb(color))
+            elif kind == "text":
+                _, x, y, text, size, color, align = op
+                draw.text(self._xy(x, y), text, fill=_rgb(color),
+                          font=self._font(size * self.scale), anchor=_ALIGN_ANCHOR[align])
+            else:
+                raise ValueError(f"unknown preview op: {kind}")
+
+    def layer(self, key, background: str, ops) -> Image.Image:
+        """背景＋ops の層（key が None ならキャッシュしない）"""
+        img = self._layers.get(key) if key is not None else None
+        if img is None:
+            img = self._image(background, self.size, "RGB").copy()
+            self._draw(img, ops)
+            if key is not None:
+                self._layers.put(key, img)
+        return img
+
+    def render(self, layer_key, background: str, layer_ops, ops) -> bytes:
+        """PNG の bytes。ops は layer の上に毎回重ねる命令"""
+        key = (layer_key, tuple(ops)) if layer_key is not None else None
+        png = self._pngs.get(key) if key is not None else None
+        if png is not None:
+            return png
+
+        img = self.layer(layer_key, background, layer_ops)
+        if ops:
+            img = img.copy()
+            self._draw(img, ops)
+        buf = io.BytesIO()
+        # 減色すると数分の1のサイズになる（サムネイルなので 256 色で十分）
+        img.quantize(256, method=Image.Quantize.FASTOCTREE, dither=Image.Dither.NONE).save(
+            buf, "PNG", compress_level=6
+        )
+        png = buf.getvalue()
+        if key is not None:
+            self._pngs.put(key, png)
+        return png
+
+    def stats(self) -> dict:
+        return {
+            "width": self.size[0],
+            "height": self.size[1],
+            "layers": len(self._layers),
+            "layer_hits": self._layers.hits,
+            "layer_misses": self._layers.misses,
+            "pngs": len(self._pngs),
+            "png_bytes": sum(len(png) for png in self._pngs.values()),
+            "png_hits": self._pngs.hits,
+            "png_misses": self._pngs.misses,
+            "images": len(self._images),
+        }
+
+
+def _rgb(color) -> tuple:
+    return tuple(round(v * 255) for v in color)
@@ -0,0 +1,215 @@
+"""
+本番のリクエストをその場で cProfile にかける（管理者のヘッダー指定 or サンプリング）
+
+・X-Profile: <PROFILE_TOKEN> を付けたリクエスト、または PROFILE_SAMPLE_RATE の確率で選ばれた
+  リクエストだけ、generate_report のハンドラー全体を cProfile で計測する（送信中は含まない）
+・結果は PROFILE_DIR（既定はこのファイルの隣の profiles/）に <時刻>_<pid>_<キー先頭>.prof（pstats 形式）と
+  同名の .json（キー・特徴キー・結果・段階別時間）で保存し、新しい方から PROFILE_KEEP 件だけ残す
+  特徴キーは「太陽-月-金星-火星の元素-ASC グループ」を2人分 / でつないだもの（例 fire-water-earth-air-extro/…）
+・集計は CLI で：
+
+    python -m profiling top [--dir profiles] [-n 30] [--sort tottime|cumtime]
+                            [--outcome rendered] [--last 100] [--features fire-fire-]
+                            [--watch stringWidth,ImageReader,calc_ut]
+"""
+import argparse
+import cProfile
+import glob
+import hmac
+import json
+import os
+import pstats
+import random
+import sys
+import time
+
+HEADER = "X-Profile"
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+DEFAULT_KEEP = 200
+DEFAULT_TOP = 30
+DEFAULT_WATCH = ("stringWidth", "ImageReader", "calc_ut")
+
+
+class RequestProfiler:
+    def __init__(self, directory: str, keep=DEFAULT_KEEP, sample_rate=0.0, token=None):
+        """token が空ならヘッダーでの指定は受け付けない（サンプリングだけ）"""
+        self.directory = directory
+        self.keep = keep
+        self.sample_rate = sample_rate
+        self.token = token or None
+        self.enabled = bool(self.token) or sample_rate > 0
+        self.saved = 0
+        self.errors = 0
+
+    def authorized(self, header_value) -> bool:
+        """X-Profile の値がトークンと一致するか（トークン未設定なら常に False）"""
+        return bool(self.token and header_value) and hmac.compare_digest(
+            header_value.encode("utf-8"), self.token.encode("utf-8")
+        )
+
+    def trigger(self, header_value) -> str:
+        """このリクエストを計測するなら理由（"header" / "sample"）、しないなら None"""
+        if not self.enabled:
+            return None
+        if self.authorized(header_value):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sample"
+        return None
+
+    def save(self, profile: cProfile.Profile, meta: dict) -> str:
+        """.prof と .json を書いて古いものを消す → ファイル名の stem"""
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        stem = "{}{:03d}_{}_{}".format(
+            time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)),
+            int(now * 1000) % 1000,
+            os.getpid(),
+            (meta.get("key") or "nokey")[:16],
+        )
+        base = os.path.join(self.directory, stem)
+        try:
+            tmp = base + ".prof.tmp"
+            profile.dump_stats(tmp)
+            os.replace(tmp, base + ".prof")
+            with open(base + ".json.tmp", "w", encoding="utf-8") as f:
+                json.dump(dict(meta, profile=stem, created_at=now), f, ensure_ascii=False)
+            os.replace(base + ".json.tmp", base + ".json")
+            self.saved += 1
+            self._rotate()
+        except OSError:
+            self.errors += 1
+            return None
+        return stem
+
+    def _rotate(self):
+        # ファイル名は時刻順なので、名前順で古いものから消す
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.prof")))
+        for path in paths[:max(0, len(paths) - self.keep)]:
+            for p in (path, path[:-5] + ".json"):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "header": self.token is not None,
+            "sample_rate": self.sample_rate,
+            "saved": self.saved,
+            "errors": self.errors,
+            "keep": self.keep,
+            "dir": self.directory,
+        }
+
+
+# ----------------------------------------------------------------------
+# 集計 CLI
+# ----------------------------------------------------------------------
+def load_profiles(directory: str, outcome=None, last=None, features=None) -> list:
+    """[(.prof のパス, meta), ...]（古い順）。features は特徴キーの部分一致"""
+    out = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.prof"))):
+        try:
+            with open(path[:-5] + ".json", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {}
+        if outcome and meta.get("outcome") != outcome:
+            continue
+        if features and features not in (meta.get("features") or ""):
+            continue
+        out.append((path, meta))
+    if last:
+        out = out[-last:]
+    return out
+
+
+def _func_label(func) -> str:
+    filename, line, name = func
+    if filename == "~":
+        return name     # C の関数（{built-in method swisseph.calc_ut} など）
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def top_report(profiles: list, top=DEFAULT_TOP, sort="tottime", watch=DEFAULT_WATCH) -> str:
+    stats = pstats.Stats(profiles[0][0])
+    for path, _ in profiles[1:]:
+        stats.add(path)
+    table = stats.stats     # func → (cc, nc, tottime, cumtime, callers)
+    total = sum(v[2] for v in table.values()) or 1e-12
+    n = len(profiles)
+
+    lines = []
+    outcomes = {}
+    stages = {}
+    by_features = {}    # 特徴キー → [handle_ms, ...]
+    for _, meta in profiles:
+        outcomes[meta.get("outcome", "?")] = outcomes.get(meta.get("outcome", "?"), 0) + 1
+        for name, ms in (meta.get("stages_ms") or {}).items():
+            stages.setdefault(name, []).append(ms)
+        by_features.setdefault(meta.get("features") or "?", []).append(meta.get("handle_ms", 0.0))
+    lines.append(
+        f"profiles: {n}  profiled time: {total:.3f}s ({total / n * 1000:.1f} ms/request)  "
+        + "outcomes: " + ", ".join(f"{k} {v}" for k, v in sorted(outcomes.items()))
+    )
+    if stages:
+        lines.append("stage mean ms: " + ", ".join(
+            f"{name} {sum(v) / len(v):.2f}" for name, v in stages.items()
+        ))
+
+    # 特徴キーごとの件数と平均時間（件数の多い順に上位だけ）
+    lines.append("")
+    lines.append(f"{'count':>6}{'mean ms':>10}  features")
+    for features, ms in sorted(by_features.items(), key=lambda item: -len(item[1]))[:top]:
+        lines.append(f"{len(ms):>6}{sum(ms) / len(ms):>10.2f}  {features}")
+
+    # 気になる関数（名前の部分一致）の合計：cumtime は子の呼び出しも含む
+    if watch:
+        lines.append("")
+        lines.append(f"{'watch':<16}{'tottime':>10}{'cumtime':>10}{'share':>8}{'calls':>10}")
+        for word in watch:
+            hits = [v for func, v in table.items() if word in func[2]]
+            tt = sum(v[2] for v in hits)
+            # 同名の関数が入れ子で呼ばれると cumtime を足すと二重になるので、いちばん外側（最大）を使う
+            ct = max((v[3] for v in hits), default=0.0)
+            calls = sum(v[1] for v in hits)
+            lines.append(f"{word:<16}{tt:>10.3f}{ct:>10.3f}{ct / total:>8.1%}{calls:>10}")
+
+    key_index = {"tottime": 2, "cumtime": 3}[sort]
+    rows = sorted(table.items(), key=lambda item: item[1][key_index], reverse=True)[:top]
+    lines.append("")
+    lines.append(f"{'tottime':>9}{'share':>8}{'cumtime':>9}{'calls':>10}  function")
+    for func, (cc, nc, tt, ct, _) in rows:
+        lines.append(f"{tt:>9.3f}{tt / total:>8.1%}{ct:>9.3f}{nc:>10}  {_func_label(func)}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m profiling")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_top = sub.add_parser("top", help="保存済みのプロファイルを合算して上位の関数を出す")
+    p_top.add_argument("--dir", default=os.environ.get("PROFILE_DIR") or DEFAULT_DIR)
+    p_top.add_argument("-n", "--top", type=int, default=DEFAULT_TOP)
+    p_top.add_argument("--sort", default="tottime", choices=("tottime", "cumtime"))
+    p_top.add_argument("--outcome", help="rendered / hit / not_modified だけに絞る")
+    p_top.add_argument("--last", type=int, help="新しい方から N 件だけ")
+    p_top.add_argument("--features", help="特徴キーに含まれる文字列で絞る（例 fire-fire- や /water）")
+    p_top.add_argument("--watch", default=",".join(DEFAULT_WATCH),
+                       help="合計を出す関数名（部分一致、カンマ区切り）")
+
+    args = parser.parse_args(argv)
+    profiles = load_profiles(args.dir, outcome=args.outcome, last=args.last,
+                             features=args.features)
+    if not profiles:
+        print(f"no profiles in {args.dir}", file=sys.stderr)
+        return 1
+    watch = tuple(w for w in args.watch.split(",") if w)
+    print(top_report(profiles, top=args.top, sort=args.sort, watch=watch))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
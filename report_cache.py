@@ -0,0 +1,296 @@
+"""
+生成済み PDF のキャッシュ（内容アドレス方式）
+
+・キーは正規化したリクエストパラメータの sha256（= そのまま強い ETag に使う）
+・メモリ層：件数とバイト数で上限を決めた LRU
+・ディスク層：REPORT_CACHE_DIR が指定されたときだけ使う（worker 間で共有できる）
+  合計が disk_max_bytes を超えたら、更新時刻（読んだときにも更新する）の古い順に消して
+  上限の DISK_LOW_WATERMARK まで減らす（ディレクトリを見直すのは超えたときだけ）
+・open() / put_file() はファイルオブジェクトのまま扱う（ディスク層はメモリに読まずに返せる）
+  put_file() に fd のあるファイル（memfd・一時ファイル）を渡すと、メモリ層は中身をコピーせず
+  そのファイルを開いたまま持ち、open() のたびに /proc/self/fd から開き直して返す
+  （読み位置はリクエストごとに別・sendfile 可。/proc がない環境では bytes に読んで持つ）
+"""
+import hashlib
+import json
+import io
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+
+# ディスク層を掃除するときは上限のこの割合まで減らす（書くたびに掃除が走らないように）
+DISK_LOW_WATERMARK = 0.9
+
+
+def make_cache_key(params: dict, version: str) -> str:
+    """正規化済みパラメータ → sha256 の16進文字列"""
+    payload = json.dumps(
+        {"v": version, "params": params},
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _reopen(f):
+    """
+    f と同じ中身を、読み位置の独立した読み出し専用ファイルとして開く
+    memfd・削除済みの一時ファイルも /proc/self/fd 経由なら開ける（Linux）
+    """
+    return open(f"/proc/self/fd/{f.fileno()}", "rb")
+
+
+def _mem_close(data):
+    if not isinstance(data, bytes):
+        data.close()
+
+
+class ReportCache:
+    def __init__(self, max_items=64, max_bytes=64 * 1024 * 1024, disk_dir=None,
+                 disk_max_bytes=1024 * 1024 * 1024):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._disk_bytes = None     # 見積もり（最後に見直したときの合計＋このプロセスで書いた分）
+        self._disk_lock = threading.Lock()
+        self.disk_evictions = 0
+        self._mem = OrderedDict()   # key → (pdf bytes または開いたファイル, バイト数)（末尾ほど新しい）
+        self._mem_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # ディスク層
+    # ------------------------------------------------------------------
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.pdf")
+
+    def _disk_open(self, key: str):
+        path = self._disk_path(key)
+        f = open(path, "rb")
+        try:
+            os.utime(path)      # 読まれたものは消す順番を後ろに回す（mtime で LRU）
+        except OSError:
+            pass
+        return f
+
+    def _disk_get(self, key: str):
+        try:
+            with self._disk_open(key) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _disk_scan(self) -> list:
+        """[(mtime, size, path), ...]（書き込み途中の .tmp は数えない）"""
+        files = []
+        try:
+            subdirs = list(os.scandir(self.disk_dir))
+        except OSError:
+            return files
+        for sub in subdirs:
+            if not sub.is_dir(follow_symlinks=False):
+                continue
+            try:
+                entries = list(os.scandir(sub.path))
+            except OSError:
+                continue
+            for entry in entries:
+                if not entry.name.endswith(".pdf"):
+                    continue
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, entry.path))
+        return files
+
+    def _disk_evict(self):
+        """合計が上限を超えていたら古い順に消す（他の worker が書いた分も見直して数える）"""
+        files = self._disk_scan()
+        total = sum(size for _, size, _ in files)
+        if total > self.disk_max_bytes:
+            target = self.disk_max_bytes * DISK_LOW_WATERMARK
+            files.sort()
+            for _, size, path in files:
+                if total <= target:
+                    break
+                try:
+                    os.unlink(path)     # 送信中のファイルは開いた fd から最後まで読める
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue
+                else:
+                    self.disk_evictions += 1
+                total -= size
+        self._disk_bytes = total
+
+    def _disk_account(self, size: int):
+        if self.disk_max_bytes <= 0:     # 0 なら上限なし
+            return
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_evict()
+            self._disk_bytes += size
+            if self._disk_bytes > self.disk_max_bytes:
+                self._disk_evict()
+
+    def _disk_put(self, key: str, data):
+        """data は bytes または先頭に seek 済みのバイナリファイル"""
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            return
+        d = os.path.dirname(path)
+        os.makedirs(d, exist_ok=True)
+        # 書き込み途中のファイルを他の worker が読まないよう、一時ファイル → rename
+        fd, tmp = tempfile.mkstemp(dir=d, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+                size = f.tell()
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        self._disk_account(size)
+
+    # ------------------------------------------------------------------
+    # メモリ層
+    # ------------------------------------------------------------------
+    def _mem_put(self, key: str, data, size=None):
+        """data は bytes または開いたファイル（入らなかったファイルはここで閉じる）"""
+        if size is None:
+            size = len(data)
+        if size > self.max_bytes:
+            _mem_close(data)
+            return
+        old = self._mem.pop(key, None)
+        if old is not None:
+            self._mem_bytes -= old[1]
+            _mem_close(old[0])
+        self._mem[key] = (data, size)
+        self._mem_bytes += size
+        while self._mem and (
+            len(self._mem) > self.max_items or self._mem_bytes > self.max_bytes
+        ):
+            _, (evicted, evicted_size) = self._mem.popitem(last=False)
+            self._mem_bytes -= evicted_size
+            _mem_close(evicted)     # 送信中のリクエストは開き直した自分の fd で最後まで読める
+
+    def _mem_lookup(self, key: str):
+        """ロックを持って呼ぶ。あれば (data, size) で LRU の末尾に回す"""
+        entry = self._mem.get(key)
+        if entry is not None:
+            self._mem.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    # ------------------------------------------------------------------
+    # 公開 API
+    # ------------------------------------------------------------------
+    def get(self, key: str):
+        with self._lock:
+            entry = self._mem_lookup(key)
+            if entry is not None:
+                data, size = entry
+                if isinstance(data, bytes):
+                    return data
+                return os.pread(data.fileno(), size, 0)
+
+        if self.disk_dir:
+            data = self._disk_get(key)
+            if data is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._mem_put(key, data)
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, data: bytes):
+        with self._lock:
+            self._mem_put(key, data)
+        if self.disk_dir:
+            self._disk_put(key, data)
+
+    def open(self, key: str):
+        """
+        キャッシュにあれば読み出し用のファイルオブジェクトを返す
+        メモリ層 → 持っているファイルを開き直したもの（bytes で持っている分は BytesIO）、
+        ディスク層 → 開いたファイル（どちらも BytesIO 以外は sendfile 可）
+        """
+        with self._lock:
+            entry = self._mem_lookup(key)
+            if entry is not None:
+                data, size = entry
+                if isinstance(data, bytes):
+                    return io.BytesIO(data)
+                try:
+                    return _reopen(data)
+                except OSError:
+                    return io.BytesIO(os.pread(data.fileno(), size, 0))
+
+        if self.disk_dir:
+            try:
+                f = self._disk_open(key)
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                return f
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put_file(self, key: str, f):
+        """
+        ファイルに書き出した PDF を入れる（終わったら f は先頭に戻しておく）
+        f は呼び出し側が送信に使って閉じるので、メモリ層には別に開き直した方を持つ
+        """
+        size = f.seek(0, io.SEEK_END)
+        if self.max_items > 0 and size <= self.max_bytes:
+            try:
+                data = _reopen(f)
+            except (OSError, AttributeError, io.UnsupportedOperation):
+                # BytesIO、または /proc で開き直せない環境 → bytes で持つ
+                f.seek(0)
+                data = f.read()
+            with self._lock:
+                self._mem_put(key, data, size)
+        if self.disk_dir:
+            f.seek(0)
+            self._disk_put(key, f)
+        f.seek(0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._mem),
+                "files": sum(1 for data, _ in self._mem.values() if not isinstance(data, bytes)),
+                "bytes": self._mem_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "disk_bytes": self._disk_bytes,
+                "disk_evictions": self.disk_evictions,
+            }
@@ -0,0 +1,283 @@
+"""
+注文ファイルからの一括再出力（バックオフィス用・HTTP を通さない）
+
+    python -m reprint render orders.csv   [-o reprints] [--workers N] [--force]
+    python -m reprint render orders.jsonl [-o reprints] [--date 2024-01-01]
+
+・入力は CSV（1行目が見出し）か JSONL（1行1オブジェクト）。列は /api/generate_report の引数と同じ
+  （your_name / partner_name / date / your_dob / your_time / your_place / partner_dob / …）
+・parse_report_params で正規化し、レポートキャッシュと同じキーを名前にして <out>/<key>.pdf に書く
+  一時ファイルに書いてから置き換えるので、途中で止めても壊れた PDF は残らない
+  → もう一度同じコマンドを流せば、出力済みの注文は飛ばして続きから描く（--force で描き直す）
+  中身が同じ注文が何行あっても描くのは1回
+・date の列が空の行は今日の日付になる（キーも日ごとに変わる）。日をまたいで再開するなら --date で固定する
+・描画は app の render_report_pdf をプロセスプール（既定は CPU の数）で回す
+  親でウォームアップしてから fork するので、フォント・素材・星盤の表は各プロセスで読み直さない
+・実行中は stderr に進み具合と reports/s を出し、最後に段階ごとの mean / p50 / p99（ms）を出す
+・<out>/<注文ファイル名>.index.jsonl に入力の行番号 → キー・ファイル名・結果を書く（描けなかった行はエラーも）
+  1行でも失敗があれば終了コード 1
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from timing import StageTimer, percentile
+
+DEFAULT_OUT_DIR = "reprints"
+PROGRESS_INTERVAL = 0.5     # 秒（端末なら1行を書き換える）
+PROGRESS_LOG_INTERVAL = 10  # 秒（端末でなければ改行して追記）
+
+
+# ----------------------------------------------------------------------
+# 入力
+# ----------------------------------------------------------------------
+def read_orders(path: str, fmt=None):
+    """(行番号, dict または None, エラー) を入力の順に返す"""
+    if fmt is None:
+        fmt = "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+    # Excel で保存した CSV の BOM も読めるように utf-8-sig
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if fmt == "csv":
+            for i, row in enumerate(csv.DictReader(f), start=2):    # 1行目は見出し
+                yield i, {k.strip(): v for k, v in row.items() if k and v is not None}, None
+            return
+        for i, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError as e:
+                yield i, None, f"invalid JSON: {e}"
+                continue
+            if not isinstance(item, dict):
+                yield i, None, "line must be a JSON object"
+                continue
+            yield i, {k: str(v) for k, v in item.items() if v is not None}, None
+
+
+# ----------------------------------------------------------------------
+# worker（プロセスプールの中）
+# ----------------------------------------------------------------------
+def render_to_file(params: dict, path: str):
+    """PDF を path に書き、(バイト数, 段階ごとの ms) を返す"""
+    import app      # fork した子では親で読み込み済みのものがそのまま使われる
+
+    timer = StageTimer()
+    buffer = io.BytesIO()
+    app.render_report_pdf(params, buffer, timer=timer)
+    data = buffer.getbuffer()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    timer.lap("write")
+    os.replace(tmp, path)
+    stages = timer.as_ms()
+    stages["total"] = round(timer.total() * 1000.0, 3)
+    return len(data), stages
+
+
+# ----------------------------------------------------------------------
+# 進み具合
+# ----------------------------------------------------------------------
+class Progress:
+    def __init__(self, total: int, stream=sys.stderr):
+        self.total = total
+        self.stream = stream
+        self.tty = stream.isatty()
+        self.rendered = 0
+        self.skipped = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+        self._last_print = 0.0
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.start
+        return self.rendered / elapsed if elapsed > 0 else 0.0
+
+    def line(self) -> str:
+        done = self.rendered + self.skipped + self.failed
+        return (f"{done}/{self.total}  rendered {self.rendered}  skipped {self.skipped}  "
+                f"failed {self.failed}  {self.rate():.1f} reports/s")
+
+    def update(self, force=False):
+        now = time.perf_counter()
+        interval = PROGRESS_INTERVAL if self.tty else PROGRESS_LOG_INTERVAL
+        if not force and now - self._last_print < interval:
+            return
+        self._last_print = now
+        if self.tty:
+            self.stream.write("\r" + self.line() + "\033[K")
+        else:
+            self.stream.write(self.line() + "\n")
+        self.stream.flush()
+
+    def finish(self):
+        self.update(force=True)
+        if self.tty:
+            self.stream.write("\n")
+
+
+def summarize_stages(samples: list) -> dict:
+    """[{段階: ms}, ...] → {段階: {n, mean_ms, p50_ms, p99_ms}}（段階は最初に出た順）"""
+    by_stage = {}
+    for stages in samples:
+        for name, ms in stages.items():
+            by_stage.setdefault(name, []).append(ms)
+    out = {}
+    for name, values in by_stage.items():
+        values.sort()
+        out[name] = {
+            "n": len(values),
+            "mean_ms": round(statistics.fmean(values), 3),
+            "p50_ms": round(percentile(values, 50), 3),
+            "p99_ms": round(percentile(values, 99), 3),
+        }
+    return out
+
+
+def print_summary(progress: Progress, stage_summary: dict, pdf_bytes: list, stream=sys.stdout):
+    elapsed = time.perf_counter() - progress.start
+    print(f"rendered {progress.rendered}  skipped {progress.skipped}  failed {progress.failed}  "
+          f"in {elapsed:.1f}s  ({progress.rate():.1f} reports/s)", file=stream)
+    if pdf_bytes:
+        print(f"pdf bytes: mean {round(statistics.fmean(pdf_bytes))}  "
+              f"min {min(pdf_bytes)}  max {max(pdf_bytes)}", file=stream)
+    if not stage_summary:
+        return
+    print(f"{'stage':<16}{'mean':>10}{'p50':>10}{'p99':>10}", file=stream)
+    for name, st in stage_summary.items():
+        print(f"{name:<16}{st['mean_ms']:>10.3f}{st['p50_ms']:>10.3f}{st['p99_ms']:>10.3f}",
+              file=stream)
+
+
+# ----------------------------------------------------------------------
+# 本体
+# ----------------------------------------------------------------------
+def render_orders(orders_path: str, out_dir: str, workers: int, force=False,
+                  fmt=None, default_date=None) -> int:
+    # キャッシュの設定は import 前に決める（ディスク層・/metrics の mmap には触らない）
+    os.environ["REPORT_CACHE_DIR"] = ""
+    os.environ["METRICS"] = "0"
+    import app
+
+    os.makedirs(out_dir, exist_ok=True)
+
+    # 入力を先に全部正規化してキーを決める（不正な行は index にエラーとして残す）
+    entries = []
+    pending = {}    # key → params（同じ内容の注文は1回だけ描く）
+    rows = {}       # key → 描く対象の行数（進み具合は行単位で数える）
+    for row, item, error in read_orders(orders_path, fmt):
+        entry = {"row": row}
+        entries.append(entry)
+        if error:
+            entry.update(status="failed", error=error)
+            continue
+        if default_date and not (item.get("date") or "").strip():
+            item["date"] = default_date
+        try:
+            params = app.parse_report_params(item)
+        except Exception as e:
+            entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+            continue
+        key = app.report_cache_key(params)
+        entry.update(key=key, file=f"{key}.pdf",
+                     your_name=params["your_name"], partner_name=params["partner_name"])
+        if not force and os.path.exists(os.path.join(out_dir, entry["file"])):
+            entry["status"] = "skipped"
+        else:
+            pending.setdefault(key, params)
+            rows[key] = rows.get(key, 0) + 1
+
+    progress = Progress(len(entries))
+    progress.skipped = sum(1 for e in entries if e.get("status") == "skipped")
+    progress.failed = sum(1 for e in entries if e.get("status") == "failed")
+    results = {}    # key → "rendered" / エラー文字列
+    samples = []
+    pdf_bytes = []
+
+    if pending:
+        # フォント・素材・星盤の表を読み込んでから fork する（子プロセスで読み直さない）
+        state = app.warmup()
+        if state.get("error"):
+            print(f"warmup failed: {state['error']}", file=sys.stderr)
+        progress.start = time.perf_counter()
+
+        items = iter(pending.items())
+        max_in_flight = workers * 2
+        in_flight = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    nxt = next(items, None)
+                    if nxt is None:
+                        break
+                    key, params = nxt
+                    path = os.path.join(out_dir, f"{key}.pdf")
+                    in_flight[pool.submit(render_to_file, params, path)] = key
+                if not in_flight:
+                    break
+                done, _ = wait(in_flight, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    key = in_flight.pop(fut)
+                    try:
+                        size, stages = fut.result()
+                    except Exception as e:
+                        results[key] = f"{type(e).__name__}: {e}"
+                        progress.failed += rows[key]
+                        continue
+                    results[key] = "rendered"
+                    progress.rendered += rows[key]
+                    samples.append(stages)
+                    pdf_bytes.append(size)
+                progress.update()
+
+    for entry in entries:
+        if "status" in entry:
+            continue
+        result = results.get(entry["key"])
+        if result == "rendered":
+            entry["status"] = "rendered"
+        else:
+            entry.update(status="failed", error=result or "not rendered")
+    progress.finish()
+
+    stem = os.path.splitext(os.path.basename(orders_path))[0]
+    index_path = os.path.join(out_dir, f"{stem}.index.jsonl")
+    tmp = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    os.replace(tmp, index_path)
+
+    print_summary(progress, summarize_stages(samples), pdf_bytes)
+    for entry in entries:
+        if entry["status"] == "failed":
+            print(f"row {entry['row']}: {entry['error']}", file=sys.stderr)
+    print(f"index: {index_path}")
+    return 1 if progress.failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m reprint")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_render = sub.add_parser("render", help="注文ファイルの PDF を出力ディレクトリに描く（出力済みは飛ばす）")
+    p_render.add_argument("orders", help="CSV または JSONL")
+    p_render.add_argument("-o", "--out-dir", default=DEFAULT_OUT_DIR)
+    p_render.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p_render.add_argument("--format", choices=("csv", "jsonl"), help="既定は拡張子で判断")
+    p_render.add_argument("--date", help="date の列が空の行に使う日付 YYYY-MM-DD（既定は今日）")
+    p_render.add_argument("--force", action="store_true", help="出力済みの注文も描き直す")
+    args = parser.parse_args(argv)
+
+    return render_orders(args.orders, args.out_dir, max(1, args.workers),
+                         force=args.force, fmt=args.format, default_date=args.date)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
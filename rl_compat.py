@@ -0,0 +1,31 @@
+"""
+reportlab の非公開 API を使う高速化の可否
+
+・次の箇所は reportlab の内部（c._code / c._formsinuse / doc.idToObject / pdfdoc._digester /
+  PDFImageXObject._smask / TTFont.State / face.makeSubset の差し替え）に依存している
+    assets.py         エンコード済み XObject の登録・背景テンプレート
+    page_fragments.py ページ単位の描画キャッシュ
+    chart_wheel.py    ベクター星盤の Form XObject
+    fonts.py          CorpusTTFont（固定文言の subset の使い回し）
+・requirements.txt で固定した版（TESTED_VERSIONS）のときだけ使い、それ以外は公開 API の道
+  （canvas.drawImage・PNG の星盤・普通の TTFont・毎回描画）に戻す。出力は同じで遅くなるだけ
+・新しい版で動作を確かめたら TESTED_VERSIONS に足して requirements.txt の固定も上げる
+  確認のために一時的に有効 / 無効にするなら REPORTLAB_INTERNALS=1 / 0
+"""
+import os
+
+import reportlab
+
+TESTED_VERSIONS = ("5.0.1",)
+
+VERSION = reportlab.Version
+_override = os.environ.get("REPORTLAB_INTERNALS")
+INTERNALS = VERSION in TESTED_VERSIONS if _override is None else _override != "0"
+
+
+def status() -> dict:
+    return {
+        "reportlab": VERSION,
+        "tested": list(TESTED_VERSIONS),
+        "internals": INTERNALS,
+    }
@@ -0,0 +1,96 @@
+"""
+Tally の webhook ペイロード → レポート生成の入力（parse_report_params が受け取る形）
+
+Tally は {"eventId", "eventType", "data": {"responseId", "fields": [...]}} の形で送ってくる
+fields の各要素は {"key", "label", "type", "value", "options"?}
+・ラベル（または key）で対応づける。ラベルは TALLY_FIELDS（JSON）で上書きできる
+・選択式（DROPDOWN / MULTIPLE_CHOICE）は value が option の id なので、表示テキストに戻す
+"""
+import json
+import os
+
+# 入力名 → 対応する Tally のラベル / key（先に見つかったものを使う）
+DEFAULT_FIELD_LABELS = {
+    "your_name": ("your_name", "あなたのお名前", "あなたの名前", "お名前"),
+    "your_dob": ("your_dob", "あなたの生年月日", "生年月日"),
+    "your_time": ("your_time", "あなたの出生時間", "出生時間"),
+    "your_place": ("your_place", "あなたの出生地", "出生地"),
+    "partner_name": ("partner_name", "お相手のお名前", "お相手の名前", "パートナーのお名前"),
+    "partner_dob": ("partner_dob", "お相手の生年月日", "パートナーの生年月日"),
+    "partner_time": ("partner_time", "お相手の出生時間", "パートナーの出生時間"),
+    "partner_place": ("partner_place", "お相手の出生地", "パートナーの出生地"),
+}
+
+REQUIRED_FIELDS = ("your_name", "partner_name", "your_dob", "partner_dob")
+
+
+def load_field_labels() -> dict:
+    labels = dict(DEFAULT_FIELD_LABELS)
+    raw = os.environ.get("TALLY_FIELDS")
+    if raw:
+        for name, candidates in json.loads(raw).items():
+            if isinstance(candidates, str):
+                candidates = (candidates,)
+            labels[name] = tuple(candidates)
+    return labels
+
+
+def is_tally_payload(payload) -> bool:
+    return (
+        isinstance(payload, dict)
+        and isinstance(payload.get("data"), dict)
+        and isinstance(payload["data"].get("fields"), list)
+    )
+
+
+def _field_value(field: dict):
+    value = field.get("value")
+    options = field.get("options")
+    if options and isinstance(value, list):
+        text_of = {o.get("id"): o.get("text") for o in options if isinstance(o, dict)}
+        value = [text_of.get(v, v) for v in value]
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if value is None:
+        return None
+    return str(value).strip()
+
+
+def check_required(args: dict):
+    """必須項目（名前2つ・生年月日2つ）が欠けている・空なら ValueError"""
+    missing = [
+        name for name in REQUIRED_FIELDS
+        if not isinstance(args.get(name), str) or not args[name].strip()
+    ]
+    if missing:
+        raise ValueError(f"missing fields: {', '.join(missing)}")
+
+
+def tally_to_args(payload: dict, field_labels=None) -> tuple:
+    """
+    → (args dict, responseId)
+    必須項目（名前2つ・生年月日2つ）が欠けていたら ValueError
+    """
+    field_labels = field_labels or DEFAULT_FIELD_LABELS
+    data = payload["data"]
+
+    by_label = {}
+    for field in data["fields"]:
+        if not isinstance(field, dict):
+            continue
+        value = _field_value(field)
+        if not value:
+            continue
+        for name in (field.get("key"), field.get("label")):
+            if name:
+                by_label.setdefault(str(name).strip(), value)
+
+    args = {}
+    for name, candidates in field_labels.items():
+        for label in candidates:
+            if label in by_label:
+                args[name] = by_label[label]
+                break
+
+    check_required(args)
+    return args, data.get("responseId") or payload.get("eventId")
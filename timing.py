@@ -0,0 +1,83 @@
+"""
+リクエスト内の段階別タイマー（Server-Timing ヘッダーと構造化ログ用）
+
+・lap(name) を呼ぶたびに「前回の lap からの経過時間」をその段階の時間として記録する
+  （perf_counter を1回読むだけなので、本番で常時オンにしても負担にならない）
+・計測しないときは NULL_TIMER を渡せば、呼び出し側のコードはそのままでよい
+・percentile は集計側（bench / reprint）で共通に使う
+"""
+import json
+import logging
+import math
+import sys
+import time
+
+
+class StageTimer:
+    __slots__ = ("stages", "_start", "_last")
+
+    def __init__(self):
+        now = time.perf_counter()
+        self._start = now
+        self._last = now
+        self.stages = []    # [(name, 秒), ...]（記録順）
+
+    def lap(self, name: str):
+        now = time.perf_counter()
+        self.stages.append((name, now - self._last))
+        self._last = now
+
+    def total(self) -> float:
+        return self._last - self._start
+
+    def elapsed(self) -> float:
+        """最初からいままで（最後の lap 以降も含む）"""
+        return time.perf_counter() - self._start
+
+    def as_ms(self) -> dict:
+        out = {}
+        for name, sec in self.stages:
+            out[name] = round(out.get(name, 0.0) + sec * 1000.0, 3)
+        return out
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダーの値（name;dur=ミリ秒, ...）"""
+        parts = [f"{name};dur={ms:.2f}" for name, ms in self.as_ms().items()]
+        parts.append(f"total;dur={self.total() * 1000.0:.2f}")
+        return ", ".join(parts)
+
+
+class _NullTimer:
+    __slots__ = ()
+    stages = ()
+
+    def lap(self, name: str):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+def percentile(sorted_values, q: float) -> float:
+    """最近順位法（q は 0〜100）"""
+    if not sorted_values:
+        return 0.0
+    # 順位 = ceil(q / 100 * n)。q / 100 を先に計算すると 0.07 * 100 = 7.000…1 のような誤差で1つずれる
+    k = max(0, math.ceil(q * len(sorted_values) / 100.0) - 1)
+    return sorted_values[min(k, len(sorted_values) - 1)]
+
+
+def get_timing_logger(name="astro_report.timing") -> logging.Logger:
+    """1行1 JSON を stderr に出すロガー（gunicorn の error log にそのまま載る）"""
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+
+def log_json(logger: logging.Logger, record: dict):
+    logger.info(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
@@ -0,0 +1,102 @@
+"""
+出生地の現地時刻 → UT（過去のサマータイム・標準時の変更も反映）
+
+・pytz のタイムゾーンから遷移表（UTC の切り替え時刻とその後の UTC オフセット）を
+  1回だけ取り出して配列にしておき、変換は bisect 1回で済ませる
+・日本の 1948〜1951 年のサマータイム（JDT, UTC+10）もこの表に入っている
+・切り替え前後の現地時刻：
+    重複（時計を戻した直後の1時間など）→ fold=0 なら早い方（切り替え前のオフセット）
+    存在しない（時計を進めた間の時刻）→ 切り替え前のオフセットで換算（＝実質的に後ろへずれる）
+"""
+import datetime
+import functools
+from bisect import bisect_right
+from typing import NamedTuple
+
+import pytz
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+OK = "ok"
+AMBIGUOUS = "ambiguous"
+NONEXISTENT = "nonexistent"
+
+
+class Conversion(NamedTuple):
+    utc: datetime.datetime      # naive（UTC）
+    offset_seconds: int         # 使った UTC オフセット
+    status: str                 # ok / ambiguous / nonexistent
+
+
+def _seconds(dt: datetime.datetime) -> int:
+    delta = dt - _EPOCH
+    return delta.days * 86400 + delta.seconds
+
+
+class TransitionTable:
+    """
+    1つのタイムゾーンの遷移表
+    区間 i：UTC の [utc_starts[i], utc_starts[i+1]) はオフセット offsets[i]
+    現地時刻で見ると [utc_starts[i] + offsets[i], utc_starts[i+1] + offsets[i])
+    """
+
+    __slots__ = ("zone", "local_starts", "local_ends", "offsets")
+
+    def __init__(self, zone: str):
+        tz = pytz.timezone(zone)
+        times = getattr(tz, "_utc_transition_times", None)
+        infos = getattr(tz, "_transition_info", None)
+        if times:
+            utc_starts = [_seconds(t) for t in times]
+            offsets = [
+                info[0].days * 86400 + info[0].seconds for info in infos
+            ]
+        else:
+            # 固定オフセットのゾーン（UTC など）
+            off = tz.utcoffset(datetime.datetime(2000, 1, 1))
+            utc_starts = [_seconds(datetime.datetime(1, 1, 1))]
+            offsets = [off.days * 86400 + off.seconds]
+
+        self.zone = zone
+        self.offsets = offsets
+        self.local_starts = [t + o for t, o in zip(utc_starts, offsets)]
+        self.local_ends = [
+            t + o for t, o in zip(utc_starts[1:], offsets)
+        ] + [float("inf")]
+
+    def local_to_utc(self, local: datetime.datetime, fold: int = 0) -> Conversion:
+        """local は naive（その土地の壁時計の時刻）"""
+        sec = _seconds(local)
+        k = bisect_right(self.local_starts, sec) - 1
+        if k < 0:
+            k = 0
+
+        in_k = self.local_starts[k] <= sec < self.local_ends[k]
+        in_prev = k > 0 and sec < self.local_ends[k - 1]
+
+        if in_k and in_prev:
+            # 重複：fold=0 は早い方の瞬間（切り替え前の区間）
+            idx = k - 1 if fold == 0 else k
+            status = AMBIGUOUS
+        elif in_k:
+            idx = k
+            status = OK
+        elif in_prev:
+            idx = k - 1
+            status = OK
+        else:
+            # 飛ばされた時刻：切り替え前のオフセットで換算する
+            idx = k
+            status = NONEXISTENT
+
+        offset = self.offsets[idx]
+        return Conversion(local - datetime.timedelta(seconds=offset), offset, status)
+
+
+@functools.lru_cache(maxsize=None)
+def transition_table(zone: str) -> TransitionTable:
+    return TransitionTable(zone)
+
+
+def local_to_utc(zone: str, local: datetime.datetime, fold: int = 0) -> Conversion:
+    return transition_table(zone).local_to_utc(local, fold)